@@ -1,48 +1,98 @@
-import sys, os
+import sys, os, time
 from pathlib import Path
 
 # so that imports from src work
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 import streamlit as st
-from src.rag_pipeline import answer_query
+from src.registry import registry, CONFIG
+from src import telemetry
+
+# With RAG_SERVICE_URL set the app is a thin client of scripts/serve.py;
+# otherwise it loads the model and index in this process.
+if CONFIG["service_url"]:
+    from src.client import ServiceClient
+    # registered once so the client (and its HTTP session) survives Streamlit reruns
+    if not registry.is_loaded("service_client"):
+        registry.register("service_client", lambda: ServiceClient(CONFIG["service_url"]))
+    client = registry.get("service_client")
+else:
+    from src.rag_pipeline import answer_query_stream
+    from src.artifacts import artifact_path, first_row
+    client = None
+
+# RAG_TELEMETRY=1 RAG_METRICS_PORT=9464 exposes /metrics and /spans (one server per process)
+if CONFIG["telemetry"] and os.environ.get("RAG_METRICS_PORT") and client is None:
+    # Streamlit re-runs this script on every interaction: register (and bind the port) only once
+    if not registry.is_loaded("metrics_server"):
+        registry.register("metrics_server", lambda: telemetry.serve_metrics(port=int(os.environ["RAG_METRICS_PORT"])))
+        registry.get("metrics_server")
 
 st.set_page_config(page_title="PDF RAG QA System", layout="wide")
 st.title("📄 PDF RAG QA System")
 
 proc_root = Path("data/processed")
-folders = [p for p in sorted(proc_root.iterdir()) if p.is_dir() and (p / "pages.jsonl").exists()]
+if client is not None:
+    docs = {d["pdf_id"]: d.get("n_pages") for d in client.docs()}
+else:
+    docs = {}
+    for p in sorted(proc_root.iterdir()):
+        pages_path = artifact_path(p, "pages")
+        if p.is_dir() and os.path.exists(pages_path):
+            docs[p.name] = (first_row(pages_path) or {}).get("n_pages")
 
-if not folders:
+if not docs:
     st.warning("No processed PDFs found in data/processed. Run the indexing script first (scripts/build_index.py).")
     st.stop()
 
-choices = {f.name: f for f in folders}
-choice_name = st.selectbox("Choose a processed PDF", list(choices.keys()))
-selected_folder = choices[choice_name]
+choice_name = st.selectbox("Choose a processed PDF", list(docs.keys()))
+selected_folder = proc_root / choice_name
+n_pages = int(docs[choice_name] or 1)
 
 query = st.text_input("Ask a question about the selected PDF")
 top_k = st.slider("Number of snippets to retrieve (top-k)", min_value=1, max_value=5, value=3)
+page_range = None
+if n_pages > 1:
+    page_range = st.slider("Search only these pages", min_value=1, max_value=n_pages, value=(1, n_pages))
+    if page_range == (1, n_pages):
+        page_range = None  # whole document
 
 if st.button("Get Answer") and query.strip():
-    with st.spinner("Running retrieval + LLM..."):
+    t_asked = time.time()
+    with st.spinner("Retrieving..."):
         try:
-            answer, evidences, annotated_pdf_path = answer_query(selected_folder, query, top_k=top_k)
+            if client is not None:
+                tokens, evidences, pdf_future = client.answer_stream(choice_name, query, top_k=top_k,
+                                                                     page_range=page_range)
+            else:
+                tokens, evidences, pdf_future = answer_query_stream(selected_folder, query, top_k=top_k,
+                                                                    page_range=page_range)
         except Exception as e:
             st.error(f"Error: {e}")
             raise
 
+    # Tokens are rendered as they arrive; highlighting runs meanwhile
     st.subheader("✅ Answer")
-    st.write(answer)
+    answer = st.write_stream(tokens)
 
     st.subheader("📌 Top Evidence Snippets")
     for i, ev in enumerate(evidences, 1):
         snippet = (ev.get("snippet") or "").strip()
         st.markdown(f"**{i}. Page {ev.get('page', '?')}:** {snippet[:300]}...")
 
-    if annotated_pdf_path and os.path.exists(annotated_pdf_path):
+    try:
+        annotated_pdf_path = pdf_future.result()
+    except Exception as e:
+        st.error(f"Highlight failed: {e}")
+        annotated_pdf_path = None
+
+    pdf_bytes = None
+    if annotated_pdf_path and client is not None:
+        pdf_bytes = client.pdf_bytes(annotated_pdf_path)  # a /pdfs/ reference on the service
+    elif annotated_pdf_path and os.path.exists(annotated_pdf_path):
         with open(annotated_pdf_path, "rb") as f:
             pdf_bytes = f.read()
+    if pdf_bytes:
         st.download_button(
             label="⬇️ Download Highlighted PDF",
             data=pdf_bytes,
@@ -51,3 +101,9 @@ if st.button("Get Answer") and query.strip():
         )
     else:
         st.error("Annotated PDF not found (highlight failed).")
+
+    if CONFIG["telemetry"] and client is None:
+        with st.expander("⏱️ Where the time went"):
+            summary = telemetry.summarize(telemetry.recent_spans(since=t_asked))
+            st.table([{"span": name, "calls": v["count"], "seconds": round(v["total_s"], 3)}
+                      for name, v in summary.items()])
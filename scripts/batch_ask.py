@@ -0,0 +1,44 @@
+# scripts/batch_ask.py
+import sys, os, time, argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.rag_pipeline import answer_batch
+from src.utils import load_jsonl, save_jsonl
+
+
+def load_questions(path):
+    """
+    .jsonl -> rows with a "question" key (optional "pdf_id"),
+    anything else -> one question per non-empty line.
+    """
+    if path.lower().endswith(".jsonl"):
+        return [r for r in load_jsonl(path) if r.get("question")]
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Answer a file of questions in one batch")
+    ap.add_argument("questions", help="questions.txt (one per line) or questions.jsonl")
+    ap.add_argument("--out", default=os.path.join("outputs", "batch_answers.jsonl"))
+    ap.add_argument("--pdf-id", default=None, help="restrict retrieval to one processed PDF")
+    ap.add_argument("--top-k", type=int, default=3)
+    ap.add_argument("--model", default="llama3.2")
+    ap.add_argument("--concurrency", type=int, default=None)
+    args = ap.parse_args()
+
+    questions = load_questions(args.questions)
+    t0 = time.perf_counter()
+    rows = answer_batch(questions, top_k=args.top_k, model=args.model,
+                        pdf_id=args.pdf_id, concurrency=args.concurrency)
+    wall_s = time.perf_counter() - t0
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    save_jsonl(args.out, rows)
+    n_err = sum(1 for r in rows if "error" in r)
+    print(f"✅ {len(rows)} answers ({n_err} errors) in {wall_s:.1f}s "
+          f"({len(rows) / max(wall_s, 1e-9):.2f} q/s) → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,10 @@
 import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from src.chunk import make_chunks
 from src.embed_index import build_index
 from src.utils import ensure_dir
+from src.artifacts import artifact_path
 
 PROCESSED_DIR = "data/processed"
 DB_DIR = "data/index/chroma"
@@ -11,12 +13,17 @@ DB_DIR = "data/index/chroma"
 ensure_dir(DB_DIR)
 
 # Loop through all processed PDF folders
+# (for the full resumable ingest -> chunk -> index run use scripts/batch_pipeline.py)
 for folder in os.listdir(PROCESSED_DIR):
     folder_path = os.path.join(PROCESSED_DIR, folder)
-    jsonl_path = os.path.join(folder_path, "pages.jsonl")
-    
+    jsonl_path = artifact_path(folder_path, "pages")  # pages.jsonl or pages.rec
+    chunks_path = artifact_path(folder_path, "chunks")
+
     if os.path.exists(jsonl_path):
+        if not os.path.exists(chunks_path) or os.path.getmtime(chunks_path) < os.path.getmtime(jsonl_path):
+            print(f"✂️  Chunking PDF: {folder}")
+            chunks_path = make_chunks(jsonl_path, folder_path)
         print(f"📌 Indexing PDF: {folder}")
-        build_index(jsonl_path, pdf_id=folder)
+        build_index(chunks_path, pdf_id=folder)
 
-print("✅ All PDFs indexed successfully into Chroma DB!")
\ No newline at end of file
+print("✅ All PDFs indexed successfully into Chroma DB!")
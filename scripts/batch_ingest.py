@@ -1,16 +1,21 @@
 # scripts/batch_ingest.py
-import os
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
 from src.ingest import extract_pdf
 
 RAW_DIR = "data/raw_pdfs"
 PROCESSED_DIR = "data/processed"
+# Parallel OCR workers per PDF (0 = all cores, 1 = serial)
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "1"))
 
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 
 pdf_files = [f for f in os.listdir(RAW_DIR) if f.lower().endswith(".pdf")]
 
-for pdf in pdf_files:
-    pdf_path = os.path.join(RAW_DIR, pdf)
-    out_dir = os.path.join(PROCESSED_DIR, pdf.replace(".pdf", ""))
-    pages_jsonl = extract_pdf(pdf_path, out_dir)
-    print(f"✅ Processed: {pdf}, JSONL saved at {pages_jsonl}")
+if __name__ == "__main__":
+    for pdf in pdf_files:
+        pdf_path = os.path.join(RAW_DIR, pdf)
+        out_dir = os.path.join(PROCESSED_DIR, pdf.replace(".pdf", ""))
+        pages_jsonl = extract_pdf(pdf_path, out_dir, workers=INGEST_WORKERS)
+        print(f"✅ Processed: {pdf}, JSONL saved at {pages_jsonl}")
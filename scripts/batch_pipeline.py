@@ -0,0 +1,28 @@
+# scripts/batch_pipeline.py
+import sys, os, json, argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.batch import run_batch
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Ingest, chunk and index every PDF in a folder (resumable)")
+    ap.add_argument("--raw-dir", default="data/raw_pdfs")
+    ap.add_argument("--processed-dir", default="data/processed")
+    ap.add_argument("--workers", type=int, default=0, help="documents processed at once (0 = all cores)")
+    ap.add_argument("--page-workers", type=int, default=1, help="OCR workers inside each document")
+    ap.add_argument("--ocr-dpi", type=int, default=300)
+    ap.add_argument("--force", action="store_true", help="ignore the manifest and redo every stage")
+    ap.add_argument("--summary", default=None, help="write the throughput summary as JSON here")
+    args = ap.parse_args()
+
+    summary = run_batch(args.raw_dir, args.processed_dir, workers=args.workers,
+                        page_workers=args.page_workers, ocr_dpi=args.ocr_dpi, force=args.force)
+    if args.summary:
+        os.makedirs(os.path.dirname(args.summary) or ".", exist_ok=True)
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+# scripts/benchmark.py
+"""
+End-to-end benchmark on a synthetic PDF corpus.
+
+Generates native and scanned (image-only) PDFs with PyMuPDF, then times
+extract_pdf, make_chunks, build_index, query_index, highlight_pdf and
+answer_query (against the stub Ollama server) in an isolated work dir.
+Per stage it reports calls, items, throughput, p50/p95 latency, the RSS
+at the start of the stage and its peak while the stage ran (sampled from
+/proc on Linux), plus the process-lifetime peak RSS, and writes
+everything as JSON:
+
+    python scripts/benchmark.py --docs 4 --scanned 1 --pages 12 --queries 30
+    python scripts/benchmark.py --baseline outputs/benchmarks/bench_prev.json
+"""
+import sys, os, json, time, random, shutil, argparse, platform, subprocess, tempfile, threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import fitz  # PyMuPDF
+from src.registry import CONFIG, configure
+from src.ingest import extract_pdf
+from src.chunk import make_chunks
+from src.embed_index import build_index, query_index
+from src.highlight import highlight_pdf
+from src.rag_pipeline import answer_query
+from src.stub_ollama import start_stub_ollama
+from src.artifacts import iter_rows, count_rows
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+_WORDS = """
+policy program federal provincial community funding income health housing tax benefit
+report analysis budget service public private sector employment education research data
+model system network process review standard safety drug treatment patient clinical
+trial outcome risk evidence measure target growth market energy water transport region
+""".split()
+
+
+# -------------------------
+# Synthetic corpus
+# -------------------------
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 22))]
+    if rng.random() < 0.2:
+        words.insert(rng.randrange(len(words)), f"ID-{rng.randint(100, 999)}")
+    return " ".join(words).capitalize() + "."
+
+
+def _page_text(rng: random.Random, doc_no: int, page_no: int) -> str:
+    lines = [f"{page_no}. Section {doc_no}.{page_no} Overview"]
+    for _ in range(rng.randint(3, 5)):
+        lines.append(" ".join(_sentence(rng) for _ in range(rng.randint(3, 6))))
+    return "\n\n".join(lines)
+
+
+def make_pdf(path: str, n_pages: int, seed: int, scanned: bool = False, dpi: int = 150) -> str:
+    """One synthetic PDF; scanned=True stores every page as an image only."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for p in range(1, n_pages + 1):
+        page = doc.new_page(width=595, height=842)  # A4
+        page.insert_textbox(fitz.Rect(50, 50, 545, 800), _page_text(rng, seed, p), fontsize=10)
+    if scanned:
+        img_doc = fitz.open()
+        for page in doc:
+            pix = page.get_pixmap(dpi=dpi, alpha=False)
+            img_doc.new_page(width=page.rect.width, height=page.rect.height).insert_image(
+                page.rect, pixmap=pix)
+        doc.close()
+        doc = img_doc
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return path
+
+
+def make_corpus(raw_dir: str, n_docs: int, n_scanned: int, n_pages: int) -> list:
+    os.makedirs(raw_dir, exist_ok=True)
+    paths = []
+    for d in range(n_docs):
+        scanned = d < n_scanned
+        name = f"synthetic_{'scan' if scanned else 'native'}_{d:03d}.pdf"
+        paths.append(make_pdf(os.path.join(raw_dir, name), n_pages, seed=d + 1, scanned=scanned))
+    return paths
+
+
+def make_queries(chunks_paths: list, n: int, seed: int = 0) -> list:
+    """(pdf_id, question) pairs built from words of random chunks."""
+    rng = random.Random(seed)
+    pool = []
+    for pdf_id, path in chunks_paths:
+        pool.extend((pdf_id, c["text"]) for c in iter_rows(path))
+    out = []
+    for _ in range(n):
+        pdf_id, text = rng.choice(pool)
+        words = text.split()
+        start = rng.randrange(max(len(words) - 8, 1))
+        out.append((pdf_id, "What does the document say about " + " ".join(words[start:start + 8]) + "?"))
+    return out
+
+
+def tesseract_available() -> bool:
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+# -------------------------
+# Measurement
+# -------------------------
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_mb():
+    """Resident set size of this process right now, in MB (None where /proc is missing)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RSSSampler:
+    """Samples current_rss_mb() on a background thread between start() and stop()."""
+
+    def __init__(self, interval_s: float = 0.005):
+        self.interval_s = interval_s
+        self.start_mb = self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            self._sample()
+
+    def start(self):
+        self.start_mb = self.peak_mb = current_rss_mb()
+        if self.start_mb is not None:
+            self._thread = threading.Thread(target=self._loop, name="rss-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._sample()
+        return self
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process (and finished children) over its lifetime, in MB."""
+    if resource is None:
+        return None, None
+    scale = 1 / 1024 if sys.platform != "darwin" else 1 / (1024 * 1024)  # KB on Linux, bytes on macOS
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return round(own, 1), round(children, 1)
+
+
+def _percentile(sorted_vals: list, q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+class Stage:
+    """Collects per-call latencies and item counts for one pipeline stage."""
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.latencies = []
+        self.items = 0
+        self._rss = None  # sampled from the first run() until summary()
+
+    def run(self, fn, *args, items: int = 1, **kwargs):
+        if self._rss is None:
+            self._rss = RSSSampler().start()
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        self.latencies.append(time.perf_counter() - t0)
+        self.items += items
+        return out
+
+    def summary(self) -> dict:
+        lat = sorted(self.latencies)
+        total = sum(lat)
+        rss, rss_children = peak_rss_mb()
+        stage_rss = self._rss.stop() if self._rss else RSSSampler()
+        return {
+            "calls": len(lat),
+            "items": self.items,
+            "unit": self.unit,
+            "total_s": round(total, 4),
+            "throughput": round(self.items / total, 2) if total else None,
+            "p50_ms": round(_percentile(lat, 0.50) * 1000, 2),
+            "p95_ms": round(_percentile(lat, 0.95) * 1000, 2),
+            "max_ms": round(lat[-1] * 1000, 2) if lat else 0.0,
+            "rss_start_mb": round(stage_rss.start_mb, 1) if stage_rss.start_mb is not None else None,
+            "rss_peak_mb": round(stage_rss.peak_mb, 1) if stage_rss.peak_mb is not None else None,
+            # ru_maxrss: highest RSS since the process started, not specific to this stage
+            "process_peak_rss_mb": rss,
+            "process_peak_rss_children_mb": rss_children,
+        }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+# -------------------------
+# Benchmark
+# -------------------------
+def run_benchmark(work_dir: str, n_docs: int = 4, n_scanned: int = 1, n_pages: int = 12,
+                  n_queries: int = 30, top_k: int = 3, ingest_workers: int = 1,
+                  token_delay: float = 0.0) -> dict:
+    if n_scanned and not tesseract_available():
+        raise RuntimeError(f"tesseract not found but {n_scanned} scanned docs were requested; install it "
+                           "(or set TESSERACT_CMD) or pass --scanned 0")
+
+    raw_dir = os.path.join(work_dir, "raw_pdfs")
+    processed_dir = os.path.join(work_dir, "processed")
+    index_dir = os.path.join(work_dir, "index")
+
+    # keep every artifact inside work_dir, start from cold caches
+    server, url = start_stub_ollama(token_delay=token_delay)
+    configure(
+        chroma_dir=os.path.join(index_dir, "chroma"),
+        vector_dir=os.path.join(index_dir, "vectors"),
+        lexical_dir=os.path.join(index_dir, "lexical"),
+        embed_cache_path=os.path.join(index_dir, "embed_cache.sqlite3"),
+        query_cache_path=os.path.join(index_dir, "query_cache.sqlite3"),
+        ollama_host=url,
+    )
+
+    t0 = time.perf_counter()
+    pdfs = make_corpus(raw_dir, n_docs, n_scanned, n_pages)
+    print(f"📄 Generated {len(pdfs)} PDFs ({n_scanned} scanned, {n_pages} pages each) "
+          f"in {time.perf_counter() - t0:.1f}s")
+
+    stages = {
+        "extract_pdf": Stage("extract_pdf", "pages/s"),
+        "make_chunks": Stage("make_chunks", "chunks/s"),
+        "build_index": Stage("build_index", "chunks/s"),
+        "query_index": Stage("query_index", "queries/s"),
+        "highlight_pdf": Stage("highlight_pdf", "evidences/s"),
+        "answer_query": Stage("answer_query", "queries/s"),
+    }
+    report = {}
+
+    docs = []
+    for pdf_path in pdfs:
+        pdf_id = os.path.splitext(os.path.basename(pdf_path))[0]
+        out_dir = os.path.join(processed_dir, pdf_id)
+        os.makedirs(out_dir, exist_ok=True)
+        pages_jsonl = stages["extract_pdf"].run(extract_pdf, pdf_path, out_dir, workers=ingest_workers,
+                                                items=n_pages)
+        docs.append((pdf_id, pdf_path, out_dir, pages_jsonl))
+    report["extract_pdf"] = stages["extract_pdf"].summary()
+
+    chunks = []
+    for pdf_id, _, out_dir, pages_jsonl in docs:
+        st = stages["make_chunks"]
+        chunks_jsonl = st.run(make_chunks, pages_jsonl, out_dir, items=0)
+        st.items += count_rows(chunks_jsonl)
+        chunks.append((pdf_id, chunks_jsonl))
+    report["make_chunks"] = stages["make_chunks"].summary()
+
+    for pdf_id, chunks_jsonl in chunks:
+        stages["build_index"].run(build_index, chunks_jsonl, pdf_id, items=count_rows(chunks_jsonl))
+    report["build_index"] = stages["build_index"].summary()
+
+    queries = make_queries(chunks, n_queries)
+    retrieved = []
+    for pdf_id, q in queries:
+        res = stages["query_index"].run(query_index, q, top_k=top_k, pdf_id=pdf_id)
+        retrieved.append((pdf_id, res))
+    report["query_index"] = stages["query_index"].summary()
+
+    paths = {pdf_id: (pdf_path, pages_jsonl) for pdf_id, pdf_path, _, pages_jsonl in docs}
+    out_pdf = os.path.join(work_dir, "highlight_bench.pdf")
+    for pdf_id, res in retrieved:
+        evidences = [{"snippet": d, "page": int(m.get("page_start") or m.get("page") or 1),
+                      **({"spans": json.loads(m["spans"])} if m.get("spans") else {})}
+                     for d, m in zip(res["documents"][0], res["metadatas"][0])]
+        pdf_path, pages_jsonl = paths[pdf_id]
+        stages["highlight_pdf"].run(highlight_pdf, pdf_path, pages_jsonl, evidences, out_pdf,
+                                    items=len(evidences))
+    report["highlight_pdf"] = stages["highlight_pdf"].summary()
+
+    # answer_query writes annotated PDFs to ./outputs; keep them in work_dir
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        for pdf_id, q in queries:
+            stages["answer_query"].run(answer_query, os.path.join(processed_dir, pdf_id), q,
+                                       top_k=top_k, use_cache=False)
+    finally:
+        os.chdir(cwd)
+    report["answer_query"] = stages["answer_query"].summary()
+    server.shutdown()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": {"docs": n_docs, "scanned": n_scanned, "pages_per_doc": n_pages, "queries": n_queries},
+            "config": {k: CONFIG[k] for k in ("vector_backend", "faiss_index", "retrieval", "rerank",
+                                              "embed_model_name")},
+            "ingest_workers": ingest_workers,
+            "top_k": top_k,
+        },
+        "stages": report,
+    }
+
+
+def print_report(result: dict, baseline: dict = None) -> None:
+    base = (baseline or {}).get("stages", {})
+    print(f"{'stage':<14}{'calls':>6}{'throughput':>18}{'p50 ms':>10}{'p95 ms':>10}{'rss MB':>9}{'peak MB':>9}")
+    for name, s in result["stages"].items():
+        line = (f"{name:<14}{s['calls']:>6}{(s['throughput'] or 0):>10.1f} {s['unit']:<8}"
+                f"{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+                f"{(s.get('rss_start_mb') or 0):>9.0f}{(s.get('rss_peak_mb') or 0):>9.0f}")
+        b = base.get(name)
+        if b and b.get("p50_ms"):
+            line += f"   p50 x{s['p50_ms'] / b['p50_ms']:.2f} vs baseline"
+        print(line)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="End-to-end benchmark on a synthetic PDF corpus")
+    ap.add_argument("--docs", type=int, default=4)
+    ap.add_argument("--scanned", type=int, default=1, help="how many of the docs are image-only (OCR)")
+    ap.add_argument("--pages", type=int, default=12, help="pages per document")
+    ap.add_argument("--queries", type=int, default=30)
+    ap.add_argument("--top-k", type=int, default=3)
+    ap.add_argument("--ingest-workers", type=int, default=1)
+    ap.add_argument("--token-delay", type=float, default=0.0, help="stub LLM seconds per token")
+    ap.add_argument("--work-dir", default=None, help="keep artifacts here (default: temp dir, removed)")
+    ap.add_argument("--out", default=None, help="JSON result path (default outputs/benchmarks/bench_<ts>.json)")
+    ap.add_argument("--baseline", default=None, help="earlier result JSON to compare p50 against")
+    args = ap.parse_args()
+
+    work_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        result = run_benchmark(work_dir, n_docs=args.docs, n_scanned=args.scanned, n_pages=args.pages,
+                               n_queries=args.queries, top_k=args.top_k,
+                               ingest_workers=args.ingest_workers, token_delay=args.token_delay)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    out = args.out or os.path.join("outputs", "benchmarks", f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    print(f"✅ Benchmark written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,16 @@ from src.ingest import extract_pdf
 from src.chunk import make_chunks
 from src.embed_index import build_index
 
+# Parallel OCR workers (0 = all cores, 1 = serial)
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "1"))
+
 def main(pdf_path):
     base = os.path.splitext(os.path.basename(pdf_path))[0]
     out_dir = os.path.join("data", "processed", base)
     os.makedirs(out_dir, exist_ok=True)
 
     print("📥 Extracting PDF...")
-    pages_jsonl = extract_pdf(pdf_path, out_dir)
+    pages_jsonl = extract_pdf(pdf_path, out_dir, workers=INGEST_WORKERS)
 
     print("✂️  Chunking text...")
     chunks_jsonl = make_chunks(pages_jsonl, out_dir)
@@ -0,0 +1,33 @@
+# scripts/serve.py
+import sys, os, argparse, threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.registry import configure
+from src.service import start_server
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Query service: warm model and index behind an HTTP/JSON API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--processed-dir", default="data/processed")
+    ap.add_argument("--stub-llm", action="store_true", help="answer with the built-in stub Ollama (local tests)")
+    args = ap.parse_args()
+
+    if args.stub_llm:
+        from src.stub_ollama import start_stub_ollama
+        _, stub_url = start_stub_ollama()
+        configure(ollama_host=stub_url)
+        print(f"🧪 Stub LLM at {stub_url}")
+
+    print("⏳ Loading model and index...")
+    server, url = start_server(args.host, args.port, processed_root=args.processed_dir)
+    print(f"🚀 Query service listening on {url}  (RAG_SERVICE_URL={url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# src/artifacts.py
+"""
+Binary record files for pages and chunks (<out_dir>/pages.rec,
+chunks.rec), used instead of JSONL when CONFIG["artifact_format"] is
+"rec" (env RAG_ARTIFACT_FORMAT).
+
+File layout (little-endian):
+    b"RAGREC02"
+    records   <u32 length><payload> each; payload =
+                  <u32 n><row as JSON, OCR words left out>
+                  <u32 n_words><n_words x 4 float64 word boxes>
+                  <n_words x u32 UTF-8 length of each word><word texts, concatenated>
+    index     <u32 n><JSON list of record keys><u64 offset of each record>
+    footer    <u64 index offset> b"RAGREC02"
+
+Records are read from an mmap by position (RecordFile.row), so loading
+one page costs O(page) instead of parsing the whole file; the index also
+maps each record's key (page number for pages, chunk_id for chunks) for
+RecordFile.get. OCR words are a column of boxes and one text blob rather
+than a JSON object per word. Files written as b"RAGREC01" (word texts
+joined by "\\n") are still read.
+
+The readers below accept either format: iter_rows / count_rows /
+first_row dispatch on the extension, artifact_path() picks the newest
+file of a document, and export_jsonl() dumps a .rec file as JSONL for
+debugging.
+"""
+import os
+import json
+import mmap
+import struct
+import numpy as np
+from src.utils import iter_jsonl, save_jsonl, LRUCache
+from src.registry import CONFIG
+
+MAGIC = b"RAGREC02"
+MAGIC_V1 = b"RAGREC01"
+EXTENSIONS = {"jsonl": ".jsonl", "rec": ".rec"}
+# Key of each record in the index, by artifact name
+ROW_KEYS = {"pages": "page", "chunks": "chunk_id"}
+
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+
+
+# -------------------------
+# Encoding
+# -------------------------
+def _encode(row: dict) -> bytes:
+    words = []
+    ocr = row.get("ocr")
+    if isinstance(ocr, dict) and ocr.get("words"):
+        words = ocr["words"]
+        row = dict(row, ocr={k: v for k, v in ocr.items() if k != "words"})
+    head = json.dumps(row, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    boxes = np.array([w["bbox"] for w in words], dtype="<f8").reshape(len(words), 4)
+    texts = [w["text"].encode("utf-8") for w in words]
+    lengths = np.array([len(t) for t in texts], dtype="<u4")
+    return b"".join((_U32.pack(len(head)), head, _U32.pack(len(words)), boxes.tobytes(),
+                     lengths.tobytes(), *texts))
+
+
+def _word_texts(buf, pos: int, n_words: int, magic: bytes) -> list:
+    if magic == MAGIC_V1:
+        t_len = _U32.unpack_from(buf, pos)[0]
+        return buf[pos + 4:pos + 4 + t_len].decode("utf-8").split("\n") if n_words else []
+    ends = np.cumsum(np.frombuffer(buf, dtype="<u4", count=n_words, offset=pos), dtype=np.int64).tolist()
+    blob = buf[pos + 4 * n_words:pos + 4 * n_words + (ends[-1] if ends else 0)]
+    return [blob[s:e].decode("utf-8") for s, e in zip([0] + ends[:-1], ends)]
+
+
+def _decode(buf, words: bool = True, magic: bytes = MAGIC) -> dict:
+    n = _U32.unpack_from(buf, 0)[0]
+    row = json.loads(buf[4:4 + n].decode("utf-8"))
+    pos = 4 + n
+    n_words = _U32.unpack_from(buf, pos)[0]
+    pos += 4
+    if words and isinstance(row.get("ocr"), dict):
+        boxes = np.frombuffer(buf, dtype="<f8", count=n_words * 4, offset=pos).reshape(n_words, 4).tolist()
+        texts = _word_texts(buf, pos + n_words * 32, n_words, magic)
+        row["ocr"]["words"] = [{"text": t, "bbox": b} for t, b in zip(texts, boxes)]
+    return row
+
+
+# -------------------------
+# Writing
+# -------------------------
+def write_records(path: str, rows, key: str) -> str:
+    """Stream rows into a .rec file (temp file + rename), indexed by row[key]."""
+    tmp = path + ".tmp"
+    keys, offsets = [], []
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        for row in rows:
+            payload = _encode(row)
+            keys.append(row.get(key))
+            offsets.append(f.tell())
+            f.write(_U32.pack(len(payload)))
+            f.write(payload)
+        index_at = f.tell()
+        key_json = json.dumps(keys, ensure_ascii=False).encode("utf-8")
+        f.write(_U32.pack(len(key_json)))
+        f.write(key_json)
+        f.write(np.asarray(offsets, dtype="<u8").tobytes())
+        f.write(_U64.pack(index_at) + MAGIC)
+    _forget(path)  # release the cached mmap before replacing the file under it (Windows)
+    os.replace(tmp, path)
+    return path
+
+
+# -------------------------
+# Reading
+# -------------------------
+class RecordFile:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        self.magic = mm[:8]
+        if len(mm) < 24 or self.magic not in (MAGIC, MAGIC_V1) or mm[-8:] != self.magic:
+            mm.close()
+            raise ValueError(f"not a record file: {path}")
+        index_at = _U64.unpack_from(mm, len(mm) - 16)[0]
+        n = _U32.unpack_from(mm, index_at)[0]
+        self.keys = json.loads(mm[index_at + 4:index_at + 4 + n].decode("utf-8"))
+        at = index_at + 4 + n
+        # slicing an mmap copies: no buffer stays exported, so close() always works
+        self._offsets = np.frombuffer(mm[at:at + 8 * len(self.keys)], dtype="<u8")
+        self._pos = {k: i for i, k in enumerate(self.keys)}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def row(self, i: int, words: bool = True) -> dict:
+        """i-th record (0-based); words=False skips decoding OCR words."""
+        at = int(self._offsets[i])
+        n = _U32.unpack_from(self._mm, at)[0]
+        return _decode(self._mm[at + 4:at + 4 + n], words=words, magic=self.magic)
+
+    def get(self, key, words: bool = True):
+        """Record with the given key, or None."""
+        i = self._pos.get(key)
+        return None if i is None else self.row(i, words=words)
+
+    def __iter__(self):
+        for i in range(len(self.keys)):
+            yield self.row(i)
+
+    def close(self):
+        self._mm.close()
+
+
+_MAX_OPEN = 32
+_open = LRUCache(_MAX_OPEN)  # path -> ((mtime_ns, size), RecordFile)
+
+
+def _forget(path: str) -> None:
+    # drop the cached handle; its mmap closes once no reader holds it any more
+    _open.pop(os.path.abspath(path))
+
+
+def open_records(path: str) -> RecordFile:
+    """Cached RecordFile for path, reopened when the file changes."""
+    apath = os.path.abspath(path)
+    st = os.stat(apath)
+    version = (st.st_mtime_ns, st.st_size)
+    hit = _open.get(apath)
+    if hit and hit[0] == version:
+        return hit[1]
+    rf = RecordFile(apath)
+    _open.put(apath, (version, rf))
+    return rf
+
+
+# -------------------------
+# Either format
+# -------------------------
+def is_records(path: str) -> bool:
+    return str(path).endswith(EXTENSIONS["rec"])
+
+
+def artifact_path(out_dir: str, name: str, for_write: bool = False) -> str:
+    """
+    Path of a document's "pages" or "chunks" artifact. For writing, in
+    the configured format; for reading, the newest existing file of
+    either format (the configured one if neither exists).
+    """
+    configured = os.path.join(str(out_dir), name + EXTENSIONS[CONFIG["artifact_format"]])
+    if for_write:
+        return configured
+    existing = [p for p in (os.path.join(str(out_dir), name + ext) for ext in EXTENSIONS.values())
+                if os.path.exists(p)]
+    return max(existing, key=os.path.getmtime) if existing else configured
+
+
+def save_rows(path: str, rows) -> str:
+    """Write rows as JSONL or as a record file, by the extension of path."""
+    if is_records(path):
+        name = os.path.basename(path)[:-len(EXTENSIONS["rec"])]
+        return write_records(path, rows, ROW_KEYS.get(name, "id"))
+    return save_jsonl(path, rows)
+
+
+def iter_rows(path: str):
+    if is_records(path):
+        yield from open_records(path)
+    else:
+        yield from iter_jsonl(path)
+
+
+def count_rows(path: str) -> int:
+    if is_records(path):
+        return len(open_records(path))
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def first_row(path: str):
+    """First row without its OCR words (document-level fields), or None if empty."""
+    if is_records(path):
+        rf = open_records(path)
+        return rf.row(0, words=False) if len(rf) else None
+    with open(path, "r", encoding="utf-8") as f:
+        line = f.readline().strip()
+    return json.loads(line) if line else None
+
+
+def export_jsonl(path: str, out_path: str = None) -> str:
+    """Dump a .rec file as JSONL (default <path>.jsonl) for reading or diffing."""
+    return save_jsonl(out_path or path + ".jsonl", iter(open_records(path)))
@@ -0,0 +1,213 @@
+# src/batch.py
+"""
+Batch pipeline: ingest -> chunk -> index for many PDFs, resumable.
+
+Ingest and chunk run for several documents at once in a process pool;
+indexing runs in the main process as documents come back, so the
+embedding model and the vector store have a single owner.
+
+Per-document, per-stage state is kept in <processed_dir>/manifest.json:
+
+    {"version": 1, "docs": {pdf_id: {
+        "pdf_path": ..., "status": "done" | "failed" | "running", "error": ...,
+        "stages": {stage: {"input_sha1", "output", "output_sha1", "seconds", ...}}}}}
+
+A stage is skipped when its input checksum is unchanged and its output
+file still has the recorded checksum, so an interrupted run picks up
+where it stopped and a changed PDF re-runs only what depends on it.
+"""
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from src.ingest import extract_pdf
+from src.chunk import make_chunks
+from src.embed_index import build_index
+from src.registry import CONFIG
+from src.utils import file_hash
+from src.artifacts import count_rows
+
+MANIFEST_VERSION = 1
+STAGES = ("ingest", "chunk", "index")
+
+
+class Manifest:
+    def __init__(self, path: str):
+        self.path = path
+        self.data = {"version": MANIFEST_VERSION, "docs": {}}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.data = data
+
+    def doc(self, pdf_id: str) -> dict:
+        return self.data["docs"].setdefault(pdf_id, {"stages": {}})
+
+    def save(self) -> None:
+        """Write to a temp file and rename, so a crash never leaves a torn manifest."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=1, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+def stage_done(rec: dict, input_sha1: str) -> bool:
+    """True if a stage record matches its input and its output is intact."""
+    if not rec or rec.get("input_sha1") != input_sha1:
+        return False
+    out = rec.get("output")
+    if out is None:
+        return True
+    return os.path.exists(out) and file_hash(out) == rec.get("output_sha1")
+
+
+def _index_key(chunks_sha1: str) -> str:
+    # the index stage also depends on where and how vectors are stored
+    return f"{chunks_sha1}:{CONFIG['vector_backend']}:{CONFIG['embed_model_name']}"
+
+
+def _prepare_doc(pdf_path: str, out_dir: str, stages: dict, ocr_dpi: int, page_workers: int,
+                 reuse_pages: bool = True) -> dict:
+    """
+    Worker: run ingest and chunk for one PDF unless already done.
+    Returns the (possibly updated) stage records.
+    """
+    stages = dict(stages)
+    pdf_sha1 = file_hash(pdf_path)
+
+    if not stage_done(stages.get("ingest"), pdf_sha1):
+        t0 = time.perf_counter()
+        # unchanged pages of a modified PDF keep their rows and OCR (src/fingerprint.py)
+        pages_jsonl = extract_pdf(pdf_path, out_dir, ocr_dpi=ocr_dpi, workers=page_workers, reuse=reuse_pages)
+        stages["ingest"] = {"input_sha1": pdf_sha1, "output": pages_jsonl,
+                            "output_sha1": file_hash(pages_jsonl), "n_pages": count_rows(pages_jsonl),
+                            "seconds": round(time.perf_counter() - t0, 3)}
+        stages.pop("chunk", None)
+        stages.pop("index", None)
+
+    ingest = stages["ingest"]
+    if not stage_done(stages.get("chunk"), ingest["output_sha1"]):
+        t0 = time.perf_counter()
+        chunks_jsonl = make_chunks(ingest["output"], out_dir)
+        stages["chunk"] = {"input_sha1": ingest["output_sha1"], "output": chunks_jsonl,
+                           "output_sha1": file_hash(chunks_jsonl), "n_chunks": count_rows(chunks_jsonl),
+                           "seconds": round(time.perf_counter() - t0, 3)}
+        stages.pop("index", None)
+    return stages
+
+
+def _index_doc(pdf_id: str, stages: dict) -> dict:
+    chunk = stages["chunk"]
+    key = _index_key(chunk["output_sha1"])
+    if stage_done(stages.get("index"), key):
+        return stages
+    t0 = time.perf_counter()
+    build_index(chunk["output"], pdf_id)
+    stages = dict(stages)
+    stages["index"] = {"input_sha1": key, "output": None, "seconds": round(time.perf_counter() - t0, 3)}
+    return stages
+
+
+def find_pdfs(raw_dir: str) -> dict:
+    """{pdf_id: pdf_path} for every PDF in raw_dir, pdf_id = file name without .pdf."""
+    return {os.path.splitext(f)[0]: os.path.join(raw_dir, f)
+            for f in sorted(os.listdir(raw_dir)) if f.lower().endswith(".pdf")}
+
+
+def run_batch(raw_dir: str = "data/raw_pdfs", processed_dir: str = "data/processed",
+              workers: int = 0, page_workers: int = 1, ocr_dpi: int = 300, force: bool = False) -> dict:
+    """
+    Ingest, chunk and index every PDF in raw_dir; resume from the manifest.
+
+    workers is the number of documents processed at once (0 = all cores).
+    force=True ignores the manifest and the page fingerprints and redoes every stage.
+    Returns a summary with page/chunk counts and throughput.
+    """
+    workers = workers or os.cpu_count() or 1
+    manifest = Manifest(os.path.join(processed_dir, "manifest.json"))
+    pdfs = find_pdfs(raw_dir)
+
+    todo = {}
+    n_skipped = 0
+    for pdf_id, pdf_path in pdfs.items():
+        doc = manifest.doc(pdf_id)
+        if force:
+            doc["stages"] = {}
+        doc["pdf_path"] = os.path.abspath(pdf_path)
+        # cheap check first: untouched file and every stage intact -> nothing to do
+        st = doc["stages"]
+        if (doc.get("status") == "done" and not force
+                and stage_done(st.get("ingest"), file_hash(pdf_path))
+                and stage_done(st.get("chunk"), st["ingest"]["output_sha1"])
+                and stage_done(st.get("index"), _index_key(st["chunk"]["output_sha1"]))):
+            n_skipped += 1
+            continue
+        doc["status"] = "running"
+        todo[pdf_id] = pdf_path
+    manifest.save()
+
+    print(f"📚 {len(pdfs)} PDFs: {len(todo)} to process, {n_skipped} up to date "
+          f"({min(workers, max(len(todo), 1))} worker(s))")
+
+    t_start = time.perf_counter()
+    n_pages = n_chunks = n_failed = 0
+    stage_s = {s: 0.0 for s in STAGES}
+
+    def finish(pdf_id, stages, error=None):
+        nonlocal n_pages, n_chunks, n_failed
+        doc = manifest.doc(pdf_id)
+        doc["stages"] = stages
+        if error:
+            doc["status"], doc["error"] = "failed", error
+            n_failed += 1
+            print(f"❌ {pdf_id}: {error}")
+        else:
+            doc["status"] = "done"
+            doc.pop("error", None)
+            n_pages += stages["ingest"].get("n_pages", 0)
+            n_chunks += stages["chunk"].get("n_chunks", 0)
+        manifest.save()
+
+    with ProcessPoolExecutor(max_workers=min(workers, max(len(todo), 1))) as ex:
+        futures = {
+            ex.submit(_prepare_doc, pdf_path, os.path.join(processed_dir, pdf_id),
+                      manifest.doc(pdf_id)["stages"], ocr_dpi, page_workers, not force): pdf_id
+            for pdf_id, pdf_path in todo.items()
+        }
+        for fut in as_completed(futures):
+            pdf_id = futures[fut]
+            prev = manifest.doc(pdf_id)["stages"]
+            try:
+                stages = fut.result()
+            except Exception as e:
+                finish(pdf_id, prev, f"{type(e).__name__}: {e}")
+                continue
+            for s in ("ingest", "chunk"):
+                if stages[s] != prev.get(s):
+                    stage_s[s] += stages[s]["seconds"]
+            # record ingest/chunk before indexing so a crash here keeps them
+            manifest.doc(pdf_id)["stages"] = stages
+            manifest.save()
+            try:
+                indexed = _index_doc(pdf_id, stages)
+            except Exception as e:
+                finish(pdf_id, stages, f"{type(e).__name__}: {e}")
+                continue
+            if indexed.get("index") != stages.get("index"):
+                stage_s["index"] += indexed["index"]["seconds"]
+            finish(pdf_id, indexed)
+
+    wall_s = time.perf_counter() - t_start
+    summary = {
+        "docs": len(pdfs), "processed": len(todo) - n_failed, "skipped": n_skipped, "failed": n_failed,
+        "pages": n_pages, "chunks": n_chunks, "wall_s": round(wall_s, 3),
+        "pages_per_s": round(n_pages / max(wall_s, 1e-9), 2),
+        "chunks_per_s": round(n_chunks / max(wall_s, 1e-9), 2),
+        "stage_s": {s: round(v, 3) for s, v in stage_s.items()},
+    }
+    print(f"⏱️  {summary['processed']} docs, {n_pages} pages, {n_chunks} chunks in {wall_s:.1f}s "
+          f"({summary['pages_per_s']} pages/s, {summary['chunks_per_s']} chunks/s); "
+          f"{n_skipped} skipped, {n_failed} failed")
+    return summary
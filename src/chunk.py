@@ -1,45 +1,223 @@
 # src/chunk.py
-import os, json
-from src.utils import ensure_dir, save_jsonl, load_jsonl, clean_text, text_hash
-
-def _split_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200):
-    text = text.strip()
-    if not text:
-        return []
-    chunks = []
-    start = 0
-    L = len(text)
-    while start < L:
-        end = min(start + chunk_size, L)
-        chunk = text[start:end]
-        if end < L:
-            back = chunk.rfind(". ")
-            if back != -1 and back > len(chunk)//2:
-                end = start + back + 2
-                chunk = text[start:end]
-        chunks.append(chunk.strip())
-        start = max(end - chunk_overlap, end)
-    return chunks
-
-def make_chunks(pages_jsonl: str, out_dir: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> str:
-    ensure_dir(out_dir)
-    pages = load_jsonl(pages_jsonl)
-    rows = []
-    chunk_id = 0
+import re
+import warnings
+from src.utils import ensure_dir, clean_text, text_hash
+from src.context import CHARS_PER_TOKEN
+from src.artifacts import artifact_path, save_rows, iter_rows
+from src.registry import registry, CONFIG
+from src.telemetry import span, incr
+
+# all-MiniLM-L6-v2 reads at most 256 tokens including [CLS]/[SEP];
+# keep a small margin because per-sentence counts are summed.
+MAX_TOKENS = 250
+OVERLAP_TOKENS = 40
+# a heading only closes the current chunk once it holds this much text,
+# so title pages and runs of short lines do not become tiny chunks
+MIN_CHUNK_TOKENS = 50
+
+# sentence end: . ! ? followed by whitespace and an upper-case letter, digit or quote
+_SENT_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[A-Z0-9\"“‘(\[])")
+_NUMBERED = re.compile(r"^(\d+(\.\d+)*\.?|[a-z]\.|[ivxlc]+\.|[A-Z]\.)\s+\S")
+
+
+def _make_tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(CONFIG["embed_model_name"])
+
+
+registry.register("tokenizer", _make_tokenizer)
+
+
+def is_heading(line: str) -> bool:
+    """Short line without closing punctuation that looks like a title or numbered section."""
+    line = line.strip()
+    if not line or len(line) > 80 or len(line.split()) > 12:
+        return False
+    if line[-1] in ".,;:":
+        return False
+    if _NUMBERED.match(line) or line.isupper():
+        return True
+    words = [w for w in line.split() if w[0].isalpha()]
+    return bool(words) and sum(w[0].isupper() for w in words) >= max(1, int(0.6 * len(words)))
+
+
+def _page_units(page_text: str):
+    """
+    Split one page into units (start, end, is_heading) of character
+    offsets in page_text: heading lines, and sentences of the text between
+    them (sentences may wrap across lines).
+    """
+    units = []
+    block_start = None
+    pos = 0
+    for line in page_text.split("\n") + [None]:
+        heading = line is not None and is_heading(line)
+        if (line is None or heading) and block_start is not None:
+            block_end = pos - 1
+            s = block_start
+            for m in _SENT_END.finditer(page_text, block_start, block_end):
+                units.append((s, m.start() + 1, False))
+                s = m.end()
+            if s < block_end:
+                units.append((s, block_end, False))
+            block_start = None
+        if line is None:
+            break
+        if heading:
+            units.append((pos, pos + len(line), True))
+        elif block_start is None and line.strip():
+            block_start = pos
+        pos += len(line) + 1
+    return units
+
+
+def _split_long(tokenizer, text: str, start: int, max_tokens: int):
+    """Cut a unit longer than max_tokens into token windows; yields (start, end, n_tokens)."""
+    enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+    offsets = enc["offset_mapping"]
+    for i in range(0, len(offsets), max_tokens):
+        window = offsets[i:i + max_tokens]
+        yield start + window[0][0], start + window[-1][1], len(window)
+
+
+def iter_units(pages, max_tokens: int = MAX_TOKENS, tokenizer=None):
+    """
+    Yield units in reading order as dicts
+    {page, start, end, text, n_tokens, heading, is_scanned, pdf_path}.
+    Every unit fits in max_tokens.
+    """
+    tokenizer = tokenizer or registry.get("tokenizer")
     for p in pages:
-        txt = p.get("text", "") or ""
-        parts = _split_text(txt, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        for part in parts:
-            chunk_id += 1
-            rid = f"chunk_{chunk_id:06d}_{text_hash(part)}"
-            rows.append({
-                "chunk_id": rid,
-                "text": clean_text(part),
-                "pdf_path": p["pdf_path"],
-                "page_start": p["page"],
-                "page_end": p["page"],
-                "is_scanned": p["is_scanned"],
-            })
-    chunks_jsonl = os.path.join(out_dir, "chunks.jsonl")
-    save_jsonl(chunks_jsonl, rows)
-    return chunks_jsonl
+        page_text = p.get("text", "") or ""
+        spans = []
+        for s, e, heading in _page_units(page_text):
+            raw = page_text[s:e]
+            if raw.strip():
+                spans.append((s, e, heading))
+        if not spans:
+            continue
+        texts = [" ".join(page_text[s:e].split()) for s, e, _ in spans]
+        with span("chunk.tokenize", page=p["page"], units=len(texts)):
+            counts = [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+        for (s, e, heading), text, n in zip(spans, texts, counts):
+            parts = [(s, e, n)] if n <= max_tokens else list(_split_long(tokenizer, page_text[s:e], s, max_tokens))
+            for ps, pe, pn in parts:
+                yield {
+                    "page": p["page"],
+                    "start": ps,
+                    "end": pe,
+                    "text": text if len(parts) == 1 else " ".join(page_text[ps:pe].split()),
+                    "n_tokens": pn,
+                    "heading": heading,
+                    "is_scanned": p.get("is_scanned", False),
+                    "pdf_path": p["pdf_path"],
+                }
+
+
+def _chunk_row(chunk_no: int, units: list) -> dict:
+    parts = []
+    for i, u in enumerate(units):
+        if i:
+            # headings stay on their own line, sentences are joined with spaces
+            parts.append("\n" if u["heading"] or units[i - 1]["heading"] else " ")
+        parts.append(u["text"])
+    text = clean_text("".join(parts))
+    # [page, start, end] character range of the chunk in each page's text,
+    # mapped to word boxes by src/layout.py when highlighting
+    spans = {}
+    for u in units:
+        sp = spans.get(u["page"])
+        spans[u["page"]] = [u["page"], u["start"], u["end"]] if sp is None else \
+            [u["page"], min(sp[1], u["start"]), max(sp[2], u["end"])]
+    return {
+        "chunk_id": f"chunk_{chunk_no:06d}_{text_hash(text)}",
+        "text": text,
+        "pdf_path": units[0]["pdf_path"],
+        "page_start": units[0]["page"],
+        "page_end": units[-1]["page"],
+        "is_scanned": any(u["is_scanned"] for u in units),
+        "n_tokens": sum(u["n_tokens"] for u in units),
+        "spans": list(spans.values()),
+    }
+
+
+def _legacy_sizes(max_tokens: int, overlap_tokens: int, chunk_size: int, chunk_overlap: int):
+    """
+    Map the old character-based chunk_size / chunk_overlap keywords to
+    token budgets (CHARS_PER_TOKEN characters per token, at most
+    MAX_TOKENS), with a DeprecationWarning.
+    """
+    if chunk_size is None and chunk_overlap is None:
+        return max_tokens, overlap_tokens
+    warnings.warn("chunk_size / chunk_overlap (characters) are deprecated; use max_tokens / overlap_tokens",
+                  DeprecationWarning, stacklevel=3)
+    if chunk_size is not None:
+        max_tokens = min(MAX_TOKENS, max(1, chunk_size // CHARS_PER_TOKEN))
+    if chunk_overlap is not None:
+        overlap_tokens = chunk_overlap // CHARS_PER_TOKEN
+    return max_tokens, overlap_tokens
+
+
+def iter_chunks(pages, max_tokens: int = MAX_TOKENS, overlap_tokens: int = OVERLAP_TOKENS, tokenizer=None,
+                chunk_size: int = None, chunk_overlap: int = None):
+    """
+    Turn an iterable of page rows into chunk rows in one linear pass.
+
+    Sentences are packed until the next one would exceed max_tokens. A
+    heading starts a new chunk once the current one has body text of at
+    least MIN_CHUNK_TOKENS. The trailing sentences of a chunk,
+    up to overlap_tokens, are repeated at the start of the next chunk.
+    Chunks may run across page boundaries; page_start/page_end give the
+    covered range. chunk_size / chunk_overlap are deprecated character
+    based aliases (see _legacy_sizes).
+    """
+    max_tokens, overlap_tokens = _legacy_sizes(max_tokens, overlap_tokens, chunk_size, chunk_overlap)
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    chunk_no = 0
+    cur, cur_tokens = [], 0
+    n_fresh = 0  # units in cur that were not carried over from the previous chunk
+
+    for u in iter_units(pages, max_tokens=max_tokens, tokenizer=tokenizer):
+        section_break = (u["heading"] and cur and not cur[-1]["heading"]
+                         and cur_tokens >= min(MIN_CHUNK_TOKENS, max_tokens))
+        if cur and n_fresh and (section_break or cur_tokens + u["n_tokens"] > max_tokens):
+            chunk_no += 1
+            incr("chunk.chunks")
+            yield _chunk_row(chunk_no, cur)
+            if section_break:
+                cur, cur_tokens = [], 0
+            else:
+                # carry the tail of the chunk over as overlap
+                carry, carry_tokens = [], 0
+                for prev in reversed(cur):
+                    if prev["heading"] or carry_tokens + prev["n_tokens"] > overlap_tokens:
+                        break
+                    carry.insert(0, prev)
+                    carry_tokens += prev["n_tokens"]
+                while carry and carry_tokens + u["n_tokens"] > max_tokens:
+                    carry_tokens -= carry.pop(0)["n_tokens"]
+                cur, cur_tokens = carry, carry_tokens
+            n_fresh = 0
+        cur.append(u)
+        cur_tokens += u["n_tokens"]
+        n_fresh += 1
+
+    if cur and n_fresh:
+        chunk_no += 1
+        incr("chunk.chunks")
+        yield _chunk_row(chunk_no, cur)
+
+
+def make_chunks(pages_jsonl: str, out_dir: str, max_tokens: int = MAX_TOKENS,
+                overlap_tokens: int = OVERLAP_TOKENS, chunk_size: int = None, chunk_overlap: int = None) -> str:
+    """
+    Chunk a pages file (.jsonl or .rec) into out_dir/chunks.jsonl (or .rec); returns its path.
+    chunk_size / chunk_overlap (characters) are deprecated aliases of max_tokens / overlap_tokens.
+    """
+    max_tokens, overlap_tokens = _legacy_sizes(max_tokens, overlap_tokens, chunk_size, chunk_overlap)
+    ensure_dir(out_dir)
+    chunks_path = artifact_path(out_dir, "chunks", for_write=True)
+    pages = iter_rows(pages_jsonl)
+    with span("chunk.make_chunks", pages_jsonl=pages_jsonl):
+        save_rows(chunks_path, iter_chunks(pages, max_tokens=max_tokens, overlap_tokens=overlap_tokens))
+    return chunks_path
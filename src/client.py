@@ -0,0 +1,105 @@
+# src/client.py
+"""
+Thin client for the query service (src/service.py). Imports only
+requests, so the Streamlit app and the CLI start without loading the
+embedding model or the vector store.
+
+    client = ServiceClient("http://127.0.0.1:8765")
+    answer, evidences, pdf_ref = client.answer("my_doc", "What is ...?")
+    client.download_pdf(pdf_ref, "outputs/answer.pdf")
+"""
+import json
+import requests
+from concurrent.futures import Future
+
+
+class ServiceError(RuntimeError):
+    pass
+
+
+class ServiceClient:
+    def __init__(self, base_url: str, timeout: float = 300, connect_timeout: float = 5):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, timeout)
+        self.session = requests.Session()
+
+    def _get(self, path: str, **kwargs):
+        r = self.session.get(self.base_url + path, timeout=self.timeout, **kwargs)
+        self._check(r)
+        return r
+
+    def _post(self, path: str, payload: dict, **kwargs):
+        r = self.session.post(self.base_url + path, json=payload, timeout=self.timeout, **kwargs)
+        self._check(r)
+        return r
+
+    @staticmethod
+    def _check(r):
+        if r.status_code >= 400:
+            try:
+                message = r.json().get("error")
+            except ValueError:
+                message = r.text
+            raise ServiceError(f"{r.status_code}: {message}")
+
+    def health(self) -> dict:
+        return self._get("/health").json()
+
+    def docs(self) -> list:
+        """[{"pdf_id", "n_pages"}] for every processed document."""
+        return self._get("/docs").json()
+
+    def query(self, query: str, top_k: int = 5, pdf_id: str = None, page_range: tuple = None) -> dict:
+        """Retrieval results in the vector store format (ids, documents, metadatas, distances)."""
+        return self._post("/query", {"query": query, "top_k": top_k, "pdf_id": pdf_id,
+                                     "page_range": list(page_range) if page_range else None}).json()
+
+    @staticmethod
+    def _answer_payload(pdf_id, query, top_k, model, page_range, rerank, use_cache) -> dict:
+        return {"pdf_id": pdf_id, "query": query, "top_k": top_k, "model": model,
+                "page_range": list(page_range) if page_range else None,
+                "rerank": rerank, "use_cache": use_cache}
+
+    def answer(self, pdf_id: str, query: str, top_k: int = 3, model: str = "llama3.2",
+               page_range: tuple = None, rerank: bool = None, use_cache: bool = None):
+        """(answer, evidences, pdf_ref); fetch the annotated PDF with download_pdf(pdf_ref)."""
+        data = self._post("/answer", self._answer_payload(pdf_id, query, top_k, model, page_range,
+                                                         rerank, use_cache)).json()
+        return data["answer"], data["evidences"], data["pdf"]
+
+    def answer_stream(self, pdf_id: str, query: str, top_k: int = 3, model: str = "llama3.2",
+                      page_range: tuple = None, rerank: bool = None, use_cache: bool = None):
+        """
+        Same shape as rag_pipeline.answer_query_stream: (tokens, evidences,
+        pdf_future). pdf_future resolves to the PDF reference once all
+        tokens have been read.
+        """
+        r = self._post("/answer?stream=1", self._answer_payload(pdf_id, query, top_k, model, page_range,
+                                                               rerank, use_cache), stream=True)
+        lines = (json.loads(line) for line in r.iter_lines() if line)
+        first = next(lines)
+        pdf_future = Future()
+
+        def tokens():
+            with r:
+                for msg in lines:
+                    if "token" in msg:
+                        yield msg["token"]
+                    elif msg.get("done"):
+                        if msg.get("error"):
+                            pdf_future.set_exception(ServiceError(msg["error"]))
+                            raise ServiceError(msg["error"])
+                        pdf_future.set_result(msg.get("pdf"))
+                        return
+            if not pdf_future.done():
+                pdf_future.set_exception(ServiceError("stream ended early"))
+
+        return tokens(), first.get("evidences", []), pdf_future
+
+    def pdf_bytes(self, pdf_ref: str) -> bytes:
+        return self._get(pdf_ref).content
+
+    def download_pdf(self, pdf_ref: str, out_path: str) -> str:
+        with open(out_path, "wb") as f:
+            f.write(self.pdf_bytes(pdf_ref))
+        return out_path
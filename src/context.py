@@ -0,0 +1,175 @@
+# src/context.py
+"""
+Context assembly for the prompt: turn the retrieved chunks into the
+"Sources" section within a token budget.
+
+1. near-duplicate chunks (word 3-gram Jaccard >= DUP_JACCARD) are dropped;
+2. chunks that follow each other in the same document and start on the
+   same page are merged into one block, so the overlap the chunker
+   repeats between neighbours appears once;
+3. with selection on, a block keeps only the sentences that share a term
+   with the question. A block with no such sentence is kept whole, since
+   dense retrieval may have matched a paraphrase, but goes after every
+   block that has one;
+4. blocks are added best-ranked first until the per-model token budget is
+   spent; the last block is cut at a sentence boundary. A sentence that
+   an earlier block already used is skipped.
+
+Every block keeps the page label of its chunks, so [p.N] citations in the
+answer still point at the right page. Token counts are estimates
+(characters / CHARS_PER_TOKEN); the Ollama tokenizer is not available
+client side.
+"""
+import re
+from src.lexical import tokenize
+from src.registry import CONFIG
+from src.telemetry import span, incr
+
+CHARS_PER_TOKEN = 4
+# Context tokens per model family (name before ":"), leaving room in the
+# model's window for the instructions, the question and the answer
+MODEL_CONTEXT_TOKENS = {
+    "llama3.2": 1536,
+    "llama3.1": 3072,
+    "llama3": 3072,
+    "mistral": 3072,
+    "qwen2.5": 3072,
+    "gemma2": 3072,
+    "phi3": 1024,
+}
+DEFAULT_CONTEXT_TOKENS = 1024
+DUP_JACCARD = 0.8
+
+# sentence end (same rule as the chunker) or a line break
+_SENT_SPLIT = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[A-Z0-9\"“‘(\[])|\n+")
+_CHUNK_NO = re.compile(r"^chunk_(\d+)")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def context_budget(model: str = None) -> int:
+    """Context tokens for model: CONFIG["context_tokens"] if set, else the per-model table."""
+    if CONFIG["context_tokens"] > 0:
+        return CONFIG["context_tokens"]
+    family = (model or "").split(":")[0].lower()
+    return MODEL_CONTEXT_TOKENS.get(family, DEFAULT_CONTEXT_TOKENS)
+
+
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in _SENT_SPLIT.split(text or "") if s and s.strip()]
+
+
+def _page_label(meta: dict):
+    return meta.get("page") or meta.get("page_start") or "?"
+
+
+def _chunk_no(meta: dict):
+    m = _CHUNK_NO.match(str(meta.get("chunk_id", "")))
+    return int(m.group(1)) if m else None
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = text.lower().split()
+    return {tuple(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _dedupe(docs: list) -> list:
+    """Indexes of the chunks to keep, in rank order."""
+    kept, seen = [], []
+    for i, doc in enumerate(docs):
+        sh = _shingles(doc)
+        if any(_jaccard(sh, other) >= DUP_JACCARD for other in seen):
+            continue
+        kept.append(i)
+        seen.append(sh)
+    return kept
+
+
+def _merge_adjacent(keep: list, metas: list) -> list:
+    """
+    Group kept chunk indexes into blocks: chunks of the same document and
+    start page with consecutive chunk numbers end up in one block, in
+    reading order. Blocks are returned in rank order of their best chunk.
+    """
+    blocks = []
+    where = {}  # (pdf_id, page, chunk_no) -> block
+    for i in keep:
+        m = metas[i]
+        no = _chunk_no(m)
+        key = (m.get("pdf_id"), _page_label(m))
+        block = None
+        if no is not None:
+            block = where.get((*key, no - 1)) or where.get((*key, no + 1))
+        if block is None:
+            block = {"page": _page_label(m), "chunks": []}
+            blocks.append(block)
+        block["chunks"].append((no if no is not None else i, i))
+        if no is not None:
+            where[(*key, no)] = block
+    for b in blocks:
+        b["chunks"].sort()
+    return blocks
+
+
+def _select(sentences: list, query_terms: set) -> tuple:
+    """(sentences sharing a term with the question, True), or (all sentences, False) if none does."""
+    hits = [s for s in sentences if query_terms & set(tokenize(s))]
+    return (hits, True) if hits else (sentences, False)
+
+
+def assemble(query: str, docs: list, metas: list, model: str = None, budget: int = None,
+             select: bool = None) -> list:
+    """
+    [(page_label, text)] blocks for the prompt, best first, within the
+    token budget (default context_budget(model)). select (default
+    CONFIG["context_select"]) keeps only query-relevant sentences.
+    """
+    budget = context_budget(model) if budget is None else budget
+    select = CONFIG["context_select"] if select is None else select
+    query_terms = set(tokenize(query))
+    with span("context.assemble", chunks=len(docs), budget=budget) as sp:
+        keep = _dedupe(docs)
+        blocks = _merge_adjacent(keep, metas)
+
+        ranked = []
+        for b in blocks:
+            sentences = [s for _, i in b["chunks"] for s in split_sentences(docs[i])]
+            matched = True
+            if select and query_terms:
+                sentences, matched = _select(sentences, query_terms)
+            ranked.append((not matched, b["page"], sentences))
+        # stable: rank order within blocks with and without a query term
+        ranked.sort(key=lambda r: r[0])
+
+        out, used, seen = [], 0, set()
+        tokens_in = sum(estimate_tokens(d) for d in docs)
+        for _, page, sentences in ranked:
+            picked, cut = [], None
+            for s in sentences:
+                norm = " ".join(s.lower().split())
+                if norm in seen:  # overlap repeated by the next chunk
+                    continue
+                n = estimate_tokens(s) + 1
+                if used + n > budget:
+                    cut = s
+                    break
+                seen.add(norm)
+                picked.append(s)
+                used += n
+            if not picked and not out and cut is not None:
+                # a single sentence longer than the whole budget: cut it
+                picked, used = [cut[:budget * CHARS_PER_TOKEN]], budget
+            if picked:
+                out.append((page, " ".join(picked)))
+            if used >= budget or cut is not None:
+                break
+        sp.set(blocks=len(out), tokens_in=tokens_in, tokens_out=used)
+    incr("context.tokens_in", tokens_in)
+    incr("context.tokens_out", used)
+    return out
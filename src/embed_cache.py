@@ -0,0 +1,95 @@
+# src/embed_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace-insensitive form of a text used for cache keys."""
+    return " ".join((text or "").split())
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed embedding cache keyed by (model name, normalized text hash).
+
+    Vectors are stored as raw float32 bytes. Every hit refreshes the row's
+    last-used time, and once the table grows past max_entries the least
+    recently used rows are evicted.
+    """
+
+    def __init__(self, path: str, model_name: str, max_entries: int = 200_000):
+        self.path = path
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vec BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def key(self, text: str) -> str:
+        h = hashlib.sha1(f"{self.model_name}\0{normalize_text(text)}".encode("utf-8"))
+        return h.hexdigest()
+
+    def get_many(self, texts: list) -> list:
+        """Return one float32 vector (or None on miss) per input text."""
+        keys = [self.key(t) for t in texts]
+        found = {}
+        with self._lock:
+            # stay below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                part = keys[i:i+500]
+                q = f"SELECT key, dim, vec FROM embeddings WHERE key IN ({','.join('?' * len(part))})"
+                for k, dim, vec in self._conn.execute(q, part):
+                    found[k] = np.frombuffer(vec, dtype=np.float32, count=dim)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used=? WHERE key=?",
+                                       [(now, k) for k in found])
+                self._conn.commit()
+        return [found.get(k) for k in keys]
+
+    def put_many(self, texts: list, embs) -> None:
+        now = time.time()
+        rows = []
+        for t, e in zip(texts, embs):
+            v = np.ascontiguousarray(e, dtype=np.float32)
+            rows.append((self.key(t), int(v.shape[0]), v.tobytes(), now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings(key, dim, vec, last_used) VALUES (?, ?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        (n,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if n <= self.max_entries:
+            return
+        # drop a little more than needed so we don't evict on every insert
+        n_drop = n - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)", (n_drop,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
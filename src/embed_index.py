@@ -1,68 +1,355 @@
 # src/embed_index.py
 import os
-from sentence_transformers import SentenceTransformer
-import chromadb
-from src.utils import load_jsonl, ensure_dir
+import json
+import itertools
+import numpy as np
+from src.utils import batched, ensure_dir, text_hash
+from src.artifacts import iter_rows
+from src.embed_cache import EmbeddingCache
+from src.vector_store import ChromaStore, FlatStore, FaissStore, match_where
+from src.lexical import build_lexical_index, search_lexical, index_path
+from src.query_cache import get_query_cache
+from src.registry import registry, CONFIG
+from src.telemetry import span, incr, profile
 
 # -------------------------
-# Chroma DB Settings
+# Lazily created resources
 # -------------------------
-CHROMA_DIR = "data/index/chroma"
+# Nothing heavy happens at import time: the vector store, the
+# SentenceTransformer and the embedding cache are built on first use.
+# Paths, model names and the backend come from src.registry.CONFIG.
 
-# Initialize Chroma persistent client
-client = chromadb.PersistentClient(path=CHROMA_DIR)
-collection = client.get_or_create_collection(name="pdf_chunks")
+def _make_chroma_client():
+    import chromadb
+    ensure_dir(CONFIG["chroma_dir"])
+    return chromadb.PersistentClient(path=CONFIG["chroma_dir"])
+
+
+def _make_collection():
+    return registry.get("chroma_client").get_or_create_collection(name=CONFIG["collection_name"])
+
+
+def _make_vector_store():
+    backend = CONFIG["vector_backend"]
+    if backend == "chroma":
+        return ChromaStore(registry.get("collection"))
+    if backend == "numpy":
+        return FlatStore(os.path.join(CONFIG["vector_dir"], "numpy"),
+                         dtype=CONFIG["vector_dtype"], rescore=CONFIG["vector_rescore"])
+    if backend == "faiss":
+        return FaissStore(os.path.join(CONFIG["vector_dir"], f"faiss_{CONFIG['faiss_index']}"),
+                          index_type=CONFIG["faiss_index"], nlist=CONFIG["faiss_nlist"],
+                          pq_m=CONFIG["faiss_pq_m"], nprobe=CONFIG["faiss_nprobe"])
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+
+def _make_embed_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(CONFIG["embed_model_name"])
+
+
+def _make_embed_cache():
+    return EmbeddingCache(CONFIG["embed_cache_path"], CONFIG["embed_model_name"],
+                          max_entries=CONFIG["embed_cache_max_entries"])
+
+
+registry.register("chroma_client", _make_chroma_client)
+registry.register("collection", _make_collection)
+registry.register("vector_store", _make_vector_store)
+registry.register("embed_model", _make_embed_model)
+registry.register("embed_cache", _make_embed_cache)
+
+
+def get_collection():
+    return registry.get("collection")
+
+
+def get_store():
+    return registry.get("vector_store")
+
+
+def get_embed_model():
+    return registry.get("embed_model")
 
-# -------------------------
-# Sentence Transformer model
-# -------------------------
-EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-embed_model = SentenceTransformer(EMBED_MODEL_NAME)
+
+def get_embed_cache():
+    return registry.get("embed_cache")
+
+
+def encode_texts(texts: list, batch_size: int = 64) -> np.ndarray:
+    """
+    Normalized embeddings for texts, shape (len(texts), dim).
+    Cached vectors are reused; only misses go through the model.
+    """
+    if not texts:
+        return np.zeros((0, get_embed_model().get_sentence_embedding_dimension()), dtype=np.float32)
+
+    with span("embed.encode", n=len(texts)) as sp:
+        embed_cache = get_embed_cache()
+        cached = embed_cache.get_many(texts)
+        missing = list(dict.fromkeys(t for t, e in zip(texts, cached) if e is None))
+        sp.set(misses=len(missing))
+        incr("embed_cache.hits", len(texts) - len(missing))
+        incr("embed_cache.misses", len(missing))
+
+        if missing:
+            with span("embed.model", n=len(missing)):
+                fresh = get_embed_model().encode(missing, batch_size=batch_size,
+                                                 convert_to_numpy=True, normalize_embeddings=True)
+            embed_cache.put_many(missing, fresh)
+            by_text = dict(zip(missing, fresh))
+            cached = [e if e is not None else by_text[t] for t, e in zip(texts, cached)]
+
+        return np.vstack(cached).astype(np.float32, copy=False)
 
 # -------------------------
 # Build index from JSONL
 # -------------------------
-def build_index(chunks_jsonl: str, pdf_id: str):
-    """
-    Build embeddings for each page/chunk and add to Chroma collection.
-    Compatible with pages.jsonl from ingest.py
-    """
-    ensure_dir(CHROMA_DIR)
-    chunks = load_jsonl(chunks_jsonl)
-
-    texts = [c.get("text", "") for c in chunks]
-    ids = [f"{pdf_id}_{i}" for i in range(len(texts))]
-    
-    # Fix missing keys: use 'page' if 'page_start' not available, 'chunk_id' default 0
-    metas = [
-        {
-            "page": c.get("page", 1),
-            "chunk_id": c.get("chunk_id", 0),
-            "pdf_path": c.get("pdf_path", "")
-        } 
-        for c in chunks
-    ]
-
-    # Encode in batches to save memory
-    batch_size = 64
-    embs = []
-    for i in range(0, len(texts), batch_size):
-        batch_texts = texts[i:i+batch_size]
-        batch_embs = embed_model.encode(batch_texts, convert_to_numpy=True, normalize_embeddings=True)
-        embs.extend(batch_embs.tolist())
-
-    # Add to Chroma collection
-    collection.add(ids=ids, documents=texts, metadatas=metas, embeddings=embs)
-    print(f"✅ Indexed {len(texts)} pages/chunks into Chroma at {CHROMA_DIR}")
+# Bump when the stored metadata layout changes: every id changes with it,
+# so the next incremental build rewrites all records (embeddings come
+# from the cache, so this is cheap).
+INDEX_SCHEMA = 3
+
+
+def chunk_record_id(pdf_id: str, chunk: dict) -> str:
+    """
+    Content-addressed id for a chunk: same text on the same pages of the
+    same document always maps to the same id, so re-runs can diff by id.
+    """
+    page_start = chunk.get("page_start", chunk.get("page", 1))
+    page_end = chunk.get("page_end", page_start)
+    key = f"v{INDEX_SCHEMA}:{page_start}:{page_end}:" + chunk.get("text", "")
+    return f"{pdf_id}_{text_hash(key)}"
+
+
+def _existing_ids(pdf_id: str, pdf_path: str = "") -> set:
+    """
+    Ids already stored for this document. Records written before ids were
+    content-addressed have no pdf_id metadata, so also match on pdf_path.
+    """
+    store = get_store()
+    ids = store.ids_where({"pdf_id": pdf_id})
+    if pdf_path:
+        ids.update(store.ids_where({"pdf_path": pdf_path}))
+    return ids
+
+
+def _chunk_meta(pdf_id: str, c: dict) -> dict:
+    # Fix missing keys: use 'page_start' if 'page' not available, 'chunk_id' default 0
+    page_start = int(c.get("page_start", c.get("page", 1)))
+    page_end = int(c.get("page_end", page_start))
+    meta = {
+        "page": int(c.get("page", page_start)),
+        "page_start": page_start,
+        "page_end": page_end,
+        "chunk_id": c.get("chunk_id", 0),
+        "pdf_path": c.get("pdf_path", ""),
+        "pdf_id": pdf_id,
+    }
+    if c.get("spans"):
+        # metadata values must be scalars: [[page, start, end], ...] as JSON
+        meta["spans"] = json.dumps(c["spans"], separators=(",", ":"))
+    return meta
+
+
+def build_index(chunks_jsonl: str, pdf_id: str, incremental: bool = True, batch_size: int = 64):
+    """
+    Build embeddings for each page/chunk and add them to the configured
+    vector store (Chroma by default). Compatible with pages.jsonl from ingest.py
+
+    With incremental=True (default) only chunks whose content hash is not
+    in the store yet are embedded and upserted, and chunks that
+    disappeared from chunks_jsonl are deleted. incremental=False drops the
+    document's records and re-embeds everything.
+
+    Chunks are streamed from disk and embedded/upserted batch by batch,
+    so only the id set and one batch are held in memory.
+    """
+    with profile("build_index"), span("index.build", pdf_id=pdf_id, incremental=incremental) as sp:
+        n_new, n_seen, n_stale = _build_index(chunks_jsonl, pdf_id, incremental, batch_size)
+        sp.set(new=n_new, unchanged=n_seen - n_new, removed=n_stale)
+    incr("index.upserted", n_new)
+    incr("index.deleted", n_stale)
+    print(f"✅ Indexed {n_new} new, {n_seen - n_new} unchanged, "
+          f"{n_stale} removed pages/chunks ({get_store().name} store)")
+
+
+def _build_index(chunks_jsonl: str, pdf_id: str, incremental: bool, batch_size: int):
+    """build_index body; returns (new, seen, stale) record counts."""
+    store = get_store()
+    chunks = iter_rows(chunks_jsonl)
+    first = next(chunks, None)
+    if first is not None:
+        chunks = itertools.chain([first], chunks)
+
+    pdf_path = first.get("pdf_path", "") if first else ""
+    existing = _existing_ids(pdf_id, pdf_path)
+    if not incremental and existing:
+        store.delete(sorted(existing))
+        existing = set()
+
+    seen = set()
+    n_new = 0
+    for batch in batched(chunks, batch_size):
+        ids, texts, metas = [], [], []
+        for c in batch:
+            rid = chunk_record_id(pdf_id, c)
+            # Same content on the same pages -> same id; keep the first occurrence
+            if rid in seen:
+                continue
+            seen.add(rid)
+            if rid in existing:
+                continue
+            ids.append(rid)
+            texts.append(c.get("text", ""))
+            metas.append(_chunk_meta(pdf_id, c))
+        if not ids:
+            continue
+        embs = encode_texts(texts, batch_size=batch_size)
+        with span("store.upsert", n=len(ids)):
+            store.upsert(ids, embs, texts, metas)
+        n_new += len(ids)
+
+    stale = sorted(existing - seen)
+    with span("store.flush", deleted=len(stale)):
+        if stale:
+            store.delete(stale)
+        store.flush()
+
+    # BM25 side index for hybrid retrieval; rebuilt only when records changed
+    if n_new or stale or not os.path.exists(index_path(CONFIG["lexical_dir"], pdf_id)):
+        with span("index.lexical_build"):
+            build_lexical_index(_lexical_records(chunks_jsonl, pdf_id), CONFIG["lexical_dir"], pdf_id)
+
+    # cached answers about this document may now be wrong
+    if n_new or stale:
+        get_query_cache().invalidate(pdf_id)
+    return n_new, len(seen), len(stale)
+
+
+def _lexical_records(chunks_jsonl: str, pdf_id: str):
+    """(record_id, text) for each distinct chunk, same ids as the vector store."""
+    seen = set()
+    for c in iter_rows(chunks_jsonl):
+        rid = chunk_record_id(pdf_id, c)
+        if rid not in seen:
+            seen.add(rid)
+            yield rid, c.get("text", "")
 
 # -------------------------
-# Query Chroma index
+# Query index
 # -------------------------
-def query_index(query: str, top_k: int = 5):
+def build_where(pdf_id: str = None, page_range: tuple = None, where: dict = None):
+    """
+    Chroma-style `where` filter restricting results to one document and/or to
+    chunks overlapping an inclusive (first_page, last_page) range.
     """
-    Query Chroma collection using sentence embedding similarity
+    clauses = []
+    if pdf_id:
+        clauses.append({"pdf_id": pdf_id})
+    if page_range:
+        lo, hi = page_range
+        if lo is not None:
+            clauses.append({"page_end": {"$gte": int(lo)}})
+        if hi is not None:
+            clauses.append({"page_start": {"$lte": int(hi)}})
+    if where:
+        clauses.append(where)
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def query_index(query: str, top_k: int = 5, pdf_id: str = None, page_range: tuple = None, where: dict = None):
+    """
+    Query the vector store using sentence embedding similarity
     Returns top_k documents with metadata
+
+    pdf_id / page_range are pushed down into the store query, so top_k is
+    computed inside the selected document (and pages) only.
+    """
+    with span("retrieve.dense", n=1, top_k=top_k):
+        q_emb = encode_texts([query])
+        flt = build_where(pdf_id=pdf_id, page_range=page_range, where=where)
+        with span("store.query"):
+            results = get_store().query(q_emb, top_k=top_k, where=flt)
+    return results
+
+
+def query_index_batch(queries: list, top_k: int = 5, pdf_id: str = None, page_range: tuple = None,
+                      where: dict = None):
     """
-    q_emb = embed_model.encode([query], convert_to_numpy=True, normalize_embeddings=True).tolist()
-    results = collection.query(query_embeddings=q_emb, n_results=top_k)
-    return results
\ No newline at end of file
+    Query many questions at once: one vectorized encode call and one
+    multi-query vector store call. Result lists are indexed by query position,
+    like query_index's single-query results.
+    """
+    if not queries:
+        return {"ids": [], "documents": [], "metadatas": [], "distances": []}
+    with span("retrieve.dense", n=len(queries), top_k=top_k):
+        q_embs = encode_texts(list(queries))
+        flt = build_where(pdf_id=pdf_id, page_range=page_range, where=where)
+        with span("store.query"):
+            return get_store().query(q_embs, top_k=top_k, where=flt)
+
+
+def _rrf_fuse(dense: dict, qi: int, lexical_hits: list, flt: dict, top_k: int, rrf_k: int) -> dict:
+    """Reciprocal rank fusion of one query's dense results with BM25 hits."""
+    d_ids = dense["ids"][qi]
+    by_id = {rid: (doc, meta, dist) for rid, doc, meta, dist in
+             zip(d_ids, dense["documents"][qi], dense["metadatas"][qi], dense["distances"][qi])}
+    scores = {}
+    for rank, rid in enumerate(d_ids):
+        scores[rid] = scores.get(rid, 0.0) + 1.0 / (rrf_k + rank + 1)
+
+    lex_only = [rid for rid, _ in lexical_hits if rid not in by_id]
+    if lex_only:
+        got = get_store().get(lex_only)
+        for rid, doc, meta in zip(got["ids"], got["documents"], got["metadatas"]):
+            if match_where(meta or {}, flt):
+                by_id[rid] = (doc, meta, None)
+    rank = 0
+    for rid, _ in lexical_hits:
+        if rid in by_id:
+            scores[rid] = scores.get(rid, 0.0) + 1.0 / (rrf_k + rank + 1)
+            rank += 1
+
+    best = sorted(scores, key=lambda r: -scores[r])[:top_k]
+    return {
+        "ids": best,
+        "documents": [by_id[r][0] for r in best],
+        "metadatas": [by_id[r][1] for r in best],
+        "distances": [by_id[r][2] for r in best],
+        "scores": [scores[r] for r in best],
+    }
+
+
+def hybrid_query_batch(queries: list, top_k: int = 5, pdf_id: str = None, page_range: tuple = None,
+                       where: dict = None, candidates: int = None, rrf_k: int = 60):
+    """
+    Dense + BM25 retrieval fused with reciprocal rank fusion.
+
+    Each retriever contributes `candidates` results (default 4 * top_k,
+    at least 20) and the fused list is cut back to top_k, so exact-token
+    matches get in without a larger prompt. Lexical hits pass the same
+    document/page filter as the dense query. distances is None for chunks
+    found only by BM25; "scores" holds the fused RRF score.
+    """
+    candidates = candidates or max(4 * top_k, 20)
+    with span("retrieve.hybrid", n=len(queries), top_k=top_k):
+        dense = query_index_batch(queries, top_k=candidates, pdf_id=pdf_id, page_range=page_range, where=where)
+        flt = build_where(pdf_id=pdf_id, page_range=page_range, where=where)
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": [], "scores": []}
+        for qi, q in enumerate(queries):
+            with span("retrieve.lexical"):
+                lex = search_lexical(q, CONFIG["lexical_dir"], pdf_id=pdf_id, top_k=candidates)
+            fused = _rrf_fuse(dense, qi, lex, flt, top_k, rrf_k)
+            for key in out:
+                out[key].append(fused[key])
+    return out
+
+
+def hybrid_query(query: str, top_k: int = 5, pdf_id: str = None, page_range: tuple = None,
+                 where: dict = None, candidates: int = None, rrf_k: int = 60):
+    """Single-query hybrid_query_batch, same result shape as query_index."""
+    return hybrid_query_batch([query], top_k=top_k, pdf_id=pdf_id, page_range=page_range,
+                              where=where, candidates=candidates, rrf_k=rrf_k)
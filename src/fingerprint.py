@@ -0,0 +1,77 @@
+# src/fingerprint.py
+"""
+Per-document and per-page fingerprints, so re-ingesting a PDF only
+extracts the pages that changed (<out_dir>/fingerprints.json):
+
+    {"version": 1, "file_sha1": ..., "pdf_path": ..., "params": {...}, "pages": [page fingerprint, ...]}
+
+A page fingerprint is the sha1 of the page size and rotation, its
+decompressed content stream and the raw bytes of every image and form
+XObject it draws. Scanned pages all share the same tiny content stream
+("draw image Im0"), so the image bytes are what tells them apart.
+Fingerprints are compared by value, not position: a page inserted in
+the middle does not invalidate the pages after it.
+"""
+import os
+import json
+import hashlib
+
+FINGERPRINT_FILE = "fingerprints.json"
+FINGERPRINT_VERSION = 1
+
+
+def page_fingerprint(doc, page, stream_cache: dict = None) -> str:
+    """sha1 hex digest of what the page draws; stream_cache maps xref -> digest across pages."""
+    stream_cache = {} if stream_cache is None else stream_cache
+    h = hashlib.sha1()
+    h.update(repr((tuple(page.rect), page.rotation)).encode("ascii"))
+    h.update(page.read_contents())
+    xrefs = [img[0] for img in page.get_images(full=True)] + [x[0] for x in page.get_xobjects()]
+    for xref in dict.fromkeys(xrefs):
+        digest = stream_cache.get(xref)
+        if digest is None:
+            # raw (still compressed) bytes: hashing is cheap, decoding an image is not
+            digest = stream_cache[xref] = hashlib.sha1(doc.xref_stream_raw(xref) or b"").hexdigest()
+        h.update(digest.encode("ascii"))
+    return h.hexdigest()
+
+
+def doc_fingerprints(doc) -> list:
+    """Fingerprint of every page of an open fitz document, in page order."""
+    cache = {}
+    return [page_fingerprint(doc, doc[i], cache) for i in range(len(doc))]
+
+
+def fingerprint_path(out_dir: str) -> str:
+    return os.path.join(out_dir, FINGERPRINT_FILE)
+
+
+def load_fingerprints(out_dir: str):
+    """The stored fingerprint record, or None if missing or from another version."""
+    path = fingerprint_path(out_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return data if data.get("version") == FINGERPRINT_VERSION else None
+
+
+def save_fingerprints(out_dir: str, file_sha1: str, pdf_path: str, params: dict, pages: list) -> str:
+    path = fingerprint_path(out_dir)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": FINGERPRINT_VERSION, "file_sha1": file_sha1, "pdf_path": pdf_path,
+                   "params": params, "pages": pages}, f)
+    os.replace(tmp, path)
+    return path
+
+
+def drop_fingerprints(out_dir: str) -> None:
+    """Forget the stored fingerprints (while pages.jsonl is being rewritten)."""
+    try:
+        os.remove(fingerprint_path(out_dir))
+    except FileNotFoundError:
+        pass
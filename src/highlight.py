@@ -1,37 +1,234 @@
 import fitz  # PyMuPDF
 import json
 import os
+import re
+import shutil
+import bisect
+from collections import OrderedDict
+from rapidfuzz import fuzz
+from src.telemetry import span, incr
+from src.layout import load_layout
+from src.artifacts import is_records, open_records
+from src.utils import LRUCache
+
+# Minimum rapidfuzz partial_ratio for a sentence to count as found
+MATCH_THRESHOLD = 80
+# Sentences shorter than this are too ambiguous to highlight on their own
+MIN_SENTENCE_CHARS = 12
+# How many pages' word indexes / page rows to keep in memory
+PAGE_CACHE_SIZE = 512
+
+_SENT_SPLIT = re.compile(r"(?<=[.!?;:])\s+|\n+")
+
+
+_line_offsets = LRUCache(64)        # pages.jsonl -> byte offset of each line
+_page_rows = LRUCache(PAGE_CACHE_SIZE)
+_page_words = LRUCache(PAGE_CACHE_SIZE)
+
+
+def _file_key(path: str):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def load_page_row(pages_jsonl: str, page_num: int):
+    """
+    Row of the pages file for a 0-based page number, or None. A .rec file
+    is read through its index; in pages.jsonl only that one line is
+    parsed, with line offsets indexed once per file version.
+    """
+    fkey = _file_key(pages_jsonl)
+    row = _page_rows.get((fkey, page_num))
+    if row is not None:
+        return row
+
+    if is_records(pages_jsonl):
+        rf = open_records(pages_jsonl)
+        if page_num < 0 or page_num >= len(rf):
+            return None
+        row = rf.row(page_num)
+        _page_rows.put((fkey, page_num), row)
+        return row
+
+    offsets = _line_offsets.get(fkey)
+    if offsets is None:
+        offsets = []
+        with open(pages_jsonl, "rb") as f:
+            pos = 0
+            for line in f:
+                if line.strip():
+                    offsets.append(pos)
+                pos += len(line)
+        _line_offsets.put(fkey, offsets)
+
+    if page_num < 0 or page_num >= len(offsets):
+        return None
+    with open(pages_jsonl, "rb") as f:
+        f.seek(offsets[page_num])
+        try:
+            row = json.loads(f.readline().decode("utf-8"))
+        except json.JSONDecodeError:
+            return None
+    _page_rows.put((fkey, page_num), row)
+    return row
+
+
+class PageWords:
+    """
+    Words of one page with boxes, plus the lowercase page text built by
+    joining them, so character spans found in the text map back to words.
+    """
+
+    def __init__(self, words: list):
+        # words: [(x0, y0, x1, y1, text, line_key)]
+        self.words = words
+        self.starts = []
+        parts = []
+        pos = 0
+        for w in words:
+            self.starts.append(pos)
+            parts.append(w[4].lower())
+            pos += len(w[4]) + 1
+        self.text = " ".join(parts)
+
+    def word_range(self, start: int, end: int):
+        """Indexes [i, j) of the words overlapping text[start:end]."""
+        i = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        j = bisect.bisect_left(self.starts, end)
+        return i, j
+
+    def line_rects(self, i: int, j: int) -> list:
+        """One rectangle per text line covered by words i..j-1."""
+        rects = OrderedDict()
+        for x0, y0, x1, y1, _, line_key in self.words[i:j]:
+            r = rects.get(line_key)
+            rects[line_key] = fitz.Rect(x0, y0, x1, y1) if r is None else r | fitz.Rect(x0, y0, x1, y1)
+        return list(rects.values())
+
+
+def _build_page_words(page, meta) -> PageWords:
+    words = [
+        (w[0], w[1], w[2], w[3], w[4], (w[5], w[6]))
+        for w in page.get_text("words")
+    ]
+    if not words and meta and isinstance(meta.get("ocr"), dict):
+        # scanned page: use the OCR boxes stored at ingest; group lines by row
+        for w in meta["ocr"].get("words") or []:
+            bbox = w.get("bbox")
+            if bbox and w.get("text"):
+                words.append((*bbox, w["text"], ("ocr", round(bbox[1] / 4))))
+    return PageWords(words)
+
+
+def get_page_words(input_pdf: str, doc, page_num: int, pages_jsonl: str = None) -> PageWords:
+    """Cached word index for one page of input_pdf."""
+    key = (_file_key(input_pdf), page_num)
+    pw = _page_words.get(key)
+    if pw is None:
+        incr("highlight.page_words_miss")
+        with span("highlight.page_row", page=page_num + 1):
+            meta = load_page_row(pages_jsonl, page_num) if pages_jsonl else None
+        with span("highlight.page_words", page=page_num + 1):
+            pw = _build_page_words(doc[page_num], meta)
+        _page_words.put(key, pw)
+    return pw
+
+
+def split_sentences(text: str) -> list:
+    out = []
+    for s in _SENT_SPLIT.split(text or ""):
+        s = " ".join(s.split())
+        if len(s) >= MIN_SENTENCE_CHARS:
+            out.append(s)
+    return out
+
+
+def locate_sentence(pw: PageWords, sentence: str):
+    """
+    (start, end) character span of sentence in the page text: exact
+    match first, then the best fuzzy alignment above MATCH_THRESHOLD.
+    """
+    s = sentence.lower()
+    pos = pw.text.find(s)
+    if pos != -1:
+        return pos, pos + len(s)
+    if not pw.text:
+        return None
+    al = fuzz.partial_ratio_alignment(s, pw.text, score_cutoff=MATCH_THRESHOLD)
+    if al is None or al.dest_end <= al.dest_start:
+        return None
+    return al.dest_start, al.dest_end
+
+
+def _save(doc, input_pdf: str, output_pdf: str):
+    # The output is a copy of the input, so only the new annotations need
+    # to be appended (incremental save) instead of rewriting the file.
+    if doc.can_save_incrementally():
+        doc.saveIncr()
+    else:
+        tmp = output_pdf + ".tmp"
+        doc.save(tmp, deflate=True)
+        doc.close()
+        os.replace(tmp, output_pdf)
+        return
+    doc.close()
 
 
 def highlight_pdf(input_pdf: str, pages_jsonl: str, evidences: list, output_pdf: str):
     """
     Highlights text in a PDF based on evidence snippets.
 
+    Evidences with "spans" ([page, start, end] character ranges recorded
+    by the chunker) are highlighted by direct lookup in the document's
+    layout.npz word boxes, with no text search. Otherwise each snippet is
+    split into sentences; every sentence is located on its page with an
+    exact or fuzzy (rapidfuzz) match against a cached word index, and the
+    matching words are highlighted line by line.
+
     Args:
         input_pdf (str): Path to the original PDF.
-        pages_jsonl (str): Path to the pages.jsonl file (OCR/parsed data).
-        evidences (list): List of dicts with keys 'snippet' and 'page'.
+        pages_jsonl (str): Path to the pages.jsonl / pages.rec file (OCR/parsed data).
+        evidences (list): List of dicts with keys 'snippet' and 'page' (optionally 'spans').
         output_pdf (str): Path where the highlighted PDF will be saved.
     """
 
     if not os.path.exists(input_pdf):
         raise FileNotFoundError(f"PDF not found: {input_pdf}")
     if not os.path.exists(pages_jsonl):
-        raise FileNotFoundError(f"pages.jsonl not found: {pages_jsonl}")
-
-    # Load page metadata
-    pages = []
-    with open(pages_jsonl, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                pages.append(json.loads(line.strip()))
-            except json.JSONDecodeError:
-                continue
+        raise FileNotFoundError(f"pages file not found: {pages_jsonl}")
+
+    with span("highlight.pdf", evidences=len(evidences)) as sp:
+        n = _highlight_evidences(input_pdf, pages_jsonl, evidences, output_pdf)
+        sp.set(highlights=n)
+    return output_pdf
+
+
+def _highlight_evidences(input_pdf: str, pages_jsonl: str, evidences: list, output_pdf: str) -> int:
+    """highlight_pdf body; returns the number of highlights added."""
+    os.makedirs(os.path.dirname(output_pdf) or ".", exist_ok=True)
+    with span("highlight.open"):
+        shutil.copyfile(input_pdf, output_pdf)
+        doc = fitz.open(output_pdf)
 
-    # Open PDF
-    doc = fitz.open(input_pdf)
+    layout = None
+    if any(ev.get("spans") for ev in evidences):
+        with span("highlight.layout"):
+            layout = load_layout(pages_jsonl)
 
+    done = set()  # (page, first_word, last_word) or (page, start, end) already highlighted
     for ev in evidences:
+        if layout is not None and ev.get("spans"):
+            for page_no, start, end in ev["spans"]:
+                page_num = int(page_no) - 1
+                if page_num < 0 or page_num >= len(doc) or ("span", page_num, start, end) in done:
+                    continue
+                done.add(("span", page_num, start, end))
+                rects = layout.span_rects(page_num, start, end)
+                if rects:
+                    page = doc[page_num]  # the annotation needs its page alive until update()
+                    page.add_highlight_annot([fitz.Rect(r) for r in rects]).update()
+            continue
+
         ev_text = ev.get("snippet") or ev.get("text")  # fix: use snippet from rag_pipeline
         ev_page = ev.get("page")
 
@@ -47,31 +244,21 @@ def highlight_pdf(input_pdf: str, pages_jsonl: str, evidences: list, output_pdf:
             continue
 
         page = doc[page_num]
-
-        # --- Meta info (optional OCR words) ---
-        meta = pages[page_num] if page_num < len(pages) else None
-
-        # --- Try native text search ---
-        areas = page.search_for(ev_text)
-        if areas:
-            for rect in areas:
-                highlight = page.add_highlight_annot(rect)
-                highlight.update()
+        pw = get_page_words(input_pdf, doc, page_num, pages_jsonl)
+        if not pw.words:
             continue
 
-        # --- Fallback: OCR word-level search ---
-        if meta and "ocr" in meta and isinstance(meta["ocr"], dict) and "words" in meta["ocr"]:
-            words = meta["ocr"]["words"]
-            for w in words:
-                if ev_text.lower() in w.get("text", "").lower():
-                    bbox = w.get("bbox")
-                    if bbox:
-                        rect = fitz.Rect(bbox)
-                        highlight = page.add_highlight_annot(rect)
-                        highlight.update()
-
-    # Save highlighted PDF
-    os.makedirs(os.path.dirname(output_pdf), exist_ok=True)
-    doc.save(output_pdf, garbage=4, deflate=True, clean=True)
-    doc.close()
-    return output_pdf
+        for sent in split_sentences(ev_text):
+            found = locate_sentence(pw, sent)
+            if found is None:
+                continue
+            i, j = pw.word_range(*found)
+            if j <= i or (page_num, i, j) in done:
+                continue
+            done.add((page_num, i, j))
+            highlight = page.add_highlight_annot(pw.line_rects(i, j))
+            highlight.update()
+
+    with span("highlight.save"):
+        _save(doc, input_pdf, output_pdf)
+    return len(done)
@@ -1,67 +1,354 @@
 # src/ingest.py
-import os, io, json
+import os, json, math, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from PIL import Image
 import fitz  # PyMuPDF
 import pytesseract
 from tqdm import tqdm
-from src.utils import ensure_dir, save_jsonl, clean_text
+from src.utils import ensure_dir, save_jsonl, clean_text, file_hash, tesseract_cmd
+from src.artifacts import artifact_path, save_rows, iter_rows
+from src.layout import LAYOUT_FILE, page_layout, save_layout, load_layout
+from src.fingerprint import doc_fingerprints, load_fingerprints, save_fingerprints, drop_fingerprints
+from src.telemetry import span, observe, incr, profile
 
 # ⚠️ Windows users ke liye important:
-# Agar tesseract PATH me nahi hai, to full path yahan set karo.
-# Install hone ke baad default path usually yeh hota hai:
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+# Agar tesseract PATH me nahi hai, to TESSERACT_CMD env var me full path do.
+# Default install path (C:\Program Files\Tesseract-OCR) apne aap mil jata hai.
+if tesseract_cmd():
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd()
 
-def extract_pdf(pdf_path: str, out_dir: str, ocr_dpi: int = 300) -> str:
-    ensure_dir(out_dir)
-    pages_jsonl = os.path.join(out_dir, "pages.jsonl")
-    ocr_dir = os.path.join(out_dir, "ocr")
-    ensure_dir(ocr_dir)
-
-    doc = fitz.open(pdf_path)
-    rows = []
-    for i in tqdm(range(len(doc)), desc=f"Ingesting {os.path.basename(pdf_path)}"):
-        page = doc[i]
-        text = page.get_text("text") or ""
-        text = text.strip()
-        is_scanned = (len(text) < 20)  # heuristic
-
-        page_entry = {
-            "pdf_path": os.path.abspath(pdf_path),
-            "page": i + 1,
-            "n_pages": len(doc),
-            "is_scanned": bool(is_scanned),
-            "text": "",
-            "ocr": None,
-        }
-
-        if not is_scanned:
-            page_entry["text"] = clean_text(text)
-        else:
-            zoom = ocr_dpi / 72.0
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat, alpha=False)
-            img = Image.open(io.BytesIO(pix.tobytes("png"))).convert("RGB")
+# Scanned pages are OCR'd once, at the lowest DPI (a multiple of 25,
+# between OCR_MIN_DPI and ocr_dpi) that makes their text lines at least
+# OCR_MIN_WORD_PX pixels tall. The line height comes from the row ink
+# profile of a cheap OCR_ESTIMATE_DPI render, before any OCR. Only if
+# tesseract's mean confidence is then below OCR_MIN_CONF is the page read
+# again at the full ocr_dpi.
+OCR_ESTIMATE_DPI = 72
+OCR_MIN_DPI = 150
+OCR_MIN_WORD_PX = 22
+OCR_MIN_CONF = 70
+# Bump when page extraction changes, so stored pages are not reused
+INGEST_VERSION = 2
+
+# Each worker process keeps its own handle to the PDF it is working on,
+# so pages are rendered without re-opening the file for every task.
+_worker_doc = {"path": None, "doc": None}
+
+
+def _open_worker_doc(pdf_path: str):
+    if _worker_doc["path"] != pdf_path:
+        if _worker_doc["doc"] is not None:
+            _worker_doc["doc"].close()
+        _worker_doc["doc"] = fitz.open(pdf_path)
+        _worker_doc["path"] = pdf_path
+    return _worker_doc["doc"]
+
+
+def render_page_image(page, dpi: int) -> Image.Image:
+    """
+    Grayscale PIL image of a page built straight from the pixmap's sample
+    buffer (no PNG encode/decode in between).
+    """
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    # pix.samples is one raw memcpy; an image over samples_mv would pin the
+    # pixmap buffer past the pixmap's lifetime
+    img = Image.frombuffer("L", (pix.width, pix.height), pix.samples, "raw", "L", pix.stride, 1)
+    # pytesseract hands the image to tesseract through a temp file in
+    # img.format; uncompressed BMP is much cheaper to write than PNG.
+    img.format = "BMP"
+    return img
+
+
+def save_page_image(pdf_path: str, page_no: int, out_path: str, dpi: int = 300) -> str:
+    """Render one page (1-based) to an image file on demand, e.g. for debugging OCR."""
+    with fitz.open(pdf_path) as doc:
+        doc[page_no - 1].get_pixmap(dpi=dpi, alpha=False).save(out_path)
+    return out_path
+
+
+def _text_height_pt(page) -> float:
+    """
+    Median height in points of the text lines on a page image, from the
+    runs of inked rows in an OCR_ESTIMATE_DPI render (0.0 if none).
+    """
+    pixels = np.asarray(render_page_image(page, OCR_ESTIMATE_DPI))
+    inked = (pixels < 128).sum(axis=1) > max(2, pixels.shape[1] // 200)
+    edges = np.diff(np.concatenate(([0], inked.astype(np.int8), [0])))
+    runs = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    runs = runs[runs >= 2]  # specks
+    return float(np.median(runs)) * 72.0 / OCR_ESTIMATE_DPI if len(runs) else 0.0
+
+
+def _ocr_dpi_for(height_pt: float, ocr_dpi: int) -> int:
+    """Lowest DPI (multiple of 25, OCR_MIN_DPI..ocr_dpi) giving OCR_MIN_WORD_PX tall lines."""
+    low = min(OCR_MIN_DPI, ocr_dpi)
+    if height_pt <= 0:
+        return low
+    dpi = math.ceil(OCR_MIN_WORD_PX * 72.0 / height_pt / 25) * 25
+    return max(low, min(dpi, ocr_dpi))
+
+
+def _ocr_words(img: Image.Image, zoom: float):
+    """
+    (words with bboxes in PDF points, layout words
+    [(x0, y0, x1, y1, text, block, line)], mean confidence).
+    """
+    data = pytesseract.image_to_data(img, lang="eng", output_type=pytesseract.Output.DICT)
+    words, layout_words, confs = [], [], []
+    for j in range(len(data.get("text", []))):
+        wtxt = (data["text"][j] or "").strip()
+        if not wtxt:
+            continue
+        left, top, width, height = data["left"][j], data["top"][j], data["width"][j], data["height"][j]
+        bbox = [left/zoom, top/zoom, (left+width)/zoom, (top+height)/zoom]
+        words.append({"text": wtxt, "bbox": bbox})
+        block = data["block_num"][j] if "block_num" in data else 0
+        line = (data["par_num"][j] * 1000 + data["line_num"][j]) if "line_num" in data else round(bbox[1] / 4)
+        layout_words.append((*bbox, wtxt, block, line))
+        conf = float(data["conf"][j])
+        if conf >= 0:
+            confs.append(conf)
+    mean_conf = sum(confs) / len(confs) if confs else 0.0
+    return words, layout_words, mean_conf
+
+
+def _extract_page(doc, i: int, pdf_path: str, ocr_dpi: int, ocr_dir: str = None):
+    """
+    Extract one page. Returns (page_entry, timing, layout) where timing
+    holds the seconds spent in each step for this page and layout the
+    columnar word/block geometry (src/layout.py).
+
+    Scanned pages are OCR'd once at a DPI chosen from their estimated text
+    height, and again at ocr_dpi only when recognition is poor. Page images
+    are written to ocr_dir only if one is given.
+    """
+    t0 = time.perf_counter()
+    page = doc[i]
+    text = page.get_text("text") or ""
+    text = text.strip()
+    is_scanned = (len(text) < 20)  # heuristic
+
+    page_entry = {
+        "pdf_path": os.path.abspath(pdf_path),
+        "page": i + 1,
+        "n_pages": len(doc),
+        "is_scanned": bool(is_scanned),
+        "text": "",
+        "ocr": None,
+    }
+    timing = {"page": i + 1, "is_scanned": bool(is_scanned), "render_s": 0.0, "ocr_s": 0.0}
+
+    if not is_scanned:
+        page_entry["text"] = clean_text(text)
+        layout = page_layout([w[:7] for w in page.get_text("words")], page_entry["text"])
+    else:
+        t_render = time.perf_counter()
+        timing["text_pt"] = _text_height_pt(page)
+        timing["render_s"] += time.perf_counter() - t_render
+        dpi = _ocr_dpi_for(timing["text_pt"], ocr_dpi)
+        while True:
+            zoom = dpi / 72.0
+            t_render = time.perf_counter()
+            img = render_page_image(page, dpi)
+            timing["render_s"] += time.perf_counter() - t_render
+
+            t_ocr = time.perf_counter()
+            words, layout_words, mean_conf = _ocr_words(img, zoom)
+            timing["ocr_s"] += time.perf_counter() - t_ocr
+            # the height estimate was off (skew, noise): read it again at full resolution
+            if dpi >= ocr_dpi or not words or mean_conf >= OCR_MIN_CONF:
+                break
+            dpi = ocr_dpi
+
+        img_path = None
+        if ocr_dir:
             img_path = os.path.join(ocr_dir, f"page_{i+1}.png")
-            img.save(img_path)
-
-            data = pytesseract.image_to_data(img, lang="eng", output_type=pytesseract.Output.DICT)
-            words = []
-            tokens = []
-            n = len(data.get("text", []))
-            for j in range(n):
-                wtxt = (data["text"][j] or "").strip()
-                if not wtxt:
-                    continue
-                left, top, width, height = data["left"][j], data["top"][j], data["width"][j], data["height"][j]
-                words.append({
-                    "text": wtxt,
-                    "bbox": [left/zoom, top/zoom, (left+width)/zoom, (top+height)/zoom]
-                })
-                tokens.append(wtxt)
-            page_entry["text"] = clean_text(" ".join(tokens))
-            page_entry["ocr"] = {"image_path": img_path, "zoom": zoom, "words": words}
-
-        rows.append(page_entry)
-
-    save_jsonl(pages_jsonl, rows)
-    return pages_jsonl
+            img.save(img_path, format="PNG")
+        timing["dpi"] = dpi
+        page_entry["text"] = clean_text(" ".join(w["text"] for w in words))
+        page_entry["ocr"] = {"image_path": img_path, "zoom": zoom, "dpi": dpi, "words": words}
+        layout = page_layout(layout_words, page_entry["text"])
+
+    timing["total_s"] = time.perf_counter() - t0
+    return page_entry, timing, layout
+
+
+def _extract_page_worker(args):
+    pdf_path, i, ocr_dpi, ocr_dir = args
+    doc = _open_worker_doc(pdf_path)
+    return _extract_page(doc, i, pdf_path, ocr_dpi, ocr_dir)
+
+
+def iter_pages(pdf_path: str, ocr_dir: str = None, ocr_dpi: int = 300, workers: int = 1, pages: list = None):
+    """
+    Yield (page_entry, timing, layout) for each page (or only the 0-based
+    `pages`), in page order.
+
+    With a process pool at most workers*2 pages are in flight, so memory
+    stays bounded no matter how many pages the PDF has.
+    """
+    with fitz.open(pdf_path) as doc:
+        pages = list(range(len(doc))) if pages is None else sorted(pages)
+        if workers <= 1 or len(pages) <= 1:
+            for i in pages:
+                yield _extract_page(doc, i, pdf_path, ocr_dpi, ocr_dir)
+            return
+
+    window = workers * 2
+    with ProcessPoolExecutor(max_workers=min(workers, len(pages))) as ex:
+        pending = deque()
+        for i in pages:
+            pending.append(ex.submit(_extract_page_worker, (pdf_path, i, ocr_dpi, ocr_dir)))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _reused_image_path(pdf_path: str, i: int, ocr: dict, ocr_dir: str = None):
+    """
+    image_path for a reused OCR row that is now 0-based page i: None
+    without ocr_dir, the stored image if the page did not move, otherwise
+    the page re-rendered (no OCR) under its new number.
+    """
+    if not ocr_dir:
+        return None
+    path = os.path.join(ocr_dir, f"page_{i+1}.png")
+    if ocr.get("image_path") == path and os.path.exists(path):
+        return path
+    with fitz.open(pdf_path) as doc:
+        render_page_image(doc[i], ocr.get("dpi") or OCR_MIN_DPI).save(path, format="PNG")
+    return path
+
+
+def _ingest_params(ocr_dpi: int) -> dict:
+    # everything besides the page itself that changes what a page row holds
+    return {"ingest_version": INGEST_VERSION, "ocr_dpi": ocr_dpi, "ocr_estimate_dpi": OCR_ESTIMATE_DPI,
+            "ocr_min_dpi": OCR_MIN_DPI, "ocr_min_word_px": OCR_MIN_WORD_PX, "ocr_min_conf": OCR_MIN_CONF}
+
+
+def _reusable_pages(pages_path: str, prev: dict, params: dict, fps: list) -> dict:
+    """
+    {new 0-based page: (stored row, stored layout)} for pages whose
+    fingerprint was seen in the previous run with the same parameters.
+    """
+    if not prev or prev.get("params") != params or not os.path.exists(pages_path):
+        return {}
+    layout = load_layout(pages_path)
+    if layout is None or layout.n_pages != len(prev["pages"]):
+        return {}
+    old_by_fp = {}
+    for j, fp in enumerate(prev["pages"]):
+        old_by_fp.setdefault(fp, j)
+    wanted = {i: old_by_fp[fp] for i, fp in enumerate(fps) if fp in old_by_fp}
+    need = set(wanted.values())
+    rows = {}
+    if need:
+        for j, row in enumerate(iter_rows(pages_path)):
+            if j in need:
+                rows[j] = row
+    if len(rows) != len(need):
+        return {}  # the pages file does not match the fingerprints: start over
+    return {i: (rows[j], layout.page(j)) for i, j in wanted.items()}
+
+
+def extract_pdf(pdf_path: str, out_dir: str, ocr_dpi: int = 300, workers: int = 1,
+                save_images: bool = False, reuse: bool = True) -> str:
+    """
+    Extract text (native or OCR) for every page into out_dir/pages.jsonl
+    (pages.rec with CONFIG["artifact_format"] = "rec", see src/artifacts.py).
+    Returns the path written.
+
+    workers > 1 spreads page rendering + OCR over a process pool
+    (workers=0 or None uses every core). Rows are streamed to disk in page
+    order, so the pages file is identical to a serial run. Per-page timings
+    are written to out_dir/ingest_timings.jsonl, word and block boxes
+    (native and OCR pages) to out_dir/layout.npz.
+
+    OCR page images are kept in memory only; save_images=True also writes
+    them to out_dir/ocr/ (save_page_image renders a single page later).
+
+    With reuse, pages whose fingerprint (src/fingerprint.py) matches the
+    previous run keep their stored row and layout and are not rendered or
+    OCR'd again; an unchanged file returns at once.
+    """
+    ensure_dir(out_dir)
+    pages_path = artifact_path(out_dir, "pages", for_write=True)
+    prev_pages = artifact_path(out_dir, "pages")  # newest existing file, possibly the other format
+    timings_jsonl = os.path.join(out_dir, "ingest_timings.jsonl")
+    ocr_dir = None
+    if save_images:
+        ocr_dir = os.path.join(out_dir, "ocr")
+        os.makedirs(ocr_dir, exist_ok=True)
+    else:
+        os.makedirs(out_dir, exist_ok=True)
+
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    t_start = time.perf_counter()
+    params = _ingest_params(ocr_dpi)
+    with span("ingest.fingerprint", pdf=os.path.basename(pdf_path)):
+        file_sha1 = file_hash(pdf_path)
+        with fitz.open(pdf_path) as doc:
+            n_pages = len(doc)
+            fps = doc_fingerprints(doc)
+    prev = load_fingerprints(out_dir) if reuse else None
+    # save_images takes the per-page path below, which checks that every page image exists
+    if (prev and not save_images and prev.get("file_sha1") == file_sha1 and prev.get("params") == params
+            and prev.get("pdf_path") == os.path.abspath(pdf_path)
+            and prev_pages == pages_path and os.path.exists(pages_path) and load_layout(pages_path) is not None):
+        print(f"✅ {os.path.basename(pdf_path)} unchanged, keeping {pages_path}")
+        incr("ingest.reused_pages", n_pages)
+        return pages_path
+    reused = _reusable_pages(prev_pages, prev, params, fps) if reuse else {}
+    todo = [i for i in range(n_pages) if i not in reused]
+
+    timings = []
+    layouts = []
+
+    def rows():
+        results = iter(iter_pages(pdf_path, ocr_dir, ocr_dpi=ocr_dpi, workers=workers, pages=todo))
+        for i in tqdm(range(n_pages), desc=f"Ingesting {os.path.basename(pdf_path)}"):
+            if i in reused:
+                row, layout = reused[i]
+                entry = dict(row, pdf_path=os.path.abspath(pdf_path), page=i + 1, n_pages=n_pages)
+                if entry.get("ocr"):
+                    # the stored image may belong to the page's old number (or not exist this run)
+                    image_path = _reused_image_path(pdf_path, i, entry["ocr"], ocr_dir)
+                    entry["ocr"] = dict(entry["ocr"], image_path=image_path)
+                timing = {"page": i + 1, "is_scanned": bool(row.get("is_scanned")), "render_s": 0.0,
+                          "ocr_s": 0.0, "total_s": 0.0, "reused": True}
+            else:
+                entry, timing, layout = next(results)
+                # pages may come from worker processes: record their own timings
+                observe("ingest.page", timing["total_s"], page=timing["page"], ocr=timing["is_scanned"])
+                if timing["is_scanned"]:
+                    observe("ingest.ocr", timing["ocr_s"], page=timing["page"])
+            timings.append(timing)
+            layouts.append(layout)
+            yield entry
+
+    with profile("extract_pdf"), span("ingest.extract_pdf", pdf=os.path.basename(pdf_path),
+                                      pages=n_pages, reused=len(reused), workers=workers):
+        # the stored fingerprints describe the old pages file; forget them until the new one is complete
+        drop_fingerprints(out_dir)
+        save_rows(pages_path, rows())
+        save_jsonl(timings_jsonl, timings)
+        # written after the pages file: load_layout ignores a sidecar older than the pages
+        save_layout(os.path.join(out_dir, LAYOUT_FILE), layouts)
+        save_fingerprints(out_dir, file_sha1, os.path.abspath(pdf_path), params, fps)
+    wall_s = time.perf_counter() - t_start
+
+    n_scanned = sum(1 for t in timings if t["is_scanned"] and not t.get("reused"))
+    incr("ingest.pages", len(timings) - len(reused))
+    incr("ingest.reused_pages", len(reused))
+    incr("ingest.ocr_pages", n_scanned)
+    if timings:
+        slowest = max(timings, key=lambda t: t["total_s"])
+        print(f"⏱️  {n_pages} pages ({n_scanned} OCR, {len(reused)} reused) in {wall_s:.1f}s with {workers} worker(s); "
+              f"slowest p.{slowest['page']} {slowest['total_s']:.2f}s "
+              f"(render {slowest['render_s']:.2f}s, ocr {slowest['ocr_s']:.2f}s)")
+    return pages_path
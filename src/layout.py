@@ -0,0 +1,154 @@
+# src/layout.py
+"""
+Word and block geometry of every page, in a columnar sidecar next to
+pages.jsonl (<out_dir>/layout.npz).
+
+Each word carries its box in PDF points and the character span it
+occupies in the page's text in pages.jsonl, so a chunk's character spans
+(recorded by the chunker) map straight to rectangles to highlight.
+
+On-disk layout (numpy arrays):
+    page_offsets   words of page i are rows page_offsets[i]:page_offsets[i+1]
+    boxes          float32 (n_words, 4) x0, y0, x1, y1
+    starts, ends   int32 character span in the page text (-1 if not found)
+    lines          int32 line id, unique within the page
+    blocks         int32 block row (index into block_boxes)
+    block_offsets  blocks of page i are rows block_offsets[i]:block_offsets[i+1]
+    block_boxes    float32 (n_blocks, 4)
+"""
+import os
+from collections import OrderedDict
+import numpy as np
+from src.utils import LRUCache
+
+LAYOUT_FILE = "layout.npz"
+
+
+def align_words(words: list, text: str):
+    """
+    (starts, ends) of each word in text, searched left to right. Words that
+    cannot be found (text normalised differently) get -1.
+    """
+    starts = np.full(len(words), -1, dtype=np.int32)
+    ends = np.full(len(words), -1, dtype=np.int32)
+    pos = 0
+    for k, w in enumerate(words):
+        at = text.find(w, pos)
+        if at == -1:
+            continue
+        starts[k], ends[k] = at, at + len(w)
+        pos = at + len(w)
+    return starts, ends
+
+
+def page_layout(words: list, text: str) -> dict:
+    """
+    Columnar layout of one page.
+
+    words: [(x0, y0, x1, y1, text, block_no, line_no)] in reading order;
+    text: the page text stored in pages.jsonl.
+    """
+    n = len(words)
+    boxes = np.array([w[:4] for w in words], dtype=np.float32).reshape(n, 4)
+    starts, ends = align_words([w[4] for w in words], text)
+    block_ids, lines = {}, {}
+    blocks = np.empty(n, dtype=np.int32)
+    line_ids = np.empty(n, dtype=np.int32)
+    for k, w in enumerate(words):
+        blocks[k] = block_ids.setdefault(w[5], len(block_ids))
+        line_ids[k] = lines.setdefault((w[5], w[6]), len(lines))
+    block_boxes = np.zeros((len(block_ids), 4), dtype=np.float32)
+    for b in range(len(block_ids)):
+        bb = boxes[blocks == b]
+        block_boxes[b] = (bb[:, 0].min(), bb[:, 1].min(), bb[:, 2].max(), bb[:, 3].max())
+    return {"boxes": boxes, "starts": starts, "ends": ends, "lines": line_ids,
+            "blocks": blocks, "block_boxes": block_boxes}
+
+
+def save_layout(path: str, pages: list) -> str:
+    """Write per-page layouts (in page order) as one compressed .npz."""
+    def offsets(key):
+        off = np.zeros(len(pages) + 1, dtype=np.int64)
+        for i, p in enumerate(pages):
+            off[i + 1] = off[i] + len(p[key])
+        return off
+
+    def cat(key, dtype, shape=()):
+        parts = [p[key] for p in pages]
+        return np.concatenate(parts).astype(dtype) if parts else np.zeros((0, *shape), dtype=dtype)
+
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(
+        tmp,
+        page_offsets=offsets("boxes"), boxes=cat("boxes", np.float32, (4,)),
+        starts=cat("starts", np.int32), ends=cat("ends", np.int32),
+        lines=cat("lines", np.int32), blocks=cat("blocks", np.int32),
+        block_offsets=offsets("block_boxes"), block_boxes=cat("block_boxes", np.float32, (4,)),
+    )
+    os.replace(tmp, path)
+    return path
+
+
+class Layout:
+    def __init__(self, arrays: dict):
+        for k, v in arrays.items():
+            setattr(self, k, v)
+
+    @property
+    def n_pages(self) -> int:
+        return len(self.page_offsets) - 1
+
+    def page(self, page_num: int) -> dict:
+        """Columnar layout of one 0-based page, in the form page_layout() returns."""
+        lo, hi = self.page_offsets[page_num], self.page_offsets[page_num + 1]
+        blo, bhi = self.block_offsets[page_num], self.block_offsets[page_num + 1]
+        return {"boxes": self.boxes[lo:hi], "starts": self.starts[lo:hi], "ends": self.ends[lo:hi],
+                "lines": self.lines[lo:hi], "blocks": self.blocks[lo:hi], "block_boxes": self.block_boxes[blo:bhi]}
+
+    def span_rects(self, page_num: int, start: int, end: int) -> list:
+        """
+        One (x0, y0, x1, y1) rectangle per text line covered by the words
+        overlapping text[start:end] of a 0-based page.
+        """
+        if page_num < 0 or page_num >= self.n_pages:
+            return []
+        lo, hi = self.page_offsets[page_num], self.page_offsets[page_num + 1]
+        s, e = self.starts[lo:hi], self.ends[lo:hi]
+        hit = np.flatnonzero((s >= 0) & (e > start) & (s < end))
+        rects = OrderedDict()
+        for k in hit:
+            x0, y0, x1, y1 = self.boxes[lo + k].tolist()
+            key = int(self.lines[lo + k])
+            r = rects.get(key)
+            rects[key] = (x0, y0, x1, y1) if r is None else (
+                min(r[0], x0), min(r[1], y0), max(r[2], x1), max(r[3], y1))
+        return list(rects.values())
+
+
+_MAX_LOADED = 32
+_loaded = LRUCache(_MAX_LOADED)  # path -> (mtime_ns, Layout)
+
+
+def layout_path(pages_jsonl: str) -> str:
+    return os.path.join(os.path.dirname(pages_jsonl), LAYOUT_FILE)
+
+
+def load_layout(pages_jsonl: str):
+    """
+    Cached Layout for the document of pages_jsonl, or None when there is no
+    sidecar or it is older than pages.jsonl.
+    """
+    path = layout_path(pages_jsonl)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        if mtime < os.stat(pages_jsonl).st_mtime_ns:
+            return None
+    except FileNotFoundError:
+        return None
+    hit = _loaded.get(path)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    with np.load(path) as z:
+        layout = Layout({k: z[k] for k in z.files})
+    _loaded.put(path, (mtime, layout))
+    return layout
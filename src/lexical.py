@@ -0,0 +1,175 @@
+# src/lexical.py
+"""
+BM25 inverted index over chunks, one compact .npz file per document.
+
+Dense MiniLM retrieval misses exact tokens such as part numbers, drug
+names and section ids; this index catches them, and embed_index fuses
+both result lists with reciprocal rank fusion.
+
+On-disk layout (numpy arrays in <lexical_dir>/<pdf_id>.npz):
+    terms      sorted vocabulary
+    offsets    postings of terms[i] are doc_idx/tf[offsets[i]:offsets[i+1]]
+    doc_idx    int32 row of the chunk in `ids`
+    tf         uint16 term frequency
+    doc_len    int32 tokens per chunk
+    ids        record ids (same ids as the vector store)
+"""
+import os
+import re
+from collections import Counter
+import numpy as np
+from src.utils import LRUCache
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Words, numbers and compound identifiers like "a-12", "5.2.1", "hcl/2"
+_TOKEN = re.compile(r"[0-9a-z]+(?:[-./][0-9a-z]+)*")
+
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercase tokens. Compound identifiers are kept whole and also split
+    into their parts, so "ISO-9001" matches both "iso-9001" and "9001".
+    """
+    out = []
+    for tok in _TOKEN.findall((text or "").lower()):
+        if tok in _STOPWORDS:
+            continue
+        out.append(tok)
+        if not tok.isalnum():
+            out.extend(p for p in re.split(r"[-./]", tok) if p and p not in _STOPWORDS)
+    return out
+
+
+class BM25Index:
+    def __init__(self, terms, offsets, doc_idx, tf, doc_len, ids):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_idx = doc_idx
+        self.tf = tf
+        self.doc_len = doc_len
+        self.ids = ids
+        self.avg_len = float(doc_len.mean()) if len(doc_len) else 0.0
+        self._term_pos = {t: i for i, t in enumerate(terms.tolist())}
+
+    @classmethod
+    def build(cls, records):
+        """records: iterable of (record_id, text)."""
+        postings = {}
+        ids, lengths = [], []
+        for row, (rid, text) in enumerate(records):
+            counts = Counter(tokenize(text))
+            ids.append(rid)
+            lengths.append(sum(counts.values()))
+            for term, n in counts.items():
+                postings.setdefault(term, []).append((row, min(n, 65535)))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, t in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings[t])
+        doc_idx = np.empty(offsets[-1], dtype=np.int32)
+        tf = np.empty(offsets[-1], dtype=np.uint16)
+        for i, t in enumerate(terms):
+            p = np.asarray(postings[t], dtype=np.int64).reshape(-1, 2)
+            doc_idx[offsets[i]:offsets[i + 1]] = p[:, 0]
+            tf[offsets[i]:offsets[i + 1]] = p[:, 1]
+        return cls(np.asarray(terms, dtype=str), offsets, doc_idx, tf,
+                   np.asarray(lengths, dtype=np.int32), np.asarray(ids, dtype=str))
+
+    def save(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, terms=self.terms, offsets=self.offsets, doc_idx=self.doc_idx,
+                            tf=self.tf, doc_len=self.doc_len, ids=self.ids)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as z:
+            return cls(z["terms"], z["offsets"], z["doc_idx"], z["tf"], z["doc_len"], z["ids"])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query: str, top_k: int = 20) -> list:
+        """[(record_id, bm25_score)] best first."""
+        n_docs = len(self.ids)
+        if not n_docs:
+            return []
+        scores = np.zeros(n_docs, dtype=np.float32)
+        norm = K1 * (1 - B + B * self.doc_len / max(self.avg_len, 1e-9))
+        for term in set(tokenize(query)):
+            i = self._term_pos.get(term)
+            if i is None:
+                continue
+            lo, hi = self.offsets[i], self.offsets[i + 1]
+            docs = self.doc_idx[lo:hi]
+            tf = self.tf[lo:hi].astype(np.float32)
+            df = hi - lo
+            idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tf * (K1 + 1) / (tf + norm[docs])
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        k = min(top_k, len(hits))
+        best = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        best = best[np.argsort(-scores[best])]
+        return [(str(self.ids[j]), float(scores[j])) for j in best]
+
+
+# -------------------------
+# Per-document index files
+# -------------------------
+_MAX_LOADED = 64
+_loaded = LRUCache(_MAX_LOADED)  # path -> (mtime, BM25Index)
+
+
+def index_path(lexical_dir: str, pdf_id: str) -> str:
+    return os.path.join(lexical_dir, f"{pdf_id}.npz")
+
+
+def build_lexical_index(records, lexical_dir: str, pdf_id: str) -> str:
+    """Build and save the BM25 index of one document from (id, text) records."""
+    return BM25Index.build(records).save(index_path(lexical_dir, pdf_id))
+
+
+def load_lexical_index(lexical_dir: str, pdf_id: str):
+    """Cached index for pdf_id, reloaded when the file changes; None if missing."""
+    path = index_path(lexical_dir, pdf_id)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    hit = _loaded.get(path)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    idx = BM25Index.load(path)
+    _loaded.put(path, (mtime, idx))
+    return idx
+
+
+def search_lexical(query: str, lexical_dir: str, pdf_id: str = None, top_k: int = 20) -> list:
+    """
+    BM25 hits [(record_id, score)] for one document, or merged across all
+    documents under lexical_dir when pdf_id is None.
+    """
+    if pdf_id:
+        idx = load_lexical_index(lexical_dir, pdf_id)
+        return idx.search(query, top_k) if idx else []
+    if not os.path.isdir(lexical_dir):
+        return []
+    hits = []
+    for name in os.listdir(lexical_dir):
+        if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+            idx = load_lexical_index(lexical_dir, name[:-4])
+            if idx:
+                hits.extend(idx.search(query, top_k))
+    hits.sort(key=lambda h: -h[1])
+    return hits[:top_k]
@@ -0,0 +1,102 @@
+# src/llm.py
+import json
+import asyncio
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class OllamaClient:
+    """
+    Ollama /api/generate client with a pooled keep-alive session.
+
+    Connection errors and 429/5xx answers are retried with exponential
+    backoff (backoff * 2**attempt seconds). The async methods run the
+    blocking calls in worker threads that share the same connection pool,
+    and agenerate_many() caps how many requests are in flight at once.
+    """
+
+    def __init__(self, host: str = "http://localhost:11434", pool_size: int = 16, retries: int = 3,
+                 backoff: float = 0.5, timeout: float = 180, connect_timeout: float = 5):
+        self.host = host.rstrip("/")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,  # a read timeout mid-generation is not worth repeating
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _post(self, payload: dict, timeout: float = None, stream: bool = False):
+        r = self.session.post(f"{self.host}/api/generate", json=payload, stream=stream,
+                              timeout=(self.connect_timeout, timeout or self.timeout))
+        r.raise_for_status()
+        return r
+
+    # -------------------------
+    # Blocking API
+    # -------------------------
+    def generate(self, prompt: str, model: str = "llama3.2", timeout: float = None, options: dict = None) -> str:
+        payload = {"model": model, "prompt": prompt, "stream": False}
+        if options:
+            payload["options"] = options
+        data = self._post(payload, timeout=timeout).json()
+        return data.get("response") or data.get("text") or str(data)
+
+    def stream(self, prompt: str, model: str = "llama3.2", timeout: float = None, options: dict = None):
+        """
+        Generator yielding response tokens as Ollama produces them.
+        timeout bounds the wait for each chunk, not the whole answer.
+        """
+        payload = {"model": model, "prompt": prompt, "stream": True}
+        if options:
+            payload["options"] = options
+        with self._post(payload, timeout=timeout, stream=True) as r:
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(f"Ollama error: {data['error']}")
+                token = data.get("response") or ""
+                if token:
+                    yield token
+                if data.get("done"):
+                    break
+
+    # -------------------------
+    # Async API
+    # -------------------------
+    async def agenerate(self, prompt: str, model: str = "llama3.2", timeout: float = None,
+                        options: dict = None) -> str:
+        return await asyncio.to_thread(self.generate, prompt, model, timeout, options)
+
+    async def agenerate_many(self, prompts: list, model: str = "llama3.2", concurrency: int = 4,
+                             timeout: float = None, options: dict = None, return_exceptions: bool = False) -> list:
+        """
+        Answers for all prompts, in input order, with at most `concurrency`
+        requests running at the same time.
+        """
+        sem = asyncio.Semaphore(max(1, min(concurrency, self.pool_size)))
+
+        async def one(p):
+            async with sem:
+                return await self.agenerate(p, model=model, timeout=timeout, options=options)
+
+        return await asyncio.gather(*(one(p) for p in prompts), return_exceptions=return_exceptions)
+
+    def generate_many(self, prompts: list, model: str = "llama3.2", concurrency: int = 4, **kwargs) -> list:
+        """Blocking wrapper around agenerate_many()."""
+        return asyncio.run(self.agenerate_many(prompts, model=model, concurrency=concurrency, **kwargs))
+
+    def close(self) -> None:
+        self.session.close()
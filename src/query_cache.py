@@ -0,0 +1,159 @@
+# src/query_cache.py
+"""
+Answer cache for repeated and near-duplicate questions.
+
+Entries are scoped by document, model and retrieval parameters. A lookup
+first tries the exact normalized question, then (only if a similarity
+threshold is set) the stored question whose embedding is most similar,
+if that similarity reaches the threshold and both questions contain the
+same numbers and identifiers ("section 5.2" never matches "section
+5.3", however close the embeddings are). Entries expire after ttl_s, the least recently used ones are
+evicted past max_entries, and re-indexing a document invalidates all of
+its entries (doc version bump).
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from src.embed_cache import normalize_text
+from src.lexical import tokenize
+from src.registry import registry, CONFIG
+
+
+class QueryCache:
+    def __init__(self, path: str, ttl_s: float = 7 * 86400, max_entries: int = 10_000,
+                 similarity: float = 0.0):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY, scope TEXT NOT NULL, pdf_id TEXT, doc_version INTEGER NOT NULL,"
+            " query TEXT NOT NULL, emb BLOB, answer TEXT NOT NULL, evidences TEXT NOT NULL,"
+            " out_pdf TEXT, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_scope ON answers(scope, doc_version)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_used ON answers(last_used)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS doc_versions (pdf_id TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def scope(pdf_id: str, model: str, params: dict) -> str:
+        """Everything besides the question that changes the answer."""
+        return json.dumps({"pdf_id": pdf_id, "model": model, **(params or {})}, sort_keys=True)
+
+    @staticmethod
+    def _key(scope: str, query: str) -> str:
+        return hashlib.sha1(f"{scope}\0{normalize_text(query).lower()}".encode("utf-8")).hexdigest()
+
+    def _doc_version(self, pdf_id: str) -> int:
+        row = self._conn.execute("SELECT version FROM doc_versions WHERE pdf_id=?", (pdf_id or "",)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _identifiers(query: str) -> set:
+        """Tokens with a digit in them: numbers, versions, section and standard ids."""
+        return {t for t in tokenize(query) if any(c.isdigit() for c in t)}
+
+    def _usable(self, created: float, out_pdf: str) -> bool:
+        if time.time() - created > self.ttl_s:
+            return False
+        return not out_pdf or os.path.exists(out_pdf)
+
+    def lookup(self, query: str, query_emb, pdf_id: str, model: str, params: dict = None):
+        """
+        {"answer", "evidences", "out_pdf", "match", "similarity"} or None.
+        query_emb may be None to skip the near-duplicate search, which
+        only runs when similarity > 0.
+        """
+        scope = self.scope(pdf_id, model, params)
+        key = self._key(scope, query)
+        with self._lock:
+            version = self._doc_version(pdf_id)
+            row = self._conn.execute(
+                "SELECT key, answer, evidences, out_pdf, created FROM answers WHERE key=? AND doc_version=?",
+                (key, version)).fetchone()
+            match, sim = "exact", 1.0
+            if row is None and query_emb is not None and self.similarity > 0:
+                row, sim = self._nearest(scope, version, query,
+                                         np.asarray(query_emb, dtype=np.float32).ravel())
+                match = "similar"
+            if row is None or not self._usable(row[4], row[3]):
+                return None
+            self._conn.execute("UPDATE answers SET last_used=? WHERE key=?", (time.time(), row[0]))
+            self._conn.commit()
+        return {"answer": row[1], "evidences": json.loads(row[2]), "out_pdf": row[3],
+                "match": match, "similarity": sim}
+
+    def _nearest(self, scope: str, version: int, query: str, q: np.ndarray):
+        rows = self._conn.execute(
+            "SELECT key, answer, evidences, out_pdf, created, emb, query FROM answers"
+            " WHERE scope=? AND doc_version=? AND created>=? AND emb IS NOT NULL",
+            (scope, version, time.time() - self.ttl_s)).fetchall()
+        if not rows:
+            return None, 0.0
+        mat = np.vstack([np.frombuffer(r[5], dtype=np.float32) for r in rows])
+        sims = mat @ q
+        ids = self._identifiers(query)
+        for i in np.argsort(-sims):
+            if sims[i] < self.similarity:
+                break
+            if self._identifiers(rows[i][6]) == ids:
+                return rows[i][:5], float(sims[i])
+        return None, float(sims.max())
+
+    def store(self, query: str, query_emb, pdf_id: str, model: str, params: dict,
+              answer: str, evidences: list, out_pdf: str = None) -> None:
+        scope = self.scope(pdf_id, model, params)
+        emb = None if query_emb is None else np.asarray(query_emb, dtype=np.float32).ravel().tobytes()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers"
+                " (key, scope, pdf_id, doc_version, query, emb, answer, evidences, out_pdf, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(scope, query), scope, pdf_id or "", self._doc_version(pdf_id), query, emb,
+                 answer, json.dumps(evidences, ensure_ascii=False), out_pdf, now, now))
+            self._evict(now)
+            self._conn.commit()
+
+    def invalidate(self, pdf_id: str) -> None:
+        """Drop every entry of a document (call after re-indexing it)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO doc_versions(pdf_id, version) VALUES (?, 1)"
+                " ON CONFLICT(pdf_id) DO UPDATE SET version = version + 1", (pdf_id or "",))
+            self._conn.execute("DELETE FROM answers WHERE pdf_id=?", (pdf_id or "",))
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl_s,))
+        (n,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        if n > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used ASC LIMIT ?)",
+                (n - self.max_entries,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+
+registry.register("query_cache", lambda: QueryCache(
+    CONFIG["query_cache_path"], ttl_s=CONFIG["query_cache_ttl_s"],
+    max_entries=CONFIG["query_cache_max_entries"], similarity=CONFIG["query_cache_similarity"]))
+
+
+def get_query_cache() -> QueryCache:
+    return registry.get("query_cache")
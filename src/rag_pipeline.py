@@ -1,18 +1,38 @@
-import os, json, time
+import os, json, time, uuid, asyncio
 from pathlib import Path
-from src.embed_index import query_index
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future
+from src.embed_index import query_index, query_index_batch, hybrid_query, hybrid_query_batch, encode_texts
+from src.query_cache import get_query_cache
 from src.highlight import highlight_pdf
-import requests
+from src.rerank import rerank as rerank_chunks
+from src.context import assemble, context_budget
+from src.artifacts import artifact_path, first_row
+from src.llm import OllamaClient
+from src.registry import registry, CONFIG
+from src.telemetry import span, span_iter, observe, incr, profile
 
-# Ollama backend
-OLLAMA_HOST = "http://localhost:11434"
+# Ollama backend: one pooled client per process. Set CONFIG["ollama_host"]
+# (env OLLAMA_HOST) to src/stub_ollama.py's address for local tests.
+registry.register("llm_client", lambda: OllamaClient(
+    CONFIG["ollama_host"], pool_size=CONFIG["llm_pool_size"], retries=CONFIG["llm_retries"]))
 
 
-def build_prompt(query: str, docs: list, metas: list, top_k: int = 3) -> str:
+def get_llm_client() -> OllamaClient:
+    return registry.get("llm_client")
+
+# Background worker for highlighting while tokens are streamed
+_highlight_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="highlight")
+
+
+def build_prompt(query: str, docs: list, metas: list, top_k: int = 3, model: str = None) -> str:
+    """
+    Prompt with the top_k chunks as sources, deduplicated, merged and cut
+    to the context budget of `model` (see src/context.py).
+    """
     blocks = []
-    for i, (doc, meta) in enumerate(zip(docs[:top_k], metas[:top_k]), 1):
-        page_no = meta.get("page") or meta.get("page_start") or "?"
-        blocks.append(f"[Source {i} | p.{page_no}]: {doc.strip()}\n")
+    for i, (page_no, text) in enumerate(assemble(query, docs[:top_k], metas[:top_k], model=model), 1):
+        blocks.append(f"[Source {i} | p.{page_no}]: {text}\n")
     context_text = "\n---\n".join(blocks)
 
     prompt = f"""
@@ -31,39 +51,90 @@ Answer (with citations):
 
 
 def generate_with_ollama(prompt: str, model: str = "llama3.2", timeout: int = 180) -> str:
-    url = f"{OLLAMA_HOST}/api/generate"
-    payload = {"model": model, "prompt": prompt, "stream": False}
+    with span("llm.generate", model=model, prompt_chars=len(prompt)):
+        return get_llm_client().generate(prompt, model=model, timeout=timeout)
+
+
+def stream_with_ollama(prompt: str, model: str = "llama3.2", timeout: int = 180):
+    """
+    Generator yielding response tokens as Ollama produces them.
+    timeout bounds the wait for each chunk, not the whole answer.
+    """
+    return span_iter("llm.stream", get_llm_client().stream(prompt, model=model, timeout=timeout),
+                     model=model, prompt_chars=len(prompt))
+
+
+async def agenerate_many_with_ollama(prompts: list, model: str = "llama3.2", concurrency: int = None,
+                                     timeout: int = 180, return_exceptions: bool = False) -> list:
+    """
+    Answers for many prompts, in order, with at most `concurrency`
+    (default CONFIG["llm_concurrency"]) requests in flight.
+    """
+    return await get_llm_client().agenerate_many(
+        prompts, model=model, concurrency=concurrency or CONFIG["llm_concurrency"],
+        timeout=timeout, return_exceptions=return_exceptions)
 
-    r = requests.post(url, json=payload, timeout=timeout)
-    r.raise_for_status()
-    data = r.json()
-    return data.get("response") or data.get("text") or str(data)
 
+def _n_candidates(top_k: int, rerank: bool) -> int:
+    return max(CONFIG["rerank_candidates"], top_k) if rerank else top_k
 
-def ask_ollama(query: str, top_k: int = 3, model: str = "llama3.2"):
-    res = query_index(query, top_k=top_k)
-    docs = (res.get("documents") or [[]])[0]
-    metas = (res.get("metadatas") or [[]])[0]
-    distances = (res.get("distances") or [[]])[0]
 
-    prompt = build_prompt(query, docs, metas, top_k=top_k)
+def _maybe_rerank(query: str, results: dict, top_k: int, rerank: bool) -> dict:
+    if not rerank:
+        return results
+    with span("rag.rerank", candidates=len(results["documents"])):
+        return rerank_chunks(query, results["documents"], results["metadatas"], keep=top_k,
+                             budget_s=CONFIG["rerank_budget_s"], distances=results["distances"])
+
+
+def _retrieve(query: str, top_k: int, pdf_id: str = None, page_range: tuple = None, rerank: bool = None) -> dict:
+    """
+    Top-k chunks for one query. With rerank (default CONFIG["rerank"]) a
+    wider candidate set is retrieved and cut to top_k by the cross-encoder.
+    """
+    rerank = CONFIG["rerank"] if rerank is None else rerank
+    search = hybrid_query if CONFIG["retrieval"] == "hybrid" else query_index
+    with span("rag.retrieve", retrieval=CONFIG["retrieval"]):
+        res = search(query, top_k=_n_candidates(top_k, rerank), pdf_id=pdf_id, page_range=page_range)
+    results = {
+        "documents": (res.get("documents") or [[]])[0],
+        "metadatas": (res.get("metadatas") or [[]])[0],
+        "distances": (res.get("distances") or [[]])[0],
+    }
+    return _maybe_rerank(query, results, top_k, rerank)
+
+
+def ask_ollama(query: str, top_k: int = 3, model: str = "llama3.2", pdf_id: str = None, page_range: tuple = None,
+               rerank: bool = None):
+    results = _retrieve(query, top_k, pdf_id=pdf_id, page_range=page_range, rerank=rerank)
+    with span("rag.build_prompt"):
+        prompt = build_prompt(query, results["documents"], results["metadatas"], top_k=top_k, model=model)
     answer = generate_with_ollama(prompt, model=model)
-    return answer, {"documents": docs, "metadatas": metas, "distances": distances}
+    return answer, results
 
 
-def answer_query(processed_folder: str | Path, query: str, top_k: int = 3, model: str = "llama3.2"):
-    processed_folder = Path(processed_folder)
-    pages_jsonl = processed_folder / "pages.jsonl"
-    if not pages_jsonl.exists():
-        raise FileNotFoundError(f"pages.jsonl not found at: {pages_jsonl}")
+def ask_ollama_stream(query: str, top_k: int = 3, model: str = "llama3.2", pdf_id: str = None,
+                      page_range: tuple = None, rerank: bool = None):
+    """
+    Like ask_ollama, but returns (token_generator, results). Retrieval runs
+    before returning; generation starts when the generator is consumed.
+    """
+    results = _retrieve(query, top_k, pdf_id=pdf_id, page_range=page_range, rerank=rerank)
+    with span("rag.build_prompt"):
+        prompt = build_prompt(query, results["documents"], results["metadatas"], top_k=top_k, model=model)
+    return stream_with_ollama(prompt, model=model), results
+
+
+def _resolve_pdf_path(processed_folder: Path) -> str:
+    pages_path = Path(artifact_path(processed_folder, "pages"))
+    if not pages_path.exists():
+        raise FileNotFoundError(f"pages file not found at: {pages_path}")
 
     # detect original PDF path
-    with open(pages_jsonl, "r", encoding="utf-8") as f:
-        first = f.readline().strip()
-        if not first:
-            raise ValueError("pages.jsonl is empty")
-        info = json.loads(first)
-        pdf_path = info.get("pdf_path")
+    info = first_row(str(pages_path))
+    if not info:
+        raise ValueError(f"{pages_path.name} is empty")
+    pdf_path = info.get("pdf_path")
 
     if not pdf_path or not Path(pdf_path).exists():
         cand = list(processed_folder.glob("*.pdf"))
@@ -75,21 +146,206 @@ def answer_query(processed_folder: str | Path, query: str, top_k: int = 3, model
                 pdf_path = str(raw_cand)
             else:
                 raise FileNotFoundError("Cannot find original PDF for processed folder: " + str(processed_folder))
+    return pdf_path
 
-    # 1) LLM query
-    answer, results = ask_ollama(query, top_k=top_k, model=model)
 
-    # 2) evidences
+def _evidences(results: dict, top_k: int) -> list:
     docs = results.get("documents", [])
     metas = results.get("metadatas", [])
     evidences = []
     for d, m in zip(docs[:top_k], metas[:top_k]):
         page_no = m.get("page") or m.get("page_start") or 1
-        evidences.append({"snippet": d, "page": int(page_no)})
+        ev = {"snippet": d, "page": int(page_no)}
+        if m.get("spans"):
+            ev["spans"] = json.loads(m["spans"])
+        evidences.append(ev)
+    return evidences
 
-    # 3) highlight and save
+
+def _highlight(processed_folder: Path, pdf_path: str, evidences: list) -> str:
     os.makedirs("outputs", exist_ok=True)
-    out_pdf = os.path.join("outputs", f"annotated_{processed_folder.name}_{int(time.time())}.pdf")
-    highlight_pdf(pdf_path, str(pages_jsonl), evidences, out_pdf)
+    # unique per call: concurrent service requests must not overwrite each other's highlights
+    out_pdf = os.path.join("outputs", f"annotated_{processed_folder.name}_{int(time.time())}_{uuid.uuid4().hex[:12]}.pdf")
+    with span("rag.highlight", evidences=len(evidences)):
+        highlight_pdf(pdf_path, artifact_path(processed_folder, "pages"), evidences, out_pdf)
+    return out_pdf
+
+
+def _cache_params(top_k: int, page_range: tuple, rerank: bool, model: str) -> dict:
+    return {
+        "top_k": top_k,
+        "page_range": list(page_range) if page_range else None,
+        "rerank": CONFIG["rerank"] if rerank is None else bool(rerank),
+        "retrieval": CONFIG["retrieval"],
+        "context_tokens": context_budget(model),
+        "context_select": CONFIG["context_select"],
+    }
+
+
+def _cache_lookup(query: str, pdf_id: str, model: str, params: dict):
+    """(cached entry or None, query embedding)."""
+    with span("rag.cache_lookup") as sp:
+        q_emb = encode_texts([query])[0]
+        hit = get_query_cache().lookup(query, q_emb, pdf_id, model, params)
+        sp.set(hit=hit["match"] if hit else None)
+    incr("query_cache.hits" if hit else "query_cache.misses")
+    return hit, q_emb
+
+
+def answer_query(processed_folder: str | Path, query: str, top_k: int = 3, model: str = "llama3.2",
+                 page_range: tuple = None, rerank: bool = None, use_cache: bool = None):
+    """
+    Answer a question about one processed PDF. Retrieval is restricted to
+    that document (pdf_id = folder name, as used by the index scripts) and
+    optionally to an inclusive (first_page, last_page) range.
+
+    With use_cache (default CONFIG["query_cache"]) repeated or
+    near-duplicate questions return the stored answer, evidences and
+    annotated PDF without retrieval, generation or highlighting.
+    """
+    processed_folder = Path(processed_folder)
+    with profile("answer_query"), span("rag.answer_query", pdf_id=processed_folder.name, top_k=top_k):
+        return _answer_query(processed_folder, query, top_k, model, page_range, rerank, use_cache)
+
 
+def _answer_query(processed_folder: Path, query: str, top_k: int, model: str,
+                  page_range: tuple, rerank: bool, use_cache: bool):
+    pdf_id = processed_folder.name
+    use_cache = CONFIG["query_cache"] if use_cache is None else use_cache
+    if use_cache:
+        params = _cache_params(top_k, page_range, rerank, model)
+        hit, q_emb = _cache_lookup(query, pdf_id, model, params)
+        if hit:
+            return hit["answer"], hit["evidences"], hit["out_pdf"]
+
+    pdf_path = _resolve_pdf_path(processed_folder)
+
+    # 1) LLM query
+    answer, results = ask_ollama(query, top_k=top_k, model=model,
+                                 pdf_id=pdf_id, page_range=page_range, rerank=rerank)
+
+    # 2) evidences
+    evidences = _evidences(results, top_k)
+
+    # 3) highlight and save
+    out_pdf = _highlight(processed_folder, pdf_path, evidences)
+
+    if use_cache:
+        get_query_cache().store(query, q_emb, pdf_id, model, params, answer, evidences, out_pdf)
     return answer, evidences, out_pdf
+
+
+def answer_query_stream(processed_folder: str | Path, query: str, top_k: int = 3, model: str = "llama3.2",
+                        page_range: tuple = None, rerank: bool = None, use_cache: bool = None):
+    """
+    Streaming version of answer_query.
+
+    Returns (tokens, evidences, pdf_future): retrieval is done when this
+    returns, highlighting already runs in the background, and tokens is a
+    generator that yields the answer as Ollama writes it. Call
+    pdf_future.result() for the annotated PDF path. A cache hit yields the
+    stored answer as a single token; a fully streamed answer is cached.
+    """
+    processed_folder = Path(processed_folder)
+    with span("rag.answer_query_stream", pdf_id=processed_folder.name, top_k=top_k):
+        return _answer_query_stream(processed_folder, query, top_k, model, page_range, rerank, use_cache)
+
+
+def _answer_query_stream(processed_folder: Path, query: str, top_k: int, model: str,
+                         page_range: tuple, rerank: bool, use_cache: bool):
+    pdf_id = processed_folder.name
+    use_cache = CONFIG["query_cache"] if use_cache is None else use_cache
+    if use_cache:
+        params = _cache_params(top_k, page_range, rerank, model)
+        hit, q_emb = _cache_lookup(query, pdf_id, model, params)
+        if hit:
+            done = Future()
+            done.set_result(hit["out_pdf"])
+            return iter([hit["answer"]]), hit["evidences"], done
+
+    pdf_path = _resolve_pdf_path(processed_folder)
+
+    tokens, results = ask_ollama_stream(query, top_k=top_k, model=model,
+                                        pdf_id=pdf_id, page_range=page_range, rerank=rerank)
+    evidences = _evidences(results, top_k)
+    pdf_future = _highlight_pool.submit(_highlight, processed_folder, pdf_path, evidences)
+    if not use_cache:
+        return tokens, evidences, pdf_future
+
+    def tokens_then_store():
+        parts = []
+        for tok in tokens:
+            parts.append(tok)
+            yield tok
+        get_query_cache().store(query, q_emb, pdf_id, model, params, "".join(parts), evidences,
+                                pdf_future.result())
+
+    return tokens_then_store(), evidences, pdf_future
+
+
+def answer_batch(questions: list, top_k: int = 3, model: str = "llama3.2", pdf_id: str = None,
+                 page_range: tuple = None, concurrency: int = None, rerank: bool = None) -> list:
+    """
+    Answer many questions with shared retrieval and concurrent generation.
+
+    questions are strings or dicts {"question": ..., "pdf_id": ...}; a
+    per-question pdf_id overrides the pdf_id argument. Questions are
+    grouped by document and each group is retrieved with one batched
+    encode + store query (hybrid_query_batch or query_index_batch), then
+    optionally reranked per question. Returns one row per question, in input order,
+    with answer, evidences and timings (seconds); failed generations carry
+    an "error" field instead of an answer.
+    """
+    items = [q if isinstance(q, dict) else {"question": q} for q in questions]
+    groups = {}
+    for i, item in enumerate(items):
+        groups.setdefault(item.get("pdf_id") or pdf_id, []).append(i)
+
+    rerank = CONFIG["rerank"] if rerank is None else rerank
+    rows = [None] * len(items)
+    prompts = [None] * len(items)
+    for gid, idxs in groups.items():
+        t0 = time.perf_counter()
+        search = hybrid_query_batch if CONFIG["retrieval"] == "hybrid" else query_index_batch
+        res = search([items[i]["question"] for i in idxs], top_k=_n_candidates(top_k, rerank),
+                     pdf_id=gid, page_range=page_range)
+        retrieve_s = (time.perf_counter() - t0) / len(idxs)
+        for pos, i in enumerate(idxs):
+            results = {
+                "documents": (res.get("documents") or [])[pos],
+                "metadatas": (res.get("metadatas") or [])[pos],
+                "distances": (res.get("distances") or [[]] * len(idxs))[pos],
+            }
+            t1 = time.perf_counter()
+            results = _maybe_rerank(items[i]["question"], results, top_k, rerank)
+            rerank_s = time.perf_counter() - t1
+            prompts[i] = build_prompt(items[i]["question"], results["documents"], results["metadatas"],
+                                      top_k=top_k, model=model)
+            rows[i] = {
+                "question": items[i]["question"],
+                "pdf_id": gid,
+                "evidences": _evidences(results, top_k),
+                "timings": {"retrieve_s": retrieve_s, "rerank_s": rerank_s},
+            }
+
+    client = get_llm_client()
+    # more in flight than the client's connection pool would only queue inside urllib3
+    sem = asyncio.Semaphore(max(1, min(concurrency or CONFIG["llm_concurrency"], client.pool_size)))
+
+    async def generate(i):
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                rows[i]["answer"] = await client.agenerate(prompts[i], model=model)
+            except Exception as e:
+                rows[i]["error"] = f"{type(e).__name__}: {e}"
+            rows[i]["timings"]["generate_s"] = time.perf_counter() - t0
+            # tasks interleave on one thread, so record the duration instead of a nested span
+            observe("llm.generate", rows[i]["timings"]["generate_s"], model=model, batch=True)
+
+    async def generate_all():
+        await asyncio.gather(*(generate(i) for i in range(len(items))))
+
+    with span("rag.answer_batch.generate", n=len(items)):
+        asyncio.run(generate_all())
+    return rows
@@ -0,0 +1,124 @@
+# src/registry.py
+import os
+import threading
+
+# -------------------------
+# Configuration (override with environment variables)
+# -------------------------
+CONFIG = {
+    "chroma_dir": os.environ.get("RAG_CHROMA_DIR", "data/index/chroma"),
+    "collection_name": os.environ.get("RAG_COLLECTION", "pdf_chunks"),
+    "embed_model_name": os.environ.get("RAG_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+    "embed_cache_path": os.environ.get("RAG_EMBED_CACHE", "data/index/embed_cache.sqlite3"),
+    "embed_cache_max_entries": int(os.environ.get("RAG_EMBED_CACHE_MAX", "200000")),
+    # vector store backend: "chroma", "numpy" (flat mmap) or "faiss"
+    "vector_backend": os.environ.get("RAG_VECTOR_BACKEND", "chroma"),
+    "vector_dir": os.environ.get("RAG_VECTOR_DIR", "data/index/vectors"),
+    # numpy store only: store float16 / int8 vectors; int8 is rescored against float16 unless RAG_VECTOR_RESCORE=0
+    "vector_dtype": os.environ.get("RAG_VECTOR_DTYPE", "float32"),  # float32 | float16 | int8
+    "vector_rescore": os.environ.get("RAG_VECTOR_RESCORE", "1") == "1",
+    "faiss_index": os.environ.get("RAG_FAISS_INDEX", "flat"),  # flat | ivf | ivfpq
+    "faiss_nlist": int(os.environ.get("RAG_FAISS_NLIST", "1024")),
+    "faiss_pq_m": int(os.environ.get("RAG_FAISS_PQ_M", "16")),
+    "faiss_nprobe": int(os.environ.get("RAG_FAISS_NPROBE", "16")),
+    # pages / chunks artifacts: "jsonl" or "rec" (indexed binary records, src/artifacts.py)
+    "artifact_format": os.environ.get("RAG_ARTIFACT_FORMAT", "jsonl"),
+    "lexical_dir": os.environ.get("RAG_LEXICAL_DIR", "data/index/lexical"),
+    # "hybrid" (dense + BM25, RRF) or "dense"
+    "retrieval": os.environ.get("RAG_RETRIEVAL", "hybrid"),
+    # cross-encoder rerank between retrieval and prompt building (off by default)
+    "rerank": os.environ.get("RAG_RERANK", "0") == "1",
+    "rerank_model_name": os.environ.get("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+    "rerank_candidates": int(os.environ.get("RAG_RERANK_CANDIDATES", "20")),
+    "rerank_budget_s": float(os.environ.get("RAG_RERANK_BUDGET_S", "1.0")),
+    # answer cache for repeated / near-duplicate questions
+    "query_cache": os.environ.get("RAG_QUERY_CACHE", "1") == "1",
+    "query_cache_path": os.environ.get("RAG_QUERY_CACHE_PATH", "data/index/query_cache.sqlite3"),
+    "query_cache_ttl_s": float(os.environ.get("RAG_QUERY_CACHE_TTL_S", str(7 * 86400))),
+    "query_cache_max_entries": int(os.environ.get("RAG_QUERY_CACHE_MAX", "10000")),
+    # near-duplicate matching on question embeddings, off unless set (e.g. 0.95)
+    "query_cache_similarity": float(os.environ.get("RAG_QUERY_CACHE_SIMILARITY", "0")),
+    # prompt context: token budget (0 = per-model default in src/context.py) and sentence selection
+    "context_tokens": int(os.environ.get("RAG_CONTEXT_TOKENS", "0")),
+    "context_select": os.environ.get("RAG_CONTEXT_SELECT", "1") == "1",
+    # query service (src/service.py); clients use it when service_url is set
+    "service_url": os.environ.get("RAG_SERVICE_URL", ""),
+    "service_batch_wait_ms": float(os.environ.get("RAG_SERVICE_BATCH_WAIT_MS", "5")),
+    "service_max_batch": int(os.environ.get("RAG_SERVICE_MAX_BATCH", "64")),
+    "ollama_host": os.environ.get("OLLAMA_HOST", "http://localhost:11434"),
+    "llm_pool_size": int(os.environ.get("RAG_LLM_POOL", "16")),
+    "llm_retries": int(os.environ.get("RAG_LLM_RETRIES", "3")),
+    "llm_concurrency": int(os.environ.get("RAG_LLM_CONCURRENCY", "4")),
+    # span timers / counters (src/telemetry.py), off unless RAG_TELEMETRY=1
+    "telemetry": os.environ.get("RAG_TELEMETRY", "0") == "1",
+    "telemetry_path": os.environ.get("RAG_TELEMETRY_PATH", ""),  # JSONL span log, "" = memory only
+    "profile": os.environ.get("RAG_PROFILE", ""),  # "", "cprofile" or "pyinstrument"
+    "profile_dir": os.environ.get("RAG_PROFILE_DIR", "outputs/profiles"),
+}
+
+
+class Registry:
+    """
+    Lazily created, process-wide shared resources.
+
+    Factories are registered by name and only run the first time get() is
+    called, so importing a module that needs a model or a DB client costs
+    nothing until that resource is actually used.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory) -> None:
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def get(self, name: str):
+        inst = self._instances.get(name)
+        if inst is not None:
+            return inst
+        with self._lock:
+            if name not in self._instances:
+                if name not in self._factories:
+                    raise KeyError(f"No resource registered under '{name}'")
+                self._instances[name] = self._factories[name]()
+            return self._instances[name]
+
+    def factory(self, name: str):
+        """The factory currently registered under name."""
+        with self._lock:
+            if name not in self._factories:
+                raise KeyError(f"No resource registered under '{name}'")
+            return self._factories[name]
+
+    def wrap(self, name: str, wrapper) -> None:
+        """Re-register name so that get() returns wrapper(instance built by the current factory)."""
+        with self._lock:
+            inner = self._factories[name]
+            self.register(name, lambda: wrapper(inner()))
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def reset(self, name: str = None) -> None:
+        """Drop one (or every) created instance; the next get() rebuilds it."""
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+
+registry = Registry()
+
+
+def configure(**overrides) -> None:
+    """Change config values (paths, model names) and drop already built resources."""
+    unknown = set(overrides) - set(CONFIG)
+    if unknown:
+        raise KeyError(f"Unknown config keys: {sorted(unknown)}")
+    CONFIG.update(overrides)
+    registry.reset()
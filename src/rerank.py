@@ -0,0 +1,77 @@
+# src/rerank.py
+"""
+Optional cross-encoder rerank stage between retrieval and build_prompt.
+
+A wider candidate set is scored in batches by a small CPU cross-encoder
+and only the best `keep` chunks go to the prompt. Scoring stops when the
+time budget is spent; candidates that were not scored keep their
+retrieval order behind the scored ones. Scores are cached per
+(model, query, chunk text) so repeated questions cost nothing.
+"""
+import time
+import hashlib
+from src.registry import registry, CONFIG
+from src.utils import LRUCache
+
+
+def _make_reranker():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(CONFIG["rerank_model_name"], device="cpu")
+
+
+registry.register("reranker", _make_reranker)
+
+
+class ScoreCache(LRUCache):
+    """In-process LRU of cross-encoder scores keyed by (model, query, chunk)."""
+
+    def __init__(self, maxsize: int = 50_000):
+        super().__init__(maxsize)
+
+    @staticmethod
+    def key(model: str, query: str, text: str) -> str:
+        h = hashlib.sha1()
+        for part in (model, " ".join(query.lower().split()), text):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+
+score_cache = ScoreCache()
+
+
+def rerank(query: str, docs: list, metas: list, keep: int = 3, budget_s: float = 1.0,
+           batch_size: int = 16, distances: list = None) -> dict:
+    """
+    Reorder retrieved chunks by cross-encoder relevance and keep the best.
+
+    Returns {"documents", "metadatas", "distances", "rerank_scores"}
+    (scores are None for chunks not scored within budget_s).
+    """
+    distances = distances if distances is not None else [None] * len(docs)
+    model_name = CONFIG["rerank_model_name"]
+    keys = [ScoreCache.key(model_name, query, d or "") for d in docs]
+    scores = [score_cache.get(k) for k in keys]
+
+    # one model call per distinct (query, chunk) pair still missing
+    todo = list(dict.fromkeys(keys[i] for i, s in enumerate(scores) if s is None))
+    if todo:
+        text_of = {k: docs[i] or "" for i, k in enumerate(keys)}
+        model = registry.get("reranker")
+        deadline = time.perf_counter() + budget_s
+        for start in range(0, len(todo), batch_size):
+            if start and time.perf_counter() >= deadline:
+                break  # budget spent: remaining candidates keep retrieval order
+            part = todo[start:start + batch_size]
+            batch_scores = model.predict([(query, text_of[k]) for k in part], batch_size=batch_size)
+            for k, s in zip(part, batch_scores):
+                score_cache.put(k, float(s))
+        scores = [score_cache.get(k) if s is None else s for k, s in zip(keys, scores)]
+
+    order = sorted(range(len(docs)), key=lambda i: (scores[i] is None, -(scores[i] or 0.0), i))[:keep]
+    return {
+        "documents": [docs[i] for i in order],
+        "metadatas": [metas[i] for i in order],
+        "distances": [distances[i] for i in order],
+        "rerank_scores": [scores[i] for i in order],
+    }
@@ -0,0 +1,309 @@
+# src/service.py
+"""
+Long-running query service: keeps the embedding model, vector store and
+LLM client warm and answers over HTTP/JSON.
+
+    python scripts/serve.py --port 8765
+    RAG_SERVICE_URL=http://127.0.0.1:8765 streamlit run scripts/app.py
+
+Endpoints:
+    GET  /health            {"status": "ok", "uptime_s": ...}
+    GET  /docs              processed documents [{"pdf_id", "n_pages"}]
+    POST /query             {"query", "top_k", "pdf_id", "page_range"} -> retrieval results
+    POST /answer            {"pdf_id", "query", "top_k", "model", "page_range", "rerank", "use_cache"}
+                            -> {"answer", "evidences", "pdf"}
+    POST /answer?stream=1   NDJSON: {"evidences"}, then {"token"} lines, then {"done", "pdf"}
+    GET  /pdfs/<name>       annotated PDF referenced by "pdf" above
+    GET  /metrics           Prometheus text (src/telemetry.py)
+
+Concurrent requests run on separate threads; their embedding calls are
+merged by MicroBatchEncoder into one model.encode() call.
+"""
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from src.embed_index import query_index, hybrid_query, get_store, get_embed_model
+from src.rag_pipeline import answer_query, answer_query_stream, get_llm_client
+from src.artifacts import artifact_path, first_row
+from src.registry import registry, CONFIG
+from src.telemetry import span, incr, prometheus_text
+
+
+class MicroBatchEncoder:
+    """
+    Wraps a SentenceTransformer so that encode() calls arriving from many
+    threads within max_wait_ms are run as one batch. Calls that already
+    hold max_batch texts go straight to the model.
+    """
+
+    def __init__(self, model, max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_ms / 1000.0
+        self._queue = []  # (texts, kwargs key, kwargs, future)
+        self._cond = threading.Condition()
+        threading.Thread(target=self._worker, name="encode-batcher", daemon=True).start()
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, **kwargs):
+        texts = list(texts)
+        if len(texts) >= self.max_batch:
+            return self.model.encode(texts, **kwargs)
+        fut = Future()
+        with self._cond:
+            self._queue.append((texts, tuple(sorted(kwargs.items())), kwargs, fut))
+            self._cond.notify()
+        return fut.result()
+
+    def _take_batch(self) -> list:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_wait_s
+            while sum(len(q[0]) for q in self._queue) < self.max_batch:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            # one batch = requests with the same encode() options, up to max_batch texts
+            key = self._queue[0][1]
+            batch, rest, n = [], [], 0
+            for q in self._queue:
+                if q[1] == key and (not batch or n + len(q[0]) <= self.max_batch):
+                    batch.append(q)
+                    n += len(q[0])
+                else:
+                    rest.append(q)
+            self._queue = rest
+            return batch
+
+    def _worker(self):
+        while True:
+            batch = self._take_batch()
+            texts = [t for q in batch for t in q[0]]
+            try:
+                with span("service.encode_batch", requests=len(batch), n=len(texts)):
+                    out = self.model.encode(texts, **batch[0][2])
+            except Exception as e:
+                for q in batch:
+                    q[3].set_exception(e)
+                continue
+            incr("service.encode_batches")
+            incr("service.encode_requests", len(batch))
+            pos = 0
+            for q in batch:
+                q[3].set_result(out[pos:pos + len(q[0])])
+                pos += len(q[0])
+
+
+def _to_json(obj) -> bytes:
+    # numpy scalars/arrays from the vector stores
+    return json.dumps(obj, ensure_ascii=False, default=lambda o: o.tolist() if hasattr(o, "tolist") else str(o)
+                      ).encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # -------------------------
+    # Responses
+    # -------------------------
+    def _send(self, status: int, body: bytes, ctype: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, obj, status: int = 200):
+        self._send(status, _to_json(obj))
+
+    def _error(self, status: int, message: str):
+        self._json({"error": message}, status)
+
+    def _write_chunk(self, obj):
+        data = _to_json(obj) + b"\n"
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    # -------------------------
+    # Routing
+    # -------------------------
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            self._json({"status": "ok", "uptime_s": round(time.time() - self.server.started, 1)})
+        elif url.path == "/docs":
+            self._json(self.server.list_docs())
+        elif url.path.startswith("/pdfs/"):
+            self._send_pdf(url.path[len("/pdfs/"):])
+        elif url.path == "/metrics":
+            self._send(200, prometheus_text().encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._error(404, f"not found: {url.path}")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        try:
+            body = self._body()
+        except json.JSONDecodeError as e:
+            self._error(400, f"invalid JSON: {e}")
+            return
+        try:
+            if url.path == "/query":
+                self._query(body)
+            elif url.path == "/answer":
+                stream = parse_qs(url.query).get("stream", ["0"])[0] == "1" or body.get("stream")
+                self._answer_stream(body) if stream else self._answer(body)
+            else:
+                self._error(404, f"not found: {url.path}")
+        except (KeyError, ValueError) as e:
+            self._error(400, f"{type(e).__name__}: {e}")
+        except FileNotFoundError as e:
+            self._error(404, str(e))
+        except Exception as e:
+            self._error(500, f"{type(e).__name__}: {e}")
+
+    # -------------------------
+    # Handlers
+    # -------------------------
+    def _query(self, body: dict):
+        search = hybrid_query if CONFIG["retrieval"] == "hybrid" else query_index
+        with span("service.query"):
+            res = search(body["query"], top_k=int(body.get("top_k", 5)), pdf_id=body.get("pdf_id"),
+                         page_range=tuple(body["page_range"]) if body.get("page_range") else None)
+        self._json(res)
+
+    def _answer_args(self, body: dict) -> dict:
+        return {
+            "processed_folder": self.server.doc_folder(body["pdf_id"]),
+            "query": body["query"],
+            "top_k": int(body.get("top_k", 3)),
+            "model": body.get("model") or "llama3.2",
+            "page_range": tuple(body["page_range"]) if body.get("page_range") else None,
+            "rerank": body.get("rerank"),
+            "use_cache": body.get("use_cache"),
+        }
+
+    def _answer(self, body: dict):
+        with span("service.answer"):
+            answer, evidences, out_pdf = answer_query(**self._answer_args(body))
+        self._json({"answer": answer, "evidences": evidences, "pdf": self.server.pdf_ref(out_pdf)})
+
+    def _answer_stream(self, body: dict):
+        tokens, evidences, pdf_future = answer_query_stream(**self._answer_args(body))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk({"evidences": evidences})
+        try:
+            for tok in tokens:
+                self._write_chunk({"token": tok})
+            self._write_chunk({"done": True, "pdf": self.server.pdf_ref(pdf_future.result())})
+        except Exception as e:
+            # headers are already sent: report the error in the stream
+            self._write_chunk({"done": True, "error": f"{type(e).__name__}: {e}"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_pdf(self, name: str):
+        path = self.server.pdf_path(name)
+        if path is None:
+            self._error(404, f"no such PDF: {name}")
+            return
+        with open(path, "rb") as f:
+            self._send(200, f.read(), "application/pdf")
+
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, processed_root: str = "data/processed", outputs_dir: str = "outputs"):
+        super().__init__(address, _Handler)
+        self.processed_root = Path(processed_root)
+        self.outputs_dir = os.path.realpath(outputs_dir)
+        self.started = time.time()
+
+    def doc_folder(self, pdf_id: str) -> Path:
+        folder = self.processed_root / pdf_id
+        if not pdf_id or Path(pdf_id).name != pdf_id or not os.path.exists(artifact_path(folder, "pages")):
+            raise FileNotFoundError(f"unknown document: {pdf_id}")
+        return folder
+
+    def list_docs(self) -> list:
+        docs = []
+        if self.processed_root.is_dir():
+            for p in sorted(self.processed_root.iterdir()):
+                pages_path = artifact_path(p, "pages")
+                if os.path.exists(pages_path):
+                    docs.append({"pdf_id": p.name, "n_pages": (first_row(pages_path) or {}).get("n_pages")})
+        return docs
+
+    def pdf_ref(self, out_pdf: str) -> str:
+        """URL path the client fetches an annotated PDF from."""
+        return f"/pdfs/{os.path.basename(out_pdf)}" if out_pdf else None
+
+    def pdf_path(self, name: str):
+        """Annotated PDF for a /pdfs/ name; only files directly inside outputs_dir are served."""
+        path = os.path.realpath(os.path.join(self.outputs_dir, name))
+        if os.path.dirname(path) != self.outputs_dir or not path.endswith(".pdf") or not os.path.isfile(path):
+            return None
+        return path
+
+
+_lock = threading.Lock()
+
+
+def install_micro_batching() -> None:
+    """
+    Put MicroBatchEncoder in front of the registered embedding model,
+    unless the registered factory already does (a newly registered
+    model gets wrapped again).
+    """
+    with _lock:
+        inner = registry.factory("embed_model")
+        if getattr(inner, "micro_batching", False):
+            return
+
+        def factory():
+            return MicroBatchEncoder(inner(), max_batch=CONFIG["service_max_batch"],
+                                     max_wait_ms=CONFIG["service_batch_wait_ms"])
+
+        factory.micro_batching = True
+        registry.register("embed_model", factory)
+
+
+def warm_up() -> None:
+    """Load the embedding model, vector store and LLM client before the first request."""
+    with span("service.warm_up"):
+        get_embed_model()
+        get_store()
+        get_llm_client()
+
+
+def start_server(host: str = "127.0.0.1", port: int = 8765, processed_root: str = "data/processed",
+                 outputs_dir: str = "outputs", warm: bool = True):
+    """
+    Start the service in a daemon thread. Returns (server, base_url);
+    call server.shutdown() to stop it. port=0 picks a free port.
+    """
+    install_micro_batching()
+    if warm:
+        warm_up()
+    server = QueryServer((host, port), processed_root=processed_root, outputs_dir=outputs_dir)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
@@ -0,0 +1,124 @@
+# src/stub_ollama.py
+"""
+Tiny stand-in for the Ollama HTTP API (POST /api/generate), for local
+tests and benchmarks without a real model.
+
+    python -m src.stub_ollama --port 11435
+    OLLAMA_HOST=http://127.0.0.1:11435 streamlit run scripts/app.py
+
+The answer echoes the first page citation found in the prompt, so the
+pipeline's citation handling can be checked end to end.
+"""
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def stub_answer(prompt: str) -> str:
+    m = re.search(r"\| p\.(\d+)\]", prompt or "")
+    page = m.group(1) if m else "?"
+    return f"This is a stub answer based on the provided sources [p.{page}]."
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass  # keep test output quiet
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        with self.server.lock:
+            self.server.requests_seen += 1
+            fail = self.server.requests_seen <= self.server.fail_first
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            if fail:
+                self.send_error(503, "stub: simulated overload")
+                return
+            self._generate(payload)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def _generate(self, payload: dict):
+        answer = stub_answer(payload.get("prompt", ""))
+        model = payload.get("model", "stub")
+        delay = self.server.token_delay
+
+        if self.server.first_token_delay:
+            time.sleep(self.server.first_token_delay)
+
+        if not payload.get("stream", True):
+            time.sleep(delay * len(answer.split()))
+            body = json.dumps({"model": model, "response": answer, "done": True}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # Streaming: newline-delimited JSON objects, chunked transfer
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = answer.split(" ")
+        for i, w in enumerate(words):
+            token = w if i == 0 else " " + w
+            self._write_chunk(json.dumps({"model": model, "response": token, "done": False}) + "\n")
+            if delay:
+                time.sleep(delay)
+        self._write_chunk(json.dumps({"model": model, "response": "", "done": True}) + "\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_stub_ollama(host: str = "127.0.0.1", port: int = 0, token_delay: float = 0.0,
+                      first_token_delay: float = 0.0, fail_first: int = 0):
+    """
+    Start the stub in a daemon thread. Returns (server, base_url);
+    call server.shutdown() to stop it. port=0 picks a free port.
+
+    The first fail_first requests are answered with 503 (to exercise
+    retries); server.max_in_flight records the most concurrent requests.
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.token_delay = token_delay
+    server.first_token_delay = first_token_delay
+    server.fail_first = fail_first
+    server.requests_seen = 0
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Stub Ollama server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11435)
+    ap.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed tokens")
+    ap.add_argument("--first-token-delay", type=float, default=0.0)
+    args = ap.parse_args()
+    srv, url = start_stub_ollama(args.host, args.port, args.token_delay, args.first_token_delay)
+    print(f"Stub Ollama listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.shutdown()
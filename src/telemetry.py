@@ -0,0 +1,387 @@
+# src/telemetry.py
+"""
+Span timers, counters and an optional profiler hook for the pipeline.
+
+    with span("retrieve.dense", n=len(queries)) as sp:
+        ...
+        sp.set(hits=len(ids))
+    incr("embed_cache.hits", n)
+
+    @traced("llm.generate")
+    def generate(...): ...
+
+Off by default (RAG_TELEMETRY=1 or configure(telemetry=True) to turn it
+on). While off, span() hands back one shared no-op object and incr() /
+observe() / traced functions return after a single config lookup.
+
+Finished spans carry a trace id and parent id (nesting is tracked per
+thread), are kept in a ring buffer (recent_spans) and, if
+CONFIG["telemetry_path"] is set, appended to that file as JSON lines.
+Span durations and counters are aggregated for prometheus_text();
+serve_metrics() exposes them over HTTP at /metrics, with recent spans at
+/spans.
+
+profile(name) runs the block under cProfile (or pyinstrument) when
+CONFIG["profile"] is set and writes the result to CONFIG["profile_dir"].
+"""
+import os
+import re
+import json
+import time
+import uuid
+import threading
+import functools
+from collections import deque
+from src.registry import CONFIG
+
+# Histogram buckets (seconds) for span durations
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RECENT_SPANS = 2048
+
+_local = threading.local()
+_lock = threading.Lock()
+_recent = deque(maxlen=RECENT_SPANS)
+_counters = {}   # name -> value
+_durations = {}  # span name -> [count, sum, bucket counts...]
+_sink = {"path": None, "file": None}
+
+
+def enabled() -> bool:
+    return CONFIG["telemetry"]
+
+
+def _stack() -> list:
+    st = getattr(_local, "stack", None)
+    if st is None:
+        st = _local.stack = []
+    return st
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "start", "_t0")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def _begin(self):
+        """Start the clock; the parent is the innermost open span of this thread."""
+        st = _stack()
+        parent = st[-1] if st else None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = uuid.uuid4().hex[:16]
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def _finish(self, exc_type=None):
+        duration = time.perf_counter() - self._t0
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _record({
+            "name": self.name, "trace_id": self.trace_id, "span_id": self.span_id,
+            "parent_id": self.parent_id, "start": self.start, "duration_s": duration,
+            "thread": threading.current_thread().name, **self.attrs,
+        })
+
+    def __enter__(self):
+        _stack().append(self._begin())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        st = _stack()
+        if st and st[-1] is self:
+            st.pop()
+        self._finish(exc_type)
+        return False
+
+
+def span(name: str, **attrs):
+    """Context manager timing a block; nested spans share the trace id."""
+    if not CONFIG["telemetry"]:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def traced(name: str = None):
+    """Decorator form of span(); the span is named after the function by default."""
+    def deco(fn):
+        span_name = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not CONFIG["telemetry"]:
+                return fn(*args, **kwargs)
+            with Span(span_name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def span_iter(name: str, iterable, **attrs):
+    """
+    Yield from iterable inside a span covering the whole iteration;
+    records time to first item (first_s) and the item count.
+
+    The span is only on the thread's stack while the next item is being
+    produced, never across a yield: the consumer may stop early or
+    continue on another thread, and must not inherit it as a parent.
+    """
+    if not CONFIG["telemetry"]:
+        yield from iterable
+        return
+    sp = Span(name, attrs)._begin()
+    it = iter(iterable)
+    n = 0
+    try:
+        while True:
+            st = _stack()
+            st.append(sp)
+            try:
+                item = next(it)
+            except StopIteration:
+                break
+            finally:
+                if st and st[-1] is sp:
+                    st.pop()
+            if not n:
+                sp.set(first_s=time.perf_counter() - sp._t0)
+            n += 1
+            yield item
+    except GeneratorExit:
+        sp.set(items=n, closed=True)  # consumer stopped early
+        sp._finish()
+        raise
+    except BaseException as e:
+        sp.set(items=n)
+        sp._finish(type(e))
+        raise
+    sp.set(items=n)
+    sp._finish()
+
+
+def observe(name: str, seconds: float, **attrs) -> None:
+    """Record a duration measured elsewhere (e.g. in a worker process) as a span."""
+    if not CONFIG["telemetry"]:
+        return
+    st = _stack()
+    parent = st[-1] if st else None
+    _record({
+        "name": name, "trace_id": parent.trace_id if parent else uuid.uuid4().hex[:16],
+        "span_id": uuid.uuid4().hex[:16], "parent_id": parent.span_id if parent else None,
+        "start": time.time() - seconds, "duration_s": seconds,
+        "thread": threading.current_thread().name, **attrs,
+    })
+
+
+def incr(name: str, n: float = 1) -> None:
+    if not CONFIG["telemetry"]:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def _record(rec: dict) -> None:
+    d = rec["duration_s"]
+    with _lock:
+        _recent.append(rec)
+        agg = _durations.get(rec["name"])
+        if agg is None:
+            agg = _durations[rec["name"]] = [0, 0.0] + [0] * len(BUCKETS)
+        agg[0] += 1
+        agg[1] += d
+        for i, b in enumerate(BUCKETS):
+            if d <= b:
+                agg[2 + i] += 1
+        path = CONFIG["telemetry_path"]
+        if path:
+            if _sink["path"] != path:
+                if _sink["file"]:
+                    _sink["file"].close()
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                _sink["file"] = open(path, "a", encoding="utf-8")
+                _sink["path"] = path
+            _sink["file"].write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+            _sink["file"].flush()
+
+
+# -------------------------
+# Reading and exporting
+# -------------------------
+def recent_spans(since: float = None) -> list:
+    """Finished spans still in the ring buffer, oldest first (optionally started after `since`)."""
+    with _lock:
+        spans = list(_recent)
+    if since is not None:
+        spans = [s for s in spans if s["start"] >= since]
+    return spans
+
+
+def last_trace() -> list:
+    """Spans of the most recently finished top-level span."""
+    with _lock:
+        spans = list(_recent)
+    root = next((s for s in reversed(spans) if s["parent_id"] is None), None)
+    return [s for s in spans if root and s["trace_id"] == root["trace_id"]]
+
+
+def summarize(spans: list) -> dict:
+    """{span name: {"count", "total_s"}}, slowest first."""
+    out = {}
+    for s in spans:
+        agg = out.setdefault(s["name"], {"count": 0, "total_s": 0.0})
+        agg["count"] += 1
+        agg["total_s"] += s["duration_s"]
+    return dict(sorted(out.items(), key=lambda kv: -kv[1]["total_s"]))
+
+
+def counters() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+def export_jsonl(path: str, spans: list = None) -> str:
+    """Write spans (default: the ring buffer) to a JSONL file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for s in recent_spans() if spans is None else spans:
+            f.write(json.dumps(s, ensure_ascii=False, default=str) + "\n")
+    return path
+
+
+def _metric_name(name: str) -> str:
+    return "rag_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def prometheus_text() -> str:
+    """Counters and span duration histograms in Prometheus text format."""
+    with _lock:
+        ctr = dict(_counters)
+        durs = {k: list(v) for k, v in _durations.items()}
+    lines = []
+    for name, value in sorted(ctr.items()):
+        m = _metric_name(name) + "_total"
+        lines += [f"# TYPE {m} counter", f"{m} {value}"]
+    if durs:
+        lines.append("# TYPE rag_span_duration_seconds histogram")
+    for name, agg in sorted(durs.items()):
+        label = name.replace("\\", "\\\\").replace('"', '\\"')
+        # _record counts a span in every bucket it fits, so counts are already cumulative
+        for b, n in zip(BUCKETS, agg[2:]):
+            lines.append(f'rag_span_duration_seconds_bucket{{span="{label}",le="{b}"}} {n}')
+        lines.append(f'rag_span_duration_seconds_bucket{{span="{label}",le="+Inf"}} {agg[0]}')
+        lines.append(f'rag_span_duration_seconds_sum{{span="{label}"}} {agg[1]:.6f}')
+        lines.append(f'rag_span_duration_seconds_count{{span="{label}"}} {agg[0]}')
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    """Forget all spans, counters and histograms."""
+    with _lock:
+        _recent.clear()
+        _counters.clear()
+        _durations.clear()
+
+
+def serve_metrics(host: str = "127.0.0.1", port: int = 9464):
+    """
+    Serve /metrics (Prometheus text) and /spans (JSON lines) from a daemon
+    thread. Returns (server, base_url); port=0 picks a free port.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.startswith("/metrics"):
+                body, ctype = prometheus_text(), "text/plain; version=0.0.4"
+            elif self.path.startswith("/spans"):
+                body = "".join(json.dumps(s, default=str) + "\n" for s in recent_spans())
+                ctype = "application/x-ndjson"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+# -------------------------
+# Profiling hook
+# -------------------------
+class _Profile:
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self.kind = kind
+        self.prof = None
+
+    def __enter__(self):
+        if getattr(_local, "profiling", False):
+            return self  # only the outermost block is profiled
+        _local.profiling = True
+        if self.kind == "pyinstrument":
+            from pyinstrument import Profiler
+            self.prof = Profiler()
+            self.prof.start()
+        else:
+            import cProfile
+            self.prof = cProfile.Profile()
+            self.prof.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.prof is None:
+            return False
+        _local.profiling = False
+        out_dir = CONFIG["profile_dir"]
+        os.makedirs(out_dir, exist_ok=True)
+        stem = os.path.join(out_dir, f"{re.sub(r'[^a-zA-Z0-9_.-]', '_', self.name)}_{int(time.time() * 1000)}")
+        if self.kind == "pyinstrument":
+            self.prof.stop()
+            with open(stem + ".html", "w", encoding="utf-8") as f:
+                f.write(self.prof.output_html())
+        else:
+            self.prof.disable()
+            self.prof.dump_stats(stem + ".prof")
+        return False
+
+
+def profile(name: str):
+    """
+    Profile a block when CONFIG["profile"] is "cprofile" or "pyinstrument"
+    (env RAG_PROFILE); otherwise a no-op.
+    """
+    kind = CONFIG["profile"]
+    if not kind:
+        return _NOOP
+    return _Profile(name, kind)
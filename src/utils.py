@@ -1,21 +1,131 @@
 import os
+import re
 import json
+import hashlib
+import threading
+from collections import OrderedDict
 import fitz  # PyMuPDF
 
-def load_jsonl(file_path):
+def iter_jsonl(file_path):
     """
-    Load JSONL file and return list of dictionaries.
-    Each line in a .jsonl file is a valid JSON object.
+    Stream a JSONL file one dictionary at a time (constant memory).
     """
-    data = []
     with open(file_path, "r", encoding="utf-8") as f:
         for line in f:
             try:
-                obj = json.loads(line.strip())
-                data.append(obj)
+                yield json.loads(line.strip())
             except json.JSONDecodeError:
                 continue  # skip invalid JSON lines
-    return data
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU dict for in-process caches: get() refreshes an
+    entry, put() evicts the least recently used ones past maxsize.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._d = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._d:
+                self._d.move_to_end(key)
+                return self._d[key]
+        return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._d[key] = value
+            self._d.move_to_end(key)
+            while len(self._d) > self.maxsize:
+                self._d.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._d.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._d.clear()
+
+    def __len__(self):
+        return len(self._d)
+
+
+def load_jsonl(file_path):
+    """
+    Load JSONL file and return list of dictionaries.
+    Each line in a .jsonl file is a valid JSON object.
+    """
+    return list(iter_jsonl(file_path))
+
+
+def batched(iterable, n):
+    """
+    Yield lists of up to n items from any iterable.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def save_jsonl(file_path, rows):
+    """
+    Write an iterable of dictionaries to a JSONL file, one object per line.
+    """
+    with open(file_path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return file_path
+
+
+def clean_text(text):
+    """
+    Collapse runs of spaces/tabs inside each line and drop empty lines.
+    Line breaks are kept because they carry layout (headings, lists).
+    """
+    lines = [re.sub(r"[ \t\u00a0]+", " ", ln).strip() for ln in (text or "").splitlines()]
+    return "\n".join(ln for ln in lines if ln)
+
+
+def text_hash(text):
+    """
+    Short stable hash of a text (first 12 hex chars of sha1).
+    """
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()[:12]
+
+
+WINDOWS_TESSERACT = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+
+
+def tesseract_cmd():
+    """
+    Tesseract binary to use instead of pytesseract's default ("tesseract" on PATH):
+    TESSERACT_CMD if set, else the default Windows install path if it exists, else None.
+    """
+    cmd = os.environ.get("TESSERACT_CMD")
+    if cmd:
+        return cmd
+    return WINDOWS_TESSERACT if os.path.exists(WINDOWS_TESSERACT) else None
+
+
+def file_hash(path, block_size=1 << 20):
+    """
+    sha1 hex digest of a file's bytes, read in blocks.
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
 
 
 def ensure_dir(path):
@@ -31,9 +141,13 @@ def ensure_dir(path):
 
 def get_pages(jsonl_path):
     """
-    Read pages.jsonl and return list of page texts.
-    This assumes each line has a JSON object with 'text' key.
+    Read pages.jsonl (or pages.rec) and return list of page texts.
+    This assumes each row is a JSON object with 'text' key.
     """
+    from src.artifacts import is_records, open_records
+    if is_records(jsonl_path):
+        rf = open_records(jsonl_path)
+        return [rf.row(i, words=False).get("text", "") for i in range(len(rf))]
     pages = []
     with open(jsonl_path, "r", encoding="utf-8") as f:
         for line in f:
@@ -0,0 +1,535 @@
+# src/vector_store.py
+"""
+Vector store backends behind build_index / query_index.
+
+Every backend speaks the same small interface and returns query results
+in Chroma's shape ({"ids", "documents", "metadatas", "distances"}, one
+inner list per query), so callers don't care which one is configured:
+
+- ChromaStore: chromadb.PersistentClient collection (SQLite + HNSW).
+- FlatStore:   contiguous matrix in vectors.npy, loaded with mmap,
+               dot-product search in NumPy; optionally stored as float16,
+               or as int8 rescored against a float16 copy.
+- FaissStore:  FlatStore storage plus a FAISS index (flat, IVF or IVF-PQ)
+               used for the search.
+
+Distances are squared L2 between normalized vectors (2 - 2*cosine),
+which is what Chroma's default space reports too.
+"""
+import os
+import json
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+from src.utils import LRUCache
+
+
+# -------------------------
+# Metadata filters (Chroma `where` syntax)
+# -------------------------
+_OPS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def match_where(meta: dict, where: dict) -> bool:
+    """Evaluate a Chroma-style `where` filter against one metadata dict."""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(match_where(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(match_where(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            val = meta.get(key)
+            for op, arg in cond.items():
+                if op not in _OPS:
+                    raise ValueError(f"Unsupported where operator: {op}")
+                if not _OPS[op](val, arg):
+                    return False
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+def _empty_results(n_queries: int) -> dict:
+    return {
+        "ids": [[] for _ in range(n_queries)],
+        "documents": [[] for _ in range(n_queries)],
+        "metadatas": [[] for _ in range(n_queries)],
+        "distances": [[] for _ in range(n_queries)],
+    }
+
+
+class VectorStore(ABC):
+    """Interface shared by all backends."""
+
+    name = "base"
+
+    @abstractmethod
+    def upsert(self, ids: list, embeddings: np.ndarray, documents: list, metadatas: list) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: list) -> None:
+        ...
+
+    @abstractmethod
+    def ids_where(self, where: dict) -> set:
+        ...
+
+    @abstractmethod
+    def get(self, ids: list) -> dict:
+        """{"ids", "documents", "metadatas"} for the ids that exist."""
+
+    @abstractmethod
+    def query(self, embeddings: np.ndarray, top_k: int = 5, where: dict = None) -> dict:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    def flush(self) -> None:
+        """Persist buffered writes. Called once at the end of build_index."""
+
+
+# -------------------------
+# Chroma
+# -------------------------
+class ChromaStore(VectorStore):
+    name = "chroma"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if ids:
+            self.collection.upsert(ids=list(ids), documents=list(documents), metadatas=list(metadatas),
+                                   embeddings=np.asarray(embeddings, dtype=np.float32))
+
+    def delete(self, ids):
+        if ids:
+            self.collection.delete(ids=list(ids))
+
+    def ids_where(self, where):
+        return set(self.collection.get(where=where, include=[])["ids"])
+
+    def get(self, ids):
+        res = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        return {"ids": res["ids"], "documents": res["documents"], "metadatas": res["metadatas"]}
+
+    def query(self, embeddings, top_k=5, where=None):
+        q = np.asarray(embeddings, dtype=np.float32)
+        if q.shape[0] == 0:
+            return _empty_results(0)
+        return self.collection.query(query_embeddings=q, n_results=top_k, where=where)
+
+    def count(self):
+        return self.collection.count()
+
+
+# -------------------------
+# Flat NumPy (mmap)
+# -------------------------
+VECTOR_DTYPES = ("float32", "float16", "int8")
+# Quantized search keeps this many candidates per wanted result for rescoring
+RESCORE_OVERSAMPLE = 4
+# Rows converted to float32 at a time while scoring a quantized matrix
+SCORE_BLOCK_ROWS = 16384
+# Distinct `where` filters whose matching rows are kept (page ranges make them open-ended)
+MASK_CACHE_SIZE = 128
+
+
+def quantize(vecs: np.ndarray, dtype: str):
+    """
+    (quantized matrix, per-row scales or None). int8 is symmetric per row:
+    v ~= q * scale with scale = max|v| / 127.
+    """
+    vecs = np.asarray(vecs, dtype=np.float32)
+    if dtype == "float16":
+        return vecs.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vecs).max(axis=1) / 127.0 if len(vecs) else np.zeros(0, dtype=np.float32)
+        scales[scales == 0] = 1.0
+        return np.round(vecs / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vecs, None
+
+
+def dequantize(qvecs: np.ndarray, scales: np.ndarray = None) -> np.ndarray:
+    out = np.asarray(qvecs, dtype=np.float32)
+    return out * scales[:, None] if scales is not None else out
+
+
+class FlatStore(VectorStore):
+    """
+    Vectors in <dir>/vectors.npy (float32, one row per record) and ids,
+    documents and metadata in <dir>/records.jsonl, row-aligned.
+
+    Writes are buffered in memory and written out by flush(), which
+    compacts deleted rows away and re-opens the matrix with mmap.
+    query() only sees flushed rows; get() / ids_where() / count() also
+    see buffered writes.
+
+    dtype "float16" stores and searches vectors.float16.npy instead (half
+    the size). dtype "int8" searches vectors.int8.npy (a quarter, per-row
+    scales in scales.npy); with rescore=True the best RESCORE_OVERSAMPLE *
+    top_k candidates are re-ranked against a float16 copy read through
+    the mmap (0.75x of float32 on disk), rescore=False keeps the int8
+    matrix only (0.25x) and answers from its scores. Only the files of the
+    configured dtype / rescore are kept: a store written with other
+    settings is converted once when opened.
+    """
+
+    name = "numpy"
+
+    def __init__(self, path: str, dtype: str = "float32", rescore: bool = True):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype} (expected one of {VECTOR_DTYPES})")
+        self.path = path
+        self.dtype = dtype
+        # only int8 is rescored: float16 scores are already as good as a float16 rescore copy
+        self.rescore = rescore and dtype == "int8"
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._load()
+
+    # -- storage --
+    @property
+    def _vec_file(self):
+        return os.path.join(self.path, "vectors.npy")
+
+    @property
+    def _rec_file(self):
+        return os.path.join(self.path, "records.jsonl")
+
+    @property
+    def _qvec_file(self):
+        return self._quantized_file(self.dtype)
+
+    def _quantized_file(self, dtype: str) -> str:
+        return os.path.join(self.path, f"vectors.{dtype}.npy")
+
+    @property
+    def _scale_file(self):
+        return os.path.join(self.path, "scales.npy")
+
+    def _load(self):
+        self._ids, self._docs, self._metas = [], [], []
+        if os.path.exists(self._rec_file):
+            with open(self._rec_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    r = json.loads(line)
+                    self._ids.append(r["id"])
+                    self._docs.append(r["document"])
+                    self._metas.append(r["metadata"])
+        self._vecs = self._qvecs = self._scales = None
+        if self._ids:
+            present = [dt for dt in VECTOR_DTYPES if os.path.exists(self._dtype_file(dt))]
+            if present and set(present) != set(self._stored_dtypes()):
+                # written with another dtype / rescore setting: convert once to this one
+                self._write_matrices(self._load_matrix(self._source_dtype(present)))
+            self._open_matrices()
+        n_rows = self._matrix_rows()
+        if n_rows is not None and n_rows != len(self._ids):
+            raise ValueError(f"Vector store {self.path} is inconsistent: {n_rows} vectors for {len(self._ids)} records")
+        self._pos = {rid: i for i, rid in enumerate(self._ids)}
+        self._deleted = set()
+        self._pending = {}  # id -> (vec, doc, meta), newest wins
+        self._mask_cache = LRUCache(MASK_CACHE_SIZE)
+        self._on_reload()
+
+    def _on_reload(self):
+        """Hook for subclasses that build extra structures over the rows."""
+
+    def _dtype_file(self, dtype: str) -> str:
+        return self._vec_file if dtype == "float32" else self._quantized_file(dtype)
+
+    def _stored_dtypes(self) -> tuple:
+        """Matrices this configuration keeps on disk: the searched one, plus the float16 rescore copy."""
+        return ("int8", "float16") if self.rescore else (self.dtype,)
+
+    def _source_dtype(self, present: list) -> str:
+        """Most precise current matrix to convert from: vectors.npy, else the newest quantized file."""
+        if "float32" in present:
+            return "float32"
+        quantized = [dt for dt in VECTOR_DTYPES[1:] if dt in present]
+        return max(quantized, key=lambda dt: os.path.getmtime(self._quantized_file(dt)))
+
+    def _load_matrix(self, dtype: str) -> np.ndarray:
+        vecs = np.load(self._dtype_file(dtype))
+        return dequantize(vecs, np.load(self._scale_file) if dtype == "int8" else None)
+
+    def _open_matrices(self):
+        if self.dtype == "float32":
+            if os.path.exists(self._vec_file):
+                self._vecs = np.load(self._vec_file, mmap_mode="r")
+            return
+        if os.path.exists(self._qvec_file):
+            self._qvecs = np.load(self._qvec_file, mmap_mode="r")
+            if self.dtype == "int8":
+                self._scales = np.load(self._scale_file)
+        if self.rescore and os.path.exists(self._quantized_file("float16")):
+            self._vecs = np.load(self._quantized_file("float16"), mmap_mode="r")
+
+    def _matrix_rows(self):
+        """Rows in the loaded matrix, or None when there is none."""
+        mat = self._vecs if self._vecs is not None else self._qvecs
+        return None if mat is None else mat.shape[0]
+
+    @staticmethod
+    def _save(path: str, arr: np.ndarray):
+        np.save(path + ".tmp.npy", arr)
+        os.replace(path + ".tmp.npy", path)
+
+    def _write_matrices(self, vecs: np.ndarray):
+        """Write vecs as this configuration's matrices and remove any others."""
+        # drop the mmaps before replacing the files underneath them (Windows)
+        self._vecs = self._qvecs = None
+        wanted = self._stored_dtypes()
+        for dt in reversed(VECTOR_DTYPES):  # the float16 rescore copy last, so it is the newest
+            if dt in wanted:
+                qvecs, scales = quantize(vecs, dt)
+                if scales is not None:
+                    self._save(self._scale_file, scales)
+                self._save(self._dtype_file(dt), qvecs)
+            elif os.path.exists(self._dtype_file(dt)):
+                os.remove(self._dtype_file(dt))
+        if "int8" not in wanted and os.path.exists(self._scale_file):
+            os.remove(self._scale_file)
+
+    def _write(self, vecs: np.ndarray, ids: list, docs: list, metas: list):
+        tmp_rec = self._rec_file + ".tmp"
+        with open(tmp_rec, "w", encoding="utf-8") as f:
+            for rid, doc, meta in zip(ids, docs, metas):
+                f.write(json.dumps({"id": rid, "document": doc, "metadata": meta}, ensure_ascii=False) + "\n")
+        self._write_matrices(vecs)
+        os.replace(tmp_rec, self._rec_file)
+
+    def _float_rows(self, rows) -> np.ndarray:
+        """float32 vectors of the given rows, from vectors.npy or dequantized."""
+        if self._vecs is not None:
+            return np.asarray(self._vecs[rows], dtype=np.float32)
+        return dequantize(self._qvecs[rows], None if self._scales is None else self._scales[rows])
+
+    def flush(self):
+        with self._lock:
+            if not self._pending and not self._deleted:
+                return
+            keep = [i for i, rid in enumerate(self._ids) if rid not in self._deleted and rid not in self._pending]
+            ids = [self._ids[i] for i in keep] + list(self._pending)
+            docs = [self._docs[i] for i in keep] + [p[1] for p in self._pending.values()]
+            metas = [self._metas[i] for i in keep] + [p[2] for p in self._pending.values()]
+            parts = []
+            if self._has_matrix() and keep:
+                parts.append(self._float_rows(keep))
+            if self._pending:
+                parts.append(np.vstack([p[0] for p in self._pending.values()]).astype(np.float32))
+            dim = parts[0].shape[1] if parts else 0
+            vecs = np.vstack(parts) if parts else np.zeros((0, dim), dtype=np.float32)
+            if vecs.shape[0] != len(ids):
+                # records without vectors: writing would misalign ids and rows
+                raise ValueError(f"Vector store {self.path} has {vecs.shape[0]} vectors for {len(ids)} records")
+            self._write(vecs, ids, docs, metas)
+            self._load()
+
+    # -- writes --
+    def upsert(self, ids, embeddings, documents, metadatas):
+        embs = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            for rid, vec, doc, meta in zip(ids, embs, documents, metadatas):
+                self._pending[rid] = (vec, doc, meta)
+                self._deleted.discard(rid)
+
+    def delete(self, ids):
+        with self._lock:
+            for rid in ids:
+                self._pending.pop(rid, None)
+                if rid in self._pos:
+                    self._deleted.add(rid)
+
+    # -- reads --
+    def ids_where(self, where):
+        with self._lock:
+            out = {rid for rid, m in zip(self._ids, self._metas)
+                   if rid not in self._deleted and match_where(m, where)}
+            out.update(rid for rid, p in self._pending.items() if match_where(p[2], where))
+            return out
+
+    def get(self, ids):
+        with self._lock:
+            out = {"ids": [], "documents": [], "metadatas": []}
+            for rid in ids:
+                if rid in self._pending:
+                    _, doc, meta = self._pending[rid]
+                elif rid in self._pos and rid not in self._deleted:
+                    i = self._pos[rid]
+                    doc, meta = self._docs[i], self._metas[i]
+                else:
+                    continue
+                out["ids"].append(rid)
+                out["documents"].append(doc)
+                out["metadatas"].append(meta)
+            return out
+
+    def count(self):
+        with self._lock:
+            return len(self._ids) - len(self._deleted) + len([r for r in self._pending if r not in self._pos])
+
+    def _candidate_rows(self, where):
+        """Row indexes passing the filter (None = all rows). The last MASK_CACHE_SIZE filters are cached."""
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True)
+        rows = self._mask_cache.get(key)
+        if rows is None:
+            rows = np.fromiter((i for i, m in enumerate(self._metas) if match_where(m, where)), dtype=np.int64)
+            self._mask_cache.put(key, rows)
+        return rows
+
+    def _has_matrix(self) -> bool:
+        return self._vecs is not None or self._qvecs is not None
+
+    def _scores(self, q: np.ndarray, rows):
+        """Similarity of each query to each candidate row: (n_queries, n_rows)."""
+        if self._qvecs is None:
+            mat = self._vecs if rows is None else self._vecs[rows]
+            return q @ np.asarray(mat, dtype=np.float32).T
+        # quantized: convert one block of rows at a time to bound memory
+        n = len(self._ids) if rows is None else len(rows)
+        sims = np.empty((q.shape[0], n), dtype=np.float32)
+        for lo in range(0, n, SCORE_BLOCK_ROWS):
+            sel = slice(lo, min(lo + SCORE_BLOCK_ROWS, n)) if rows is None else rows[lo:lo + SCORE_BLOCK_ROWS]
+            block = q @ np.asarray(self._qvecs[sel], dtype=np.float32).T
+            if self._scales is not None:
+                block *= self._scales[sel]
+            sims[:, lo:lo + block.shape[1]] = block
+        return sims
+
+    def _search(self, q: np.ndarray, top_k: int, rows):
+        """(row_indexes, similarities) per query, best first."""
+        sims = self._scores(q, rows)
+        n = sims.shape[1]
+        rescore = self._qvecs is not None and self._vecs is not None
+        k = min(top_k * RESCORE_OVERSAMPLE if rescore else top_k, n)
+        out = []
+        for qi, s in enumerate(sims):
+            idx = np.argpartition(-s, k - 1)[:k] if k < n else np.arange(n)
+            row_idx = idx if rows is None else rows[idx]
+            scores = s[idx]
+            if rescore:
+                # exact float32 scores for the shortlist; sorted rows read the mmap in order
+                order = np.argsort(row_idx)
+                row_idx = row_idx[order]
+                scores = np.asarray(self._vecs[row_idx], dtype=np.float32) @ q[qi]
+            best = np.argsort(-scores)[:top_k]
+            out.append((row_idx[best], scores[best]))
+        return out
+
+    def query(self, embeddings, top_k=5, where=None):
+        # searches the flushed matrix only: a read never triggers a rewrite (build_index flushes)
+        q = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            res = _empty_results(q.shape[0])
+            if not self._has_matrix() or q.shape[0] == 0:
+                return res
+            rows = self._candidate_rows(where)
+            if rows is not None and len(rows) == 0:
+                return res
+            for qi, (row_idx, sims) in enumerate(self._search(q, top_k, rows)):
+                for r, s in zip(row_idx, sims):
+                    r = int(r)
+                    res["ids"][qi].append(self._ids[r])
+                    res["documents"][qi].append(self._docs[r])
+                    res["metadatas"][qi].append(self._metas[r])
+                    res["distances"][qi].append(float(2.0 - 2.0 * s))
+            return res
+
+
+# -------------------------
+# FAISS
+# -------------------------
+class FaissStore(FlatStore):
+    """
+    FlatStore storage searched through a FAISS inner-product index.
+
+    index_type: "flat" (exact), "ivf" (IVF-Flat) or "ivfpq" (IVF + product
+    quantization, pq_m sub-quantizers of 8 bits). IVF variants fall back
+    to flat until there are enough vectors to train them (39 per centroid).
+    The index is rebuilt on flush() and saved as <dir>/index.faiss.
+    """
+
+    name = "faiss"
+
+    def __init__(self, path: str, index_type: str = "flat", nlist: int = 1024, pq_m: int = 16, nprobe: int = 16):
+        self.index_type = index_type
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.nprobe = nprobe
+        self._index = None
+        super().__init__(path)
+
+    @property
+    def _index_file(self):
+        return os.path.join(self.path, "index.faiss")
+
+    def _on_reload(self):
+        import faiss
+        self._index = None
+        if self._vecs is None:
+            return
+        if (os.path.exists(self._index_file) and os.path.exists(self._vec_file)
+                and os.path.getmtime(self._index_file) >= os.path.getmtime(self._vec_file)):
+            self._index = faiss.read_index(self._index_file)
+            if self._index.ntotal == len(self._ids):
+                return
+        self._index = self._build_faiss(np.ascontiguousarray(self._vecs, dtype=np.float32))
+        faiss.write_index(self._index, self._index_file)
+
+    def _build_faiss(self, vecs: np.ndarray):
+        import faiss
+        n, dim = vecs.shape
+        kind = self.index_type
+        min_train = 39 * self.nlist if kind == "ivf" else 39 * max(self.nlist, 256)
+        if kind in ("ivf", "ivfpq") and n < min_train:
+            kind = "flat"
+        if kind == "flat":
+            index = faiss.IndexFlatIP(dim)
+        else:
+            quantizer = faiss.IndexFlatIP(dim)
+            if kind == "ivf":
+                index = faiss.IndexIVFFlat(quantizer, dim, self.nlist, faiss.METRIC_INNER_PRODUCT)
+            else:
+                index = faiss.IndexIVFPQ(quantizer, dim, self.nlist, self.pq_m, 8, faiss.METRIC_INNER_PRODUCT)
+            index.train(vecs)
+        index.add(vecs)
+        return index
+
+    def _search(self, q, top_k, rows):
+        import faiss
+        k = min(top_k, self._index.ntotal if rows is None else len(rows))
+        params = None
+        if rows is not None:
+            sel = faiss.IDSelectorBatch(rows)
+            if isinstance(self._index, faiss.IndexIVF):
+                params = faiss.SearchParametersIVF(sel=sel, nprobe=self.nprobe)
+            else:
+                params = faiss.SearchParameters(sel=sel)
+        elif isinstance(self._index, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF(nprobe=self.nprobe)
+        sims, idx = self._index.search(np.ascontiguousarray(q), k, params=params)
+        out = []
+        for s, i in zip(sims, idx):
+            keep = i >= 0
+            out.append((i[keep], s[keep]))
+        return out
@@ -0,0 +1,90 @@
+# tests/conftest.py
+import sys, os, re, zlib
+import fitz
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.registry import registry, configure, CONFIG
+from src.ingest import extract_pdf
+from src.chunk import make_chunks
+from src.embed_index import build_index
+
+
+class FakeEmbedModel:
+    """Bag-of-words hashing embedder with the SentenceTransformer encode() signature."""
+
+    dim = 64
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True, **kwargs):
+        self.calls += 1
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            for w in t.lower().split():
+                out[i, zlib.crc32(w.encode("utf-8")) % self.dim] += 1.0
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-9)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+
+class FakeTokenizer:
+    """Word/punctuation tokenizer with the Hugging Face call signature used by src/chunk.py."""
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False):
+        if isinstance(text, list):
+            return {"input_ids": [self(t)["input_ids"] for t in text]}
+        offsets = [(m.start(), m.end()) for m in re.finditer(r"\w+|[^\w\s]", text)]
+        enc = {"input_ids": list(range(len(offsets)))}
+        if return_offsets_mapping:
+            enc["offset_mapping"] = offsets
+        return enc
+
+
+@pytest.fixture
+def rag_env(tmp_path, monkeypatch):
+    """
+    Isolated index / cache paths under tmp_path, numpy vector store and
+    fake embedding model and tokenizer. Config and registry are restored
+    afterwards.
+    """
+    saved_config = dict(CONFIG)
+    saved_factories = dict(registry._factories)
+    monkeypatch.chdir(tmp_path)
+    configure(vector_backend="numpy", vector_dir=str(tmp_path / "vectors"), lexical_dir=str(tmp_path / "lexical"),
+              embed_cache_path=str(tmp_path / "embed_cache.sqlite3"),
+              query_cache_path=str(tmp_path / "query_cache.sqlite3"), telemetry=False)
+    model = FakeEmbedModel()
+    registry.register("embed_model", lambda: model)
+    registry.register("tokenizer", FakeTokenizer)
+    yield model
+    registry._factories.clear()
+    registry._factories.update(saved_factories)
+    configure(**saved_config)
+
+
+REPORT_PAGES = [
+    "Solar Energy\nSolar panels convert sunlight into electricity for the regional grid.",
+    "Water Supply\nThe reservoir stores drinking water for the city during dry summers.",
+    "Clinical Funding\nHospital budgets fund clinical trials and patient safety programs.",
+]
+
+
+@pytest.fixture
+def indexed_doc(rag_env, tmp_path):
+    """processed/report: a 3-page native PDF ingested, chunked (one chunk per page) and indexed."""
+    pdf = str(tmp_path / "report.pdf")
+    doc = fitz.open()
+    for text in REPORT_PAGES:
+        doc.new_page(width=595, height=842).insert_textbox(fitz.Rect(50, 50, 545, 800), text, fontsize=11)
+    doc.save(pdf)
+    doc.close()
+
+    folder = tmp_path / "processed" / "report"
+    pages_path = extract_pdf(pdf, str(folder))
+    build_index(make_chunks(pages_path, str(folder), max_tokens=20, overlap_tokens=0), "report")
+    return folder
@@ -0,0 +1,74 @@
+# tests/test_artifacts.py
+import json
+import struct
+import numpy as np
+from src.artifacts import (write_records, open_records, iter_rows, count_rows, first_row, export_jsonl,
+                           save_rows)
+from src.utils import load_jsonl
+
+WORDS = [{"text": "Café", "bbox": [1.0, 2.0, 30.5, 12.25]},
+         {"text": "line\nbreak", "bbox": [32.0, 2.0, 60.0, 12.0]},
+         {"text": "", "bbox": [61.0, 2.0, 61.5, 12.0]},
+         {"text": "3.5%", "bbox": [62.0, 2.0, 80.0, 12.0]}]
+ROWS = [
+    {"pdf_id": "doc", "page": 1, "n_pages": 3, "is_scanned": True, "text": "Café line break 3.5%",
+     "ocr": {"image_path": None, "zoom": 2.0, "dpi": 144, "words": WORDS}},
+    {"pdf_id": "doc", "page": 2, "n_pages": 3, "is_scanned": True, "text": "",
+     "ocr": {"image_path": None, "zoom": 2.0, "dpi": 144, "words": []}},
+    {"pdf_id": "doc", "page": 3, "n_pages": 3, "is_scanned": False, "text": "Native text.", "ocr": None},
+]
+
+
+def test_round_trip_rows_with_and_without_words(tmp_path):
+    path = write_records(str(tmp_path / "pages.rec"), ROWS, "page")
+    rf = open_records(path)
+    assert len(rf) == count_rows(path) == 3
+    assert [rf.row(i) for i in range(3)] == ROWS
+    assert list(iter_rows(path)) == ROWS
+    assert rf.get(3) == ROWS[2] and rf.get(4) is None
+    assert rf.get(1)["ocr"]["words"][1]["text"] == "line\nbreak"
+
+    head = first_row(path)
+    assert "words" not in head["ocr"] and head["text"] == ROWS[0]["text"]
+    assert rf.row(0, words=False) == head
+
+    assert load_jsonl(export_jsonl(path)) == ROWS
+
+
+def test_empty_document(tmp_path):
+    path = write_records(str(tmp_path / "chunks.rec"), [], "chunk_id")
+    assert len(open_records(path)) == 0
+    assert list(iter_rows(path)) == []
+    assert first_row(path) is None
+    assert load_jsonl(export_jsonl(path)) == []
+
+
+def test_rewrite_while_cached_open(tmp_path):
+    path = str(tmp_path / "pages.rec")
+    save_rows(path, ROWS)
+    old = open_records(path)
+    assert old.row(2)["text"] == "Native text."
+
+    # same size and possibly the same mtime: the cached handle must still be dropped
+    save_rows(path, [dict(ROWS[0]), dict(ROWS[1]), dict(ROWS[2], text="Nativa text.")])
+    assert open_records(path) is not old
+    assert first_row(path)["text"] == ROWS[0]["text"]
+    assert [r["text"] for r in iter_rows(path)][2] == "Nativa text."
+    assert old.row(2)["text"] == "Native text."  # readers holding the old handle keep their view
+
+
+def test_reads_version_1_files(tmp_path):
+    # b"RAGREC01": word texts joined by "\n"
+    row = dict(ROWS[0], ocr={k: v for k, v in ROWS[0]["ocr"].items() if k != "words"})
+    words = [WORDS[0], WORDS[3]]
+    head = json.dumps(row).encode("utf-8")
+    texts = "\n".join(w["text"] for w in words).encode("utf-8")
+    payload = (struct.pack("<I", len(head)) + head + struct.pack("<I", len(words))
+               + np.array([w["bbox"] for w in words], dtype="<f8").tobytes() + struct.pack("<I", len(texts)) + texts)
+    body = b"RAGREC01" + struct.pack("<I", len(payload)) + payload
+    keys = json.dumps([1]).encode("utf-8")
+    data = body + struct.pack("<I", len(keys)) + keys + struct.pack("<Q", 8) + struct.pack("<Q", len(body)) + b"RAGREC01"
+    path = tmp_path / "pages.rec"
+    path.write_bytes(data)
+
+    assert list(iter_rows(str(path))) == [dict(ROWS[0], ocr=dict(ROWS[0]["ocr"], words=words))]
@@ -0,0 +1,30 @@
+# tests/test_chunk.py
+import pytest
+from src.chunk import make_chunks, MAX_TOKENS
+from src.artifacts import iter_rows, save_rows
+
+PAGES = [{"pdf_id": "doc", "page": 1, "pdf_path": "doc.pdf", "source": "native",
+          "text": " ".join(f"word{i}" for i in range(200))}]
+
+
+def test_legacy_keywords_map_characters_to_tokens(rag_env, tmp_path):
+    pages = str(tmp_path / "pages.jsonl")
+    save_rows(pages, PAGES)
+    (tmp_path / "new").mkdir()
+    (tmp_path / "old").mkdir()
+    expected = list(iter_rows(make_chunks(pages, str(tmp_path / "new"), max_tokens=25, overlap_tokens=5)))
+    with pytest.warns(DeprecationWarning, match="chunk_size"):
+        legacy = list(iter_rows(make_chunks(pages, str(tmp_path / "old"), chunk_size=100, chunk_overlap=20)))
+    assert [c["text"] for c in legacy] == [c["text"] for c in expected]
+    assert len(legacy) > 1
+
+
+def test_legacy_chunk_size_capped_at_model_limit(rag_env, tmp_path):
+    pages = str(tmp_path / "pages.jsonl")
+    save_rows(pages, PAGES)
+    (tmp_path / "new").mkdir()
+    (tmp_path / "old").mkdir()
+    expected = list(iter_rows(make_chunks(pages, str(tmp_path / "new"), max_tokens=MAX_TOKENS, overlap_tokens=0)))
+    with pytest.warns(DeprecationWarning):
+        legacy = list(iter_rows(make_chunks(pages, str(tmp_path / "old"), chunk_size=100000, chunk_overlap=0)))
+    assert [c["text"] for c in legacy] == [c["text"] for c in expected]
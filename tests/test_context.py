@@ -0,0 +1,48 @@
+# tests/test_context.py
+from src.context import assemble, estimate_tokens, split_sentences, _dedupe
+from src.rag_pipeline import build_prompt
+
+
+def _meta(chunk_no, page=1):
+    return {"pdf_id": "doc", "page_start": page, "chunk_id": f"chunk_{chunk_no:06d}_abc"}
+
+
+def test_near_duplicate_chunks_are_dropped():
+    text = "The reservoir stores drinking water for the city during the long dry summers of the region."
+    docs = [text, text + " Indeed.", "Hospital budgets fund clinical trials."]
+    assert _dedupe(docs) == [0, 2]
+    out = assemble("reservoir", docs, [_meta(1, 1), _meta(5, 2), _meta(9, 3)], budget=1000, select=False)
+    assert [page for page, _ in out] == [1, 3]
+
+
+def test_adjacent_chunks_merge_in_reading_order_with_overlap_once():
+    docs = ["Water is stored in winter. Pumps run at night.",  # chunk 4, ranked first
+            "The reservoir opened in 1990. Water is stored in winter."]  # chunk 3
+    out = assemble("water", docs, [_meta(4, page=2), _meta(3, page=2)], budget=1000, select=False)
+    assert out == [(2, "The reservoir opened in 1990. Water is stored in winter. Pumps run at night.")]
+
+
+def test_page_labels_survive_a_merge():
+    docs = ["Water is stored in winter.", "The reservoir holds water.", "Water prices rose in 2020."]
+    metas = [_meta(4, page=7), _meta(3, page=7), _meta(9, page=8)]
+    prompt = build_prompt("water", docs, metas, top_k=3)
+    assert "[Source 1 | p.7]: The reservoir holds water. Water is stored in winter." in prompt
+    assert "[Source 2 | p.8]: Water prices rose in 2020." in prompt
+    assert "[Source 3" not in prompt
+
+
+def test_budget_cuts_at_a_sentence_boundary():
+    sentences = [f"Sentence number {i} talks about the reservoir." for i in range(20)]
+    out = assemble("reservoir", [" ".join(sentences)], [_meta(1)], budget=40, select=False)
+    kept = split_sentences(out[0][1])
+    assert 0 < len(kept) < 20 and kept == sentences[:len(kept)]
+    assert sum(estimate_tokens(s) + 1 for s in kept) <= 40
+
+
+def test_blocks_without_query_terms_go_after_matching_ones():
+    docs = ["Photosynthesis converts light into chemical energy.",  # ranked first, no query term
+            "The reservoir stores drinking water."]
+    metas = [_meta(1, page=1), _meta(8, page=5)]
+    assert [page for page, _ in assemble("reservoir capacity", docs, metas, budget=1000, select=True)] == [5, 1]
+    assert assemble("reservoir capacity", docs, metas, budget=12, select=True) == \
+        [(5, "The reservoir stores drinking water.")]
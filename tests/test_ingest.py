@@ -0,0 +1,126 @@
+# tests/test_ingest.py
+import zlib
+import fitz
+import pytest
+from src import ingest
+from src.artifacts import iter_rows
+
+
+def _scanned_pdf(path, labels):
+    """Image-only PDF, one page per label."""
+    doc = fitz.open()
+    for label in labels:
+        text_page = fitz.open()
+        text_page.new_page(width=300, height=200).insert_text((40, 100), label, fontsize=28)
+        pix = text_page[0].get_pixmap(dpi=72)
+        doc.new_page(width=300, height=200).insert_image(fitz.Rect(0, 0, 300, 200), pixmap=pix)
+        text_page.close()
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    """pytesseract stand-in: one word per page derived from the image bytes; records image sizes."""
+    calls = []
+
+    def image_to_data(img, lang=None, output_type=None):
+        calls.append(img.size)
+        word = f"w{zlib.crc32(img.tobytes()) % 100000}"
+        return {"text": [word], "left": [10], "top": [10], "width": [80], "height": [40], "conf": [95],
+                "block_num": [1], "par_num": [1], "line_num": [1]}
+
+    monkeypatch.setattr(ingest.pytesseract, "image_to_data", image_to_data)
+    return calls
+
+
+def _body_text_page(path, fontsize):
+    """Image-only A4 page of body text at fontsize, scanned at 200 dpi."""
+    text = " ".join(["The reservoir stores drinking water for the city during dry summers."] * 40)
+    src = fitz.open()
+    src.new_page(width=595, height=842).insert_textbox(fitz.Rect(50, 50, 545, 800), text, fontsize=fontsize)
+    pix = src[0].get_pixmap(dpi=200)
+    doc = fitz.open()
+    doc.new_page(width=595, height=842).insert_image(fitz.Rect(0, 0, 595, 842), pixmap=pix)
+    doc.save(path)
+    doc.close()
+    src.close()
+    return path
+
+
+def _rows(out_dir):
+    return list(iter_rows(str(out_dir / "pages.jsonl")))
+
+
+def test_reingest_reuses_unchanged_pages(tmp_path, fake_ocr):
+    out = tmp_path / "out"
+    ingest.extract_pdf(_scanned_pdf(str(tmp_path / "a.pdf"), ["one", "two", "three"]), str(out))
+    assert len(fake_ocr) == 3
+    first = _rows(out)
+
+    ingest.extract_pdf(_scanned_pdf(str(tmp_path / "b.pdf"), ["zero", "one", "two", "three"]), str(out))
+    assert len(fake_ocr) == 4  # only the inserted page
+    rows = _rows(out)
+    assert [r["page"] for r in rows] == [1, 2, 3, 4]
+    assert [r["text"] for r in rows[1:]] == [r["text"] for r in first]
+
+
+def test_reused_pages_get_their_own_image(tmp_path, fake_ocr):
+    out, fresh = tmp_path / "out", tmp_path / "fresh"
+    ingest.extract_pdf(_scanned_pdf(str(tmp_path / "a.pdf"), ["one", "two"]), str(out), save_images=True)
+    b = _scanned_pdf(str(tmp_path / "b.pdf"), ["zero", "one", "two"])
+    ingest.extract_pdf(b, str(out), save_images=True)
+    ingest.extract_pdf(b, str(fresh), save_images=True)
+
+    for row, fresh_row in zip(_rows(out), _rows(fresh)):
+        path = row["ocr"]["image_path"]
+        assert path.endswith(f"page_{row['page']}.png")
+        with open(path, "rb") as f, open(fresh_row["ocr"]["image_path"], "rb") as g:
+            assert f.read() == g.read()
+
+
+def test_reused_pages_drop_images_not_saved_this_run(tmp_path, fake_ocr):
+    out = tmp_path / "out"
+    ingest.extract_pdf(_scanned_pdf(str(tmp_path / "a.pdf"), ["one", "two"]), str(out), save_images=True)
+    ingest.extract_pdf(_scanned_pdf(str(tmp_path / "b.pdf"), ["zero", "one", "two"]), str(out))
+    assert all(r["ocr"]["image_path"] is None for r in _rows(out))
+
+
+def test_ocr_dpi_follows_estimated_text_height(tmp_path):
+    heights = []
+    for fontsize in (8, 10, 12):
+        with fitz.open(_body_text_page(str(tmp_path / f"p{fontsize}.pdf"), fontsize)) as doc:
+            heights.append(ingest._text_height_pt(doc[0]))
+    assert heights == sorted(heights)
+    assert all(0.6 * fs <= h <= 1.2 * fs for fs, h in zip((8, 10, 12), heights))
+
+    assert ingest._ocr_dpi_for(0.0, 300) == ingest.OCR_MIN_DPI  # blank page
+    assert ingest._ocr_dpi_for(20.0, 300) == ingest.OCR_MIN_DPI  # large print
+    assert ingest._ocr_dpi_for(9.0, 300) == 200  # 22 px lines need 176 dpi
+    assert ingest._ocr_dpi_for(4.0, 300) == 300
+    assert ingest._ocr_dpi_for(9.0, 120) == 120
+
+
+def _dpi(size):
+    return round(size[0] * 72 / 595)  # A4 width in points
+
+
+def test_scanned_page_is_ocrd_once(tmp_path, fake_ocr):
+    ingest.extract_pdf(_body_text_page(str(tmp_path / "body.pdf"), 10), str(tmp_path / "out"))
+    assert len(fake_ocr) == 1
+    assert ingest.OCR_MIN_DPI <= _dpi(fake_ocr[0]) < 300
+
+
+def test_low_confidence_reads_page_again_at_full_dpi(tmp_path, monkeypatch):
+    sizes = []
+
+    def image_to_data(img, lang=None, output_type=None):
+        sizes.append(img.size)
+        return {"text": ["blurry"], "left": [10], "top": [10], "width": [80], "height": [20],
+                "conf": [ingest.OCR_MIN_CONF - 20], "block_num": [1], "par_num": [1], "line_num": [1]}
+
+    monkeypatch.setattr(ingest.pytesseract, "image_to_data", image_to_data)
+    ingest.extract_pdf(_body_text_page(str(tmp_path / "body.pdf"), 10), str(tmp_path / "out"))
+    assert len(sizes) == 2 and _dpi(sizes[0]) < 300 and _dpi(sizes[1]) == 300
+    assert _rows(tmp_path / "out")[0]["ocr"]["dpi"] == 300
@@ -0,0 +1,62 @@
+# tests/test_llm.py
+import time
+import pytest
+import requests
+from src.llm import OllamaClient
+from src.stub_ollama import start_stub_ollama, stub_answer
+
+PROMPT = "[Source 1 | p.4]: The reservoir stores water."
+
+
+@pytest.fixture
+def stub(request):
+    server, url = start_stub_ollama(**getattr(request, "param", {}))
+    yield server, url
+    server.shutdown()
+
+
+def test_generate(stub):
+    _, url = stub
+    assert OllamaClient(url).generate(PROMPT) == stub_answer(PROMPT)
+
+
+@pytest.mark.parametrize("stub", [{"token_delay": 0.01}], indirect=True)
+def test_stream_yields_tokens_in_order(stub):
+    _, url = stub
+    tokens = list(OllamaClient(url).stream(PROMPT))
+    assert len(tokens) > 1
+    assert "".join(tokens) == stub_answer(PROMPT)
+
+
+@pytest.mark.parametrize("stub", [{"fail_first": 2}], indirect=True)
+def test_retries_server_errors(stub):
+    server, url = stub
+    assert OllamaClient(url, retries=3, backoff=0.01).generate(PROMPT) == stub_answer(PROMPT)
+    assert server.requests_seen == 3
+
+
+@pytest.mark.parametrize("stub", [{"fail_first": 5}], indirect=True)
+def test_gives_up_after_retries(stub):
+    server, url = stub
+    with pytest.raises(requests.HTTPError):
+        OllamaClient(url, retries=1, backoff=0.01).generate(PROMPT)
+    assert server.requests_seen == 2
+
+
+@pytest.mark.parametrize("stub", [{"first_token_delay": 0.1}], indirect=True)
+def test_generate_many_caps_concurrency(stub):
+    server, url = stub
+    prompts = [f"[Source 1 | p.{i}]: text" for i in range(1, 9)]
+    t0 = time.perf_counter()
+    answers = OllamaClient(url, pool_size=8).generate_many(prompts, concurrency=4)
+    elapsed = time.perf_counter() - t0
+    assert answers == [stub_answer(p) for p in prompts]
+    assert server.max_in_flight == 4
+    assert elapsed < 8 * 0.1  # overlapped, not one after another
+
+
+@pytest.mark.parametrize("stub", [{"first_token_delay": 0.05}], indirect=True)
+def test_generate_many_clamps_to_pool_size(stub):
+    server, url = stub
+    OllamaClient(url, pool_size=2).generate_many([PROMPT] * 6, concurrency=16)
+    assert server.max_in_flight <= 2
@@ -0,0 +1,46 @@
+# tests/test_query_cache.py
+import numpy as np
+from src.query_cache import QueryCache
+
+EMB = np.ones(8, dtype=np.float32) / np.sqrt(8)
+
+
+def _cache(tmp_path, **kwargs):
+    return QueryCache(str(tmp_path / "qc.sqlite3"), **kwargs)
+
+
+def _store(cache, query, answer):
+    cache.store(query, EMB, "doc", "llama3.2", {"top_k": 3}, answer, [{"page": 1}])
+
+
+def _lookup(cache, query):
+    return cache.lookup(query, EMB, "doc", "llama3.2", {"top_k": 3})
+
+
+def test_exact_match_ignores_case_and_spacing(tmp_path):
+    cache = _cache(tmp_path)
+    _store(cache, "What is the budget?", "42")
+    hit = _lookup(cache, "  what is  the BUDGET? ")
+    assert hit["answer"] == "42" and hit["match"] == "exact"
+
+
+def test_similarity_matching_is_off_by_default(tmp_path):
+    cache = _cache(tmp_path)
+    _store(cache, "What is the budget?", "42")
+    assert _lookup(cache, "How large is the budget?") is None
+
+
+def test_near_duplicate_needs_same_identifiers(tmp_path):
+    cache = _cache(tmp_path, similarity=0.95)
+    _store(cache, "What does section 5.2 of ISO-9001 require?", "audits")
+    assert _lookup(cache, "What does section 5.3 of ISO-9001 require?") is None
+    assert _lookup(cache, "What does section 5.2 of ISO-9002 require?") is None
+    hit = _lookup(cache, "What is required by section 5.2 of ISO-9001?")
+    assert hit["answer"] == "audits" and hit["match"] == "similar"
+
+
+def test_invalidate_drops_document_entries(tmp_path):
+    cache = _cache(tmp_path)
+    _store(cache, "What is the budget?", "42")
+    cache.invalidate("doc")
+    assert _lookup(cache, "What is the budget?") is None
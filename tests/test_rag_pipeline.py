@@ -0,0 +1,27 @@
+# tests/test_rag_pipeline.py
+import pytest
+from src.registry import configure
+from src.rag_pipeline import answer_batch, build_prompt
+from src.stub_ollama import start_stub_ollama
+
+
+@pytest.fixture
+def stub_llm(indexed_doc):
+    stub, url = start_stub_ollama(first_token_delay=0.05)
+    configure(ollama_host=url, llm_pool_size=2)
+    yield stub
+    stub.shutdown()
+
+
+def test_build_prompt_labels_sources_with_pages():
+    prompt = build_prompt("What is stored?", ["The reservoir stores water."],
+                          [{"page": 2, "chunk_id": "chunk_000001"}])
+    assert "[Source 1 | p.2]" in prompt
+
+
+def test_answer_batch_keeps_order_and_clamps_concurrency(stub_llm):
+    questions = [f"Question {i} about the reservoir and drinking water" for i in range(6)]
+    rows = answer_batch(questions, pdf_id="report", concurrency=16)
+    assert [r["question"] for r in rows] == questions
+    assert all("[p." in r["answer"] for r in rows)
+    assert stub_llm.max_in_flight <= 2
@@ -0,0 +1,101 @@
+# tests/test_service.py
+import threading
+import numpy as np
+import pytest
+from src.registry import registry, configure
+from src.service import MicroBatchEncoder, start_server
+from src.stub_ollama import start_stub_ollama
+from src.client import ServiceClient, ServiceError
+from conftest import FakeEmbedModel
+
+
+@pytest.fixture
+def service(indexed_doc, tmp_path):
+    """Query service over the indexed 3-page report, answering with the stub LLM."""
+    stub, stub_url = start_stub_ollama()
+    configure(ollama_host=stub_url)
+    server, url = start_server(port=0, processed_root=str(indexed_doc.parent),
+                               outputs_dir=str(tmp_path / "outputs"))
+    yield ServiceClient(url)
+    server.shutdown()
+    stub.shutdown()
+
+
+def test_health_and_docs(service):
+    assert service.health()["status"] == "ok"
+    assert service.docs() == [{"pdf_id": "report", "n_pages": 3}]
+
+
+def test_query_restricted_to_document(service):
+    res = service.query("reservoir drinking water", top_k=1, pdf_id="report")
+    assert res["metadatas"][0][0]["page_start"] == 2
+
+
+def test_answer_returns_cited_answer_and_pdf(service):
+    answer, evidences, pdf_ref = service.answer("report", "Do hospital budgets fund patient safety?",
+                                                use_cache=False)
+    assert "[p." in answer
+    assert 3 in [ev["page"] for ev in evidences]
+    assert service.pdf_bytes(pdf_ref).startswith(b"%PDF")
+
+
+def test_answer_stream(service):
+    tokens, evidences, pdf_future = service.answer_stream("report", "What do solar panels do?", use_cache=False)
+    text = "".join(tokens)
+    assert text.startswith("This is a stub answer")
+    assert evidences[0]["page"] == 1
+    assert pdf_future.result(timeout=10).startswith("/pdfs/")
+
+
+def test_unknown_document_and_pdf_traversal(service):
+    with pytest.raises(ServiceError, match="404"):
+        service.answer("../report", "anything")
+    with pytest.raises(ServiceError, match="404"):
+        service.pdf_bytes("/pdfs/..%2Freport.pdf")
+
+
+def test_micro_batching_merges_concurrent_calls():
+    model = FakeEmbedModel()
+    encoder = MicroBatchEncoder(model, max_batch=8, max_wait_ms=500)
+    barrier = threading.Barrier(8)
+    results = [None] * 8
+
+    def call(i):
+        barrier.wait()
+        results[i] = encoder.encode([f"question number {i}"], normalize_embeddings=True)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert model.calls == 1
+    for i, r in enumerate(results):
+        np.testing.assert_allclose(r, FakeEmbedModel().encode([f"question number {i}"]))
+
+
+def test_service_merges_concurrent_queries_into_one_encode(indexed_doc, tmp_path):
+    for round_no in range(2):  # a re-registered model is wrapped again by the next server
+        model = FakeEmbedModel()
+        registry.register("embed_model", lambda: model)
+        configure(service_max_batch=8, service_batch_wait_ms=2000)
+        server, url = start_server(port=0, processed_root=str(indexed_doc.parent),
+                                   outputs_dir=str(tmp_path / "outputs"))
+        barrier = threading.Barrier(8)
+        results = [None] * 8
+
+        def call(i):
+            client = ServiceClient(url)
+            barrier.wait()
+            results[i] = client.query(f"reservoir question {i} round {round_no}", top_k=1, pdf_id="report")
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        server.shutdown()
+
+        assert model.calls == 1
+        assert all(r["metadatas"][0][0]["page_start"] == 2 for r in results)
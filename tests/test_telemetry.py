@@ -0,0 +1,62 @@
+# tests/test_telemetry.py
+import threading
+import pytest
+from src import telemetry
+from src.registry import CONFIG
+from src.telemetry import span, span_iter, recent_spans
+
+
+@pytest.fixture(autouse=True)
+def tracing(monkeypatch):
+    monkeypatch.setitem(CONFIG, "telemetry", True)
+    monkeypatch.setitem(CONFIG, "telemetry_path", "")
+    telemetry.reset()
+    yield
+    telemetry.reset()
+
+
+def _spans(name):
+    return [s for s in recent_spans() if s["name"] == name]
+
+
+def test_nested_spans_share_trace():
+    with span("outer") as outer:
+        with span("inner"):
+            pass
+    (inner,) = _spans("inner")
+    assert inner["parent_id"] == outer.span_id and inner["trace_id"] == outer.trace_id
+
+
+def test_span_iter_parents_work_done_by_the_iterable():
+    def tokens():
+        for i in range(3):
+            with span("produce"):
+                pass
+            yield i
+
+    assert list(span_iter("stream", tokens())) == [0, 1, 2]
+    (stream,) = _spans("stream")
+    assert stream["items"] == 3
+    assert all(s["parent_id"] == stream["span_id"] for s in _spans("produce"))
+
+
+def test_abandoned_span_iter_does_not_leak_into_later_spans():
+    gen = span_iter("stream", iter(range(10)))
+    next(gen)  # consumer stops here and keeps the generator alive
+    with span("later"):
+        pass
+    assert _spans("later")[0]["parent_id"] is None
+    gen.close()
+    assert _spans("stream")[0]["closed"] is True
+
+
+def test_span_iter_consumed_on_another_thread():
+    gen = span_iter("stream", iter(range(3)))
+    next(gen)
+    t = threading.Thread(target=lambda: list(gen))
+    t.start()
+    t.join()
+    with span("later"):
+        pass
+    assert _spans("later")[0]["parent_id"] is None
+    assert _spans("stream")[0]["items"] == 3
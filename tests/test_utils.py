@@ -0,0 +1,35 @@
+# tests/test_utils.py
+import src.utils
+from src.utils import LRUCache, tesseract_cmd
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_lru_pop_and_clear():
+    cache = LRUCache(4)
+    cache.put("a", 1)
+    assert cache.pop("a") == 1 and cache.pop("a") is None
+    cache.put("b", 2)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_tesseract_cmd_env_then_existing_windows_path(monkeypatch, tmp_path):
+    monkeypatch.delenv("TESSERACT_CMD", raising=False)
+    monkeypatch.setattr(src.utils, "WINDOWS_TESSERACT", str(tmp_path / "missing.exe"))
+    assert tesseract_cmd() is None  # keep pytesseract's "tesseract" on PATH
+    exe = tmp_path / "tesseract.exe"
+    exe.write_bytes(b"")
+    monkeypatch.setattr(src.utils, "WINDOWS_TESSERACT", str(exe))
+    assert tesseract_cmd() == str(exe)
+    monkeypatch.setenv("TESSERACT_CMD", "/opt/tesseract/bin/tesseract")
+    assert tesseract_cmd() == "/opt/tesseract/bin/tesseract"
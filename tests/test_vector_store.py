@@ -0,0 +1,92 @@
+# tests/test_vector_store.py
+import numpy as np
+import pytest
+from src.vector_store import VectorStore, FlatStore
+
+
+def _vectors(n, dim=8, seed=0):
+    v = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def _fill(store, vecs, start=0):
+    ids = [f"id{i}" for i in range(start, start + len(vecs))]
+    store.upsert(ids, vecs, ["doc"] * len(vecs), [{"page": i} for i in range(len(vecs))])
+    store.flush()
+
+
+@pytest.mark.parametrize("dtype, rescore", [("float32", True), ("float16", True), ("int8", False)])
+def test_quantized_search_finds_exact_match(tmp_path, dtype, rescore):
+    vecs = _vectors(50)
+    store = FlatStore(str(tmp_path), dtype=dtype, rescore=rescore)
+    _fill(store, vecs)
+    assert store.query(vecs[7], top_k=1)["ids"][0] == ["id7"]
+
+
+@pytest.mark.parametrize("dtype, rescore, files", [
+    ("float32", True, {"vectors.npy"}),
+    ("float16", True, {"vectors.float16.npy"}),
+    ("int8", True, {"vectors.int8.npy", "scales.npy", "vectors.float16.npy"}),
+    ("int8", False, {"vectors.int8.npy", "scales.npy"}),
+])
+def test_only_configured_matrices_are_kept(tmp_path, dtype, rescore, files):
+    vecs = _vectors(20)
+    _fill(FlatStore(str(tmp_path), dtype="float32"), vecs)  # reopened with other settings: converted
+    store = FlatStore(str(tmp_path), dtype=dtype, rescore=rescore)
+    assert {p.name for p in tmp_path.glob("*.npy")} == files
+    assert (store._vecs is not None) == (dtype == "float32" or rescore and dtype == "int8")
+    assert store.query(vecs[3], top_k=1)["ids"][0] == ["id3"]
+
+
+@pytest.mark.parametrize("reopen_dtype", ["float32", "float16", "int8"])
+def test_reopen_store_written_without_float32(tmp_path, reopen_dtype):
+    vecs = _vectors(51)
+    _fill(FlatStore(str(tmp_path), dtype="int8", rescore=False), vecs[:50])
+
+    store = FlatStore(str(tmp_path), dtype=reopen_dtype)
+    assert store.query(vecs[7], top_k=1)["ids"][0] == ["id7"]
+    _fill(store, vecs[50:], start=50)
+
+    store = FlatStore(str(tmp_path), dtype=reopen_dtype)
+    assert store.count() == 51
+    assert store.query(vecs[50], top_k=1)["ids"][0] == ["id50"]
+
+
+def test_flush_refuses_records_without_vectors(tmp_path):
+    _fill(FlatStore(str(tmp_path), dtype="int8", rescore=False), _vectors(5))
+    (tmp_path / "vectors.int8.npy").unlink()
+    store = FlatStore(str(tmp_path))
+    store.upsert(["new"], _vectors(1), ["doc"], [{}])
+    with pytest.raises(ValueError):
+        store.flush()
+
+
+def test_backends_must_implement_the_interface():
+    class Partial(VectorStore):
+        def count(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_filter_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.vector_store.MASK_CACHE_SIZE", 4)
+    vecs = _vectors(20)
+    store = FlatStore(str(tmp_path))
+    _fill(store, vecs)
+    store = FlatStore(str(tmp_path))
+    for lo in range(10):
+        res = store.query(vecs[lo], top_k=1, where={"page": {"$gte": lo}})
+        assert res["ids"][0] == [f"id{lo}"]
+    assert len(store._mask_cache) == 4
+
+
+def test_query_does_not_flush(tmp_path):
+    vecs = _vectors(3)
+    store = FlatStore(str(tmp_path))
+    store.upsert(["a"], vecs[:1], ["doc"], [{}])
+    assert store.query(vecs[0], top_k=1)["ids"][0] == []
+    assert not (tmp_path / "records.jsonl").exists()
+    store.flush()
+    assert store.query(vecs[0], top_k=1)["ids"][0] == ["a"]